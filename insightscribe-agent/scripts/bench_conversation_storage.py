@@ -0,0 +1,111 @@
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+
+# --- Setup Project Path ---
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+load_dotenv(dotenv_path=os.path.join(project_root, '.env'))
+
+from src.services.mongo_service import MongoService, LAYOUT_EMBEDDED, LAYOUT_BUCKETED
+from src.models.db_models import SessionMemory, ConversationTurn
+from src.config import settings
+
+# Compares append and windowed-read latency of the embedded and bucketed
+# conversation layouts against a local mongod (MONGO_URI).
+#
+#   python scripts/bench_conversation_storage.py --sizes 10 1000 10000
+
+
+def make_turn(i: int) -> dict:
+    # ~300 bytes of text, roughly a short BI question or answer
+    return ConversationTurn(role="user" if i % 2 == 0 else "agent", text=f"turn {i} " + "x" * 300).dict()
+
+
+async def prefill(mongo: MongoService, layout: str, turns: int, bucket_size: int) -> str:
+    """Creates a session that already holds `turns` turns, written in bulk."""
+    session_id = f"bench-{layout}-{uuid.uuid4().hex}"
+    session = SessionMemory(
+        session_id=session_id,
+        user_id="bench-user",
+        app_id="bench-app",
+        conversation_layout=layout,
+        bucket_size=bucket_size if layout == LAYOUT_BUCKETED else None,
+        expires_at=datetime.utcnow() + timedelta(hours=1),
+    )
+    await mongo.create_session(session)
+    history = [make_turn(i) for i in range(turns)]
+    if layout == LAYOUT_EMBEDDED:
+        await mongo.db.sessions.update_one(
+            {"session_id": session_id},
+            {"$push": {"conversation": {"$each": history}}, "$set": {"turn_count": turns}}
+        )
+    else:
+        buckets = [
+            {"session_id": session_id, "bucket_no": start // bucket_size, "turns": history[start:start + bucket_size],
+             "expires_at": session.expires_at, "created_at": datetime.utcnow()}
+            for start in range(0, turns, bucket_size)
+        ]
+        if buckets:
+            await mongo.db.session_turns.insert_many(buckets)
+        await mongo.db.sessions.update_one({"session_id": session_id}, {"$set": {"turn_count": turns}})
+    return session_id
+
+
+async def timed(samples: int, fn):
+    latencies = []
+    for i in range(samples):
+        start = time.perf_counter()
+        await fn(i)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def summarize(latencies):
+    ordered = sorted(latencies)
+    return statistics.median(ordered), ordered[int(len(ordered) * 0.95) - 1]
+
+
+async def main(sizes, samples: int, window: int, bucket_size: int):
+    mongo = MongoService()
+    await mongo.ensure_indexes()
+    print(f"{'layout':<10} {'turns':>7} {'append p50':>11} {'append p95':>11} {'window p50':>11} {'window p95':>11} {'doc KB':>8}")
+    print("-" * 75)
+    created = []
+    try:
+        for turns in sizes:
+            for layout in (LAYOUT_EMBEDDED, LAYOUT_BUCKETED):
+                session_id = await prefill(mongo, layout, turns, bucket_size)
+                created.append(session_id)
+
+                append = await timed(samples, lambda i: mongo.append_to_conversation(
+                    session_id, ConversationTurn(role="user", text=f"appended {i}")))
+                read = await timed(samples, lambda i: mongo.get_conversation_window(session_id, window))
+                doc = await mongo.db.sessions.aggregate([
+                    {"$match": {"session_id": session_id}},
+                    {"$project": {"size": {"$bsonSize": "$$ROOT"}}}
+                ]).to_list(1)
+
+                a50, a95 = summarize(append)
+                r50, r95 = summarize(read)
+                print(f"{layout:<10} {turns:>7} {a50:>9.2f}ms {a95:>9.2f}ms {r50:>9.2f}ms {r95:>9.2f}ms {doc[0]['size'] / 1024:>8.1f}")
+    finally:
+        for session_id in created:
+            await mongo.delete_session_by_id(session_id)
+        mongo.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark embedded vs bucketed conversation storage.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 10000], help="Prefilled turns per session.")
+    parser.add_argument("--samples", type=int, default=50, help="Timed appends and reads per case.")
+    parser.add_argument("--window", type=int, default=10, help="Turns fetched per windowed read.")
+    parser.add_argument("--bucket-size", type=int, default=settings.CONVERSATION_BUCKET_SIZE)
+    args = parser.parse_args()
+    asyncio.run(main(args.sizes, args.samples, args.window, args.bucket_size))
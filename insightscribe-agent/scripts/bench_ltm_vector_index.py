@@ -0,0 +1,82 @@
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+# --- Setup Project Path ---
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from src.services.ltm_index import LTMVectorIndex
+
+# Measures search latency and recall@k of the in-process LTM vector index on
+# synthetic clustered embeddings. Ground truth is an exact float64 search, so
+# recall shows what the float32 matrix loses (expected ~1.0).
+#
+#   python scripts/bench_ltm_vector_index.py --sizes 1000 100000 1000000 --dim 384
+#
+# Memory: the index needs sizes * dim * 4 bytes (1M x 384 is ~1.5 GB).
+
+
+def clustered_embeddings(rng, n: int, dim: int, clusters: int = 64) -> np.ndarray:
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=n)
+    return centers[labels] + 0.35 * rng.standard_normal((n, dim)).astype(np.float32)
+
+
+def exact_top_k(vectors: np.ndarray, query: np.ndarray, k: int, chunk: int = 100_000) -> set:
+    q = query.astype(np.float64)
+    q /= np.linalg.norm(q)
+    scores = np.empty(len(vectors), dtype=np.float64)
+    for start in range(0, len(vectors), chunk):
+        block = vectors[start:start + chunk].astype(np.float64)
+        scores[start:start + chunk] = (block / np.linalg.norm(block, axis=1, keepdims=True)) @ q
+    return set(np.argpartition(-scores, k - 1)[:k].tolist())
+
+
+def main(sizes, dim: int, queries: int, k: int, seed: int):
+    rng = np.random.default_rng(seed)
+    print(f"{'entries':>9} {'build ms':>10} {'add us':>8} {'search p50':>11} {'search p95':>11} {f'recall@{k}':>10} {'MB':>8}")
+    print("-" * 73)
+    for n in sizes:
+        vectors = clustered_embeddings(rng, n, dim)
+        index = LTMVectorIndex(dim)
+
+        start = time.perf_counter()
+        for offset in range(0, n, 5000): # Same batch size the registry loads from MongoDB with
+            index.add_many(list(range(offset, min(offset + 5000, n))), vectors[offset:offset + 5000])
+        build_ms = (time.perf_counter() - start) * 1000
+
+        extra = clustered_embeddings(rng, 200, dim)
+        start = time.perf_counter()
+        for i, vector in enumerate(extra):
+            index.add_many([n + i], vector[None, :])
+        add_us = (time.perf_counter() - start) / len(extra) * 1e6
+        all_vectors = np.vstack([vectors, extra])
+
+        latencies, recalls = [], []
+        for query in clustered_embeddings(rng, queries, dim):
+            start = time.perf_counter()
+            hits = index.search(query, k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            truth = exact_top_k(all_vectors, query, k)
+            recalls.append(len(truth & {doc_id for doc_id, _ in hits}) / k)
+
+        latencies.sort()
+        p95 = latencies[max(int(len(latencies) * 0.95) - 1, 0)]
+        print(f"{n:>9} {build_ms:>10.1f} {add_us:>8.1f} {statistics.median(latencies):>9.3f}ms {p95:>9.3f}ms "
+              f"{statistics.mean(recalls):>10.4f} {index._matrix.nbytes / 2**20:>8.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the LTM vector index.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    main(args.sizes, args.dim, args.queries, args.k, args.seed)
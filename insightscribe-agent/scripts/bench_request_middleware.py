@@ -0,0 +1,151 @@
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+import httpx
+from fastapi import FastAPI, Request
+from sse_starlette.sse import EventSourceResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+
+# --- Setup Project Path ---
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from src.logging_config import LOG_FORMAT, configure_logging, stop_logging
+from src.request_context import RequestContextFilter, RequestContextMiddleware, request_session_id, request_user_id
+
+# Compares requests/second of the previous BaseHTTPMiddleware + synchronous
+# StreamHandler setup against the pure ASGI middleware + QueueHandler pipeline.
+# The log sink sleeps --log-io-ms per write to stand in for a slow or blocked stderr
+# (a full pipe, a container log driver under pressure).
+#
+#   python scripts/bench_request_middleware.py --requests 2000 --concurrency 50 --log-io-ms 0.2
+
+bench_logger = logging.getLogger("bench")
+
+
+class LegacyRequestContextMiddleware(BaseHTTPMiddleware):
+    """
+    The middleware as it was before, minus the logging.setLoggerClass() swap: a LoggerAdapter
+    is not a Logger subclass, so that call raised TypeError on every request.
+    """
+
+    async def dispatch(self, request: Request, call_next):
+        request_user_id.set(None)
+        request_session_id.set(None)
+
+        class ContextAdapter(logging.LoggerAdapter):
+            def process(self, msg, kwargs):
+                extra = kwargs.get('extra', {})
+                extra['user_id'] = request_user_id.get() or 'N/A'
+                extra['session_id'] = request_session_id.get() or 'N/A'
+                kwargs['extra'] = extra
+                return msg, kwargs
+
+        return await call_next(request)
+
+
+class SlowSink:
+    def __init__(self, delay_ms: float):
+        self.delay = delay_ms / 1000
+        self.writes = 0
+
+    def write(self, data: str) -> int:
+        if self.delay:
+            time.sleep(self.delay)
+        self.writes += 1
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+
+def build_app(middleware, stream_events: int) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(middleware)
+
+    @app.get("/ping")
+    async def ping(user: str = "u-1"):
+        request_user_id.set(user)
+        bench_logger.info("ping")
+        return {"status": "ok"}
+
+    @app.get("/stream")
+    async def stream(user: str = "u-1", session: str = "s-1"):
+        request_user_id.set(user)
+        request_session_id.set(session)
+
+        async def events():
+            for i in range(stream_events):
+                bench_logger.info(f"chunk {i}")
+                yield {"data": f"chunk {i}"}
+        return EventSourceResponse(events())
+
+    return app
+
+
+async def drive(app: FastAPI, path: str, requests: int, concurrency: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    semaphore = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one(i: int):
+            async with semaphore:
+                response = await client.get(path, params={"user": f"u-{i % 50}"})
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        return requests / (time.perf_counter() - start)
+
+
+def use_legacy_logging(sink: SlowSink) -> None:
+    handler = logging.StreamHandler(sink)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    handler.addFilter(RequestContextFilter()) # Without it the format string raises on every record
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+
+
+async def main(requests: int, concurrency: int, log_io_ms: float, stream_events: int):
+    print(f"{'setup':<28} {'endpoint':<9} {'req/s':>10}")
+    print("-" * 49)
+    results = {}
+    for label, middleware in (("BaseHTTPMiddleware + sync", LegacyRequestContextMiddleware),
+                              ("pure ASGI + QueueHandler", RequestContextMiddleware)):
+        sink = SlowSink(log_io_ms)
+        listener = None
+        if middleware is LegacyRequestContextMiddleware:
+            use_legacy_logging(sink)
+        else:
+            listener = configure_logging(handlers=[logging.StreamHandler(sink)])
+        app = build_app(middleware, stream_events)
+        try:
+            for path in ("/ping", "/stream"):
+                await drive(app, path, min(requests, 100), concurrency) # Warm-up
+                rps = await drive(app, path, requests, concurrency)
+                results[(label, path)] = rps
+                print(f"{label:<28} {path:<9} {rps:>10.1f}")
+        finally:
+            if listener is not None:
+                stop_logging(listener)
+    print("-" * 49)
+    for path in ("/ping", "/stream"):
+        before = results[("BaseHTTPMiddleware + sync", path)]
+        after = results[("pure ASGI + QueueHandler", path)]
+        print(f"{path}: {after / before:.2f}x requests/second")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the request-context middleware and log pipeline.")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--log-io-ms", type=float, default=0.2, help="Simulated latency of each log write.")
+    parser.add_argument("--stream-events", type=int, default=10, help="SSE events (and log lines) per /stream request.")
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency, args.log_io_ms, args.stream_events))
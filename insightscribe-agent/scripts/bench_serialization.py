@@ -0,0 +1,94 @@
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from sse_starlette.event import ServerSentEvent
+
+# --- Setup Project Path ---
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from src.models.db_models import ConversationTurn, LongTermMemoryEntry
+from src.models.records import LTMRecord, TurnRecord
+from src.services import sse_encoding
+
+# Per-turn parse and encode cost of the hot paths, before and after the raw read mode
+# and pre-encoded SSE frames. A turn reads --ltm LTM candidates (with --dim embeddings),
+# the last --turns conversation turns, and streams --chunks message chunks plus the
+# usual status, timing and done events. No MongoDB is needed: documents are built as
+# the driver returns them.
+#
+#   python scripts/bench_serialization.py --ltm 20 --dim 1536 --turns 10 --chunks 40
+
+
+def ltm_docs(n: int, dim: int) -> list:
+    now = datetime.utcnow()
+    return [{
+        "_id": ObjectId(), "user_id": "user-bench", "app_id": "app-bench", "type": "summary",
+        "content": {"text": f"User asked about revenue by region, insight {i}.", "session_id": "sess-bench"},
+        "embedding": [((i * 31 + j) % 997) / 997.0 for j in range(dim)],
+        "created_at": now - timedelta(days=i),
+    } for i in range(n)]
+
+
+def turn_docs(n: int) -> list:
+    now = datetime.utcnow()
+    return [{"role": "user" if i % 2 == 0 else "assistant", "text": "Show me revenue by region for Q2. " * 4,
+             "timestamp": now - timedelta(minutes=n - i)} for i in range(n)]
+
+
+def turn_events(chunks: int) -> list:
+    events = [{"event": "status", "data": "Retrieving context..."}, {"event": "status", "data": "Thinking..."},
+              {"event": "tool_call", "data": {"tool_name": "ExecuteBIQueryTool", "params": {"query": "revenue by region"}}}]
+    events += [{"event": "message_chunk", "data": f"Revenue in region {i} grew by {i}% — "} for i in range(chunks)]
+    events += [{"event": "timing", "data": {"stages_ms": {"ltm_retrieval": 1.2, "run_streaming": 812.4}, "total_ms": 830.1,
+                                             "run_mode": "stream", "round_trips": 3, "ttft_ms": 412.0}},
+               {"event": "done", "data": "Stream finished."}]
+    return events
+
+
+def per_turn_us(fn, repeat: int) -> float:
+    fn() # Warm up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main(ltm: int, dim: int, turns: int, chunks: int, repeat: int):
+    ltm_batch, turn_batch, events = ltm_docs(ltm, dim), turn_docs(turns), turn_events(chunks)
+    # The driver hands out fresh dicts on every read, and pydantic copies fields, so reuse is fair to both.
+    rows = [
+        (f"parse {ltm} LTM entries", lambda: [LongTermMemoryEntry(**doc) for doc in ltm_batch],
+         lambda: [LTMRecord.from_doc(doc) for doc in ltm_batch]),
+        (f"parse {turns} turns", lambda: [ConversationTurn(**doc) for doc in turn_batch],
+         lambda: [TurnRecord.from_doc(doc) for doc in turn_batch]),
+        (f"encode {len(events)} SSE events", lambda: [ServerSentEvent(json.dumps(e)).encode() for e in events],
+         lambda: [sse_encoding.encode_event(e) for e in events]),
+    ]
+    encoder = "orjson" if sse_encoding.orjson is not None else "stdlib json"
+    print(f"{'per turn':<28} {'before us':>10} {'after us':>10} {'speedup':>8}   (SSE encoder: {encoder})")
+    print("-" * 60)
+    total_before = total_after = 0.0
+    for label, before, after in rows:
+        before_us, after_us = per_turn_us(before, repeat), per_turn_us(after, repeat)
+        total_before += before_us
+        total_after += after_us
+        print(f"{label:<28} {before_us:>10.1f} {after_us:>10.1f} {before_us / after_us:>7.1f}x")
+    print("-" * 60)
+    print(f"{'total':<28} {total_before:>10.1f} {total_after:>10.1f} {total_before / total_after:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark per-turn parse and SSE encode cost.")
+    parser.add_argument("--ltm", type=int, default=20, help="LTM candidates read per turn")
+    parser.add_argument("--dim", type=int, default=1536, help="Embedding dimensions (0 for entries without embeddings)")
+    parser.add_argument("--turns", type=int, default=10, help="Conversation turns read per turn")
+    parser.add_argument("--chunks", type=int, default=40, help="Message chunks streamed per turn")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    main(args.ltm, args.dim, args.turns, args.chunks, args.repeat)
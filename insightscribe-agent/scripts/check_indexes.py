@@ -0,0 +1,54 @@
+import argparse
+import asyncio
+import os
+import sys
+from dotenv import load_dotenv
+
+# --- Setup Project Path ---
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+load_dotenv(dotenv_path=os.path.join(project_root, '.env'))
+
+from src.services.mongo_service import MongoService
+from src.services import mongo_indexes
+
+# Verifies that every hot query shape in MongoService is served by an index.
+# Run against a local mongod (MONGO_URI); exits non-zero if any shape's winning
+# plan contains a COLLSCAN.
+#
+#   python scripts/check_indexes.py            # create indexes, then check
+#   python scripts/check_indexes.py --no-create  # check the database as it is
+
+
+class TColors:
+    OKGREEN = '\033[92m'
+    FAIL = '\033[91m'
+    ENDC = '\033[0m'
+
+
+async def main(create: bool) -> int:
+    mongo = MongoService()
+    try:
+        if create:
+            print("Ensuring registered indexes...")
+            await mongo.ensure_indexes()
+        collscans = await mongo_indexes.find_collscans(mongo.db)
+    finally:
+        mongo.close()
+
+    failing = {entry["query"] for entry in collscans}
+    for shape in mongo_indexes.QUERY_SHAPES:
+        if shape.name in failing:
+            print(f"  {TColors.FAIL}[COLLSCAN]{TColors.ENDC} {shape.collection}: {shape.name}")
+        else:
+            print(f"  {TColors.OKGREEN}[INDEXED]{TColors.ENDC}  {shape.collection}: {shape.name}")
+    print("-" * 50)
+    print(f"{len(mongo_indexes.QUERY_SHAPES) - len(failing)} indexed, {len(failing)} collection scan(s).")
+    return 1 if failing else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report query shapes that MongoDB answers with a collection scan.")
+    parser.add_argument("--no-create", action="store_true", help="Do not create missing indexes before checking.")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(create=not args.no_create)))
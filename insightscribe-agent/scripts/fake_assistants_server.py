@@ -0,0 +1,329 @@
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+import zlib
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from sse_starlette.sse import EventSourceResponse
+
+# Deterministic local stand-in for the subset of the OpenAI Assistants API (v2) the
+# agent uses: threads, messages, runs with tool-call rounds, polling and streaming,
+# cancellation and embeddings, plus configurable latency and error injection. Point
+# the service at it with OPENAI_BASE_URL:
+#
+#   python scripts/fake_assistants_server.py --port 8100 --run-ms 300 --token-interval-ms 15
+#   OPENAI_BASE_URL=http://127.0.0.1:8100/v1 OPENAI_API_KEY=sk-fake uvicorn src.main:app
+#
+# Timing model, identical for polled and streamed runs: each tool round takes
+# --run-ms before the run reports requires_action; the final answer starts after
+# --first-token-ms and then produces one word every --token-interval-ms. A polled
+# run only reports "completed" once the whole answer has been generated.
+
+EMBEDDING_DIM = 256
+
+FILLER = ("denials", "rose", "in", "Q3", "driven", "by", "missing", "prior", "authorization", "and",
+          "coding", "errors", "across", "outpatient", "claims", "with", "cardiology", "leading")
+
+
+class LatencyProfile(BaseModel):
+    request_ms: float = 5 # Added to every API call
+    run_ms: float = 300 # Model time before each tool-call round
+    first_token_ms: float = 150
+    token_interval_ms: float = 15
+    answer_words: int = 40
+    tool_rounds: int = 1 # requires_action rounds per run
+    tool_name: str = "ExecuteBIQueryTool"
+    run_failure_rate: float = 0.0 # Fraction of runs that end "failed"
+    http_error_rate: float = 0.0 # Fraction of API calls answered with http_error_status
+    http_error_status: int = 500
+    seed: int = 7
+
+
+class FakeRun:
+    def __init__(self, run_id: str, thread_id: str, assistant_id: str, fail: bool):
+        self.id = run_id
+        self.thread_id = thread_id
+        self.assistant_id = assistant_id
+        self.created_at = int(time.time())
+        self.status = "queued"
+        self.fail = fail
+        self.rounds_done = 0
+        self.phase_started = time.monotonic()
+        self.pending_calls: List[Dict[str, Any]] = []
+        self.usage: Optional[Dict[str, int]] = None
+        self.last_error: Optional[Dict[str, str]] = None
+        self.truncation_strategy: Optional[Dict[str, Any]] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        required_action = None
+        if self.status == "requires_action":
+            required_action = {"type": "submit_tool_outputs", "submit_tool_outputs": {"tool_calls": self.pending_calls}}
+        return {
+            "id": self.id, "object": "thread.run", "created_at": self.created_at,
+            "assistant_id": self.assistant_id, "thread_id": self.thread_id, "status": self.status,
+            "required_action": required_action, "last_error": self.last_error, "usage": self.usage,
+            "model": "fake-assistant", "instructions": "", "tools": [], "metadata": {},
+            "started_at": self.created_at, "expires_at": None, "cancelled_at": None, "failed_at": None,
+            "completed_at": None, "incomplete_details": None, "max_completion_tokens": None,
+            "max_prompt_tokens": None, "truncation_strategy": self.truncation_strategy, "response_format": "auto",
+            "tool_choice": "auto", "parallel_tool_calls": True, "temperature": 1.0, "top_p": 1.0,
+        }
+
+
+class FakeAssistantsBackend:
+    def __init__(self, profile: LatencyProfile):
+        self.profile = profile
+        self.threads: Dict[str, List[Dict[str, Any]]] = {}
+        self.runs: Dict[str, FakeRun] = {}
+        self._ids = itertools.count(1)
+        self._requests = itertools.count(1)
+
+    def _next_id(self, prefix: str) -> str:
+        return f"{prefix}_{next(self._ids):08d}"
+
+    def _chance(self, kind: str, number: int, rate: float) -> bool:
+        # Seeded per request/run number, so the same sequence of calls gets the same faults.
+        return rate > 0 and random.Random(f"{self.profile.seed}:{kind}:{number}").random() < rate
+
+    def should_fail_request(self) -> bool:
+        return self._chance("request", next(self._requests), self.profile.http_error_rate)
+
+    def thread(self, thread_id: str) -> List[Dict[str, Any]]:
+        if thread_id not in self.threads:
+            raise HTTPException(status_code=404, detail=f"No thread found with id '{thread_id}'.")
+        return self.threads[thread_id]
+
+    def run(self, thread_id: str, run_id: str) -> FakeRun:
+        run = self.runs.get(run_id)
+        if run is None or run.thread_id != thread_id:
+            raise HTTPException(status_code=404, detail=f"No run found with id '{run_id}'.")
+        return run
+
+    def message(self, thread_id: str, role: str, text: str, run_id: Optional[str] = None, assistant_id: Optional[str] = None) -> Dict[str, Any]:
+        return {
+            "id": self._next_id("msg"), "object": "thread.message", "created_at": int(time.time()),
+            "thread_id": thread_id, "role": role, "run_id": run_id, "assistant_id": assistant_id,
+            "status": "completed", "attachments": [], "metadata": {},
+            "content": [{"type": "text", "text": {"value": text, "annotations": []}}],
+        }
+
+    def last_user_text(self, thread_id: str) -> str:
+        for message in reversed(self.threads.get(thread_id, [])):
+            if message["role"] == "user":
+                return message["content"][0]["text"]["value"]
+        return ""
+
+    def answer_words(self, thread_id: str) -> List[str]:
+        words = f'Here is what I found for "{self.last_user_text(thread_id)}":'.split()
+        filler = itertools.cycle(FILLER)
+        while len(words) < self.profile.answer_words:
+            words.append(next(filler))
+        return words
+
+    def generation_seconds(self) -> float:
+        return (self.profile.first_token_ms + self.profile.token_interval_ms * self.profile.answer_words) / 1000
+
+    def open_tool_round(self, run: FakeRun) -> None:
+        arguments = json.dumps({"query": self.last_user_text(run.thread_id)})
+        run.pending_calls = [{"id": self._next_id("call"), "type": "function",
+                              "function": {"name": self.profile.tool_name, "arguments": arguments}}]
+        run.status = "requires_action"
+
+    def complete(self, run: FakeRun, text: str) -> Dict[str, Any]:
+        message = self.message(run.thread_id, "assistant", text, run_id=run.id, assistant_id=run.assistant_id)
+        self.threads[run.thread_id].append(message)
+        prompt_tokens = sum(len(m["content"][0]["text"]["value"].split()) for m in self.threads[run.thread_id])
+        run.usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(text.split()),
+                     "total_tokens": prompt_tokens + len(text.split())}
+        run.status = "completed"
+        return message
+
+    def fail(self, run: FakeRun) -> None:
+        run.status = "failed"
+        run.last_error = {"code": "server_error", "message": "Injected run failure."}
+
+    def advance(self, run: FakeRun) -> None:
+        """Moves a polled run forward according to how long its current phase has been running."""
+        if run.status not in ("queued", "in_progress"):
+            return
+        elapsed = time.monotonic() - run.phase_started
+        if run.rounds_done < self.profile.tool_rounds:
+            if elapsed < self.profile.run_ms / 1000:
+                run.status = "in_progress"
+            elif run.fail:
+                self.fail(run)
+            else:
+                self.open_tool_round(run)
+        elif elapsed < self.generation_seconds():
+            run.status = "in_progress"
+        elif run.fail:
+            self.fail(run)
+        else:
+            self.complete(run, " ".join(self.answer_words(run.thread_id)))
+
+    async def stream_run(self, run: FakeRun, created: bool):
+        """Assistants-style event stream for one segment of a run: up to requires_action or the end."""
+        if created:
+            yield {"event": "thread.run.created", "data": json.dumps(run.to_dict())}
+            yield {"event": "thread.run.queued", "data": json.dumps(run.to_dict())}
+        run.status = "in_progress"
+        yield {"event": "thread.run.in_progress", "data": json.dumps(run.to_dict())}
+
+        if run.rounds_done < self.profile.tool_rounds:
+            await asyncio.sleep(self.profile.run_ms / 1000)
+            if run.status == "cancelled":
+                yield {"event": "thread.run.cancelled", "data": json.dumps(run.to_dict())}
+            elif run.fail:
+                self.fail(run)
+                yield {"event": "thread.run.failed", "data": json.dumps(run.to_dict())}
+            else:
+                self.open_tool_round(run)
+                yield {"event": "thread.run.requires_action", "data": json.dumps(run.to_dict())}
+            yield {"event": "done", "data": "[DONE]"}
+            return
+
+        await asyncio.sleep(self.profile.first_token_ms / 1000)
+        if run.fail:
+            self.fail(run)
+            yield {"event": "thread.run.failed", "data": json.dumps(run.to_dict())}
+            yield {"event": "done", "data": "[DONE]"}
+            return
+        message_id = self._next_id("msg")
+        words = self.answer_words(run.thread_id)
+        for index, word in enumerate(words):
+            if run.status == "cancelled":
+                yield {"event": "thread.run.cancelled", "data": json.dumps(run.to_dict())}
+                yield {"event": "done", "data": "[DONE]"}
+                return
+            if index:
+                await asyncio.sleep(self.profile.token_interval_ms / 1000)
+            delta = {"id": message_id, "object": "thread.message.delta",
+                     "delta": {"content": [{"index": 0, "type": "text", "text": {"value": word if index == 0 else f" {word}", "annotations": []}}]}}
+            yield {"event": "thread.message.delta", "data": json.dumps(delta)}
+        message = self.complete(run, " ".join(words))
+        yield {"event": "thread.message.completed", "data": json.dumps(message)}
+        yield {"event": "thread.run.completed", "data": json.dumps(run.to_dict())}
+        yield {"event": "done", "data": "[DONE]"}
+
+
+def fake_embedding(text: str, dim: int = EMBEDDING_DIM) -> List[float]:
+    """Hashed bag of words, L2-normalized: texts sharing most words get a high cosine similarity."""
+    vector = [0.0] * dim
+    for word in text.lower().split():
+        vector[zlib.crc32(word.strip("?.!,").encode("utf-8")) % dim] += 1.0
+    norm = sum(v * v for v in vector) ** 0.5 or 1.0
+    return [v / norm for v in vector]
+
+
+def build_app(profile: LatencyProfile) -> FastAPI:
+    app = FastAPI(title="Fake Assistants API")
+    backend = FakeAssistantsBackend(profile)
+    app.state.backend = backend
+
+    @app.middleware("http")
+    async def latency_and_faults(request: Request, call_next):
+        if profile.request_ms:
+            await asyncio.sleep(profile.request_ms / 1000)
+        if backend.should_fail_request():
+            return JSONResponse(status_code=profile.http_error_status,
+                                content={"error": {"message": "Injected API error.", "type": "server_error", "code": None}})
+        return await call_next(request)
+
+    @app.post("/v1/threads")
+    async def create_thread():
+        thread_id = backend._next_id("thread")
+        backend.threads[thread_id] = []
+        return {"id": thread_id, "object": "thread", "created_at": int(time.time()), "metadata": {}, "tool_resources": None}
+
+    @app.post("/v1/threads/{thread_id}/messages")
+    async def create_message(thread_id: str, request: Request):
+        body = await request.json()
+        content = body.get("content", "")
+        if isinstance(content, list): # Content parts
+            content = "".join(part.get("text", "") for part in content if part.get("type") == "text")
+        message = backend.message(thread_id, body.get("role", "user"), content)
+        backend.thread(thread_id).append(message)
+        return message
+
+    @app.get("/v1/threads/{thread_id}/messages")
+    async def list_messages(thread_id: str, order: str = "desc", limit: int = 20, run_id: Optional[str] = None):
+        messages = [m for m in backend.thread(thread_id) if run_id is None or m["run_id"] == run_id]
+        if order == "desc":
+            messages = list(reversed(messages))
+        messages = messages[:limit]
+        return {"object": "list", "data": messages, "has_more": False,
+                "first_id": messages[0]["id"] if messages else None, "last_id": messages[-1]["id"] if messages else None}
+
+    @app.post("/v1/threads/{thread_id}/runs")
+    async def create_run(thread_id: str, request: Request):
+        body = await request.json()
+        backend.thread(thread_id)
+        number = next(backend._ids)
+        run = FakeRun(f"run_{number:08d}", thread_id, body.get("assistant_id", ""),
+                      fail=backend._chance("run", number, profile.run_failure_rate))
+        run.truncation_strategy = body.get("truncation_strategy")
+        backend.runs[run.id] = run
+        if body.get("stream"):
+            return EventSourceResponse(backend.stream_run(run, created=True))
+        return run.to_dict()
+
+    @app.get("/v1/threads/{thread_id}/runs/{run_id}")
+    async def retrieve_run(thread_id: str, run_id: str):
+        run = backend.run(thread_id, run_id)
+        backend.advance(run)
+        return run.to_dict()
+
+    @app.post("/v1/threads/{thread_id}/runs/{run_id}/submit_tool_outputs")
+    async def submit_tool_outputs(thread_id: str, run_id: str, request: Request):
+        body = await request.json()
+        run = backend.run(thread_id, run_id)
+        if run.status != "requires_action":
+            raise HTTPException(status_code=400, detail=f"Run is not awaiting tool outputs (status: {run.status}).")
+        expected = {call["id"] for call in run.pending_calls}
+        submitted = {output.get("tool_call_id") for output in body.get("tool_outputs", [])}
+        if submitted != expected:
+            raise HTTPException(status_code=400, detail=f"Expected outputs for {sorted(expected)}, got {sorted(submitted)}.")
+        run.rounds_done += 1
+        run.pending_calls = []
+        run.status = "queued"
+        run.phase_started = time.monotonic()
+        if body.get("stream"):
+            return EventSourceResponse(backend.stream_run(run, created=False))
+        return run.to_dict()
+
+    @app.post("/v1/embeddings")
+    async def create_embeddings(request: Request):
+        body = await request.json()
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        tokens = sum(len(text.split()) for text in texts)
+        return {"object": "list", "model": body.get("model", "fake-embedding"),
+                "data": [{"object": "embedding", "index": i, "embedding": fake_embedding(text)} for i, text in enumerate(texts)],
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+    @app.post("/v1/threads/{thread_id}/runs/{run_id}/cancel")
+    async def cancel_run(thread_id: str, run_id: str):
+        run = backend.run(thread_id, run_id)
+        if run.status not in ("completed", "failed", "cancelled", "expired"):
+            run.status = "cancelled"
+        return run.to_dict()
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run a local stand-in for the OpenAI Assistants API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    for name, field in LatencyProfile.__fields__.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=field.type_, default=field.default)
+    args = parser.parse_args()
+    profile = LatencyProfile(**{name: getattr(args, name) for name in LatencyProfile.__fields__})
+    uvicorn.run(build_app(profile), host=args.host, port=args.port, log_level="warning")
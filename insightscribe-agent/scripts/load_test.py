@@ -0,0 +1,364 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import socket
+import sys
+import time
+from datetime import datetime
+
+import httpx
+import pymongo
+import pymongo.errors
+from dotenv import load_dotenv
+
+from fake_assistants_server import LatencyProfile, build_app as build_fake_assistants_app
+
+# --- Setup Project Path ---
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+load_dotenv(dotenv_path=os.path.join(project_root, '.env'))
+
+# Reproducible load test: starts the FastAPI app in-process with uvicorn against a
+# local mongod (a throwaway database, dropped afterwards) and the fake Assistants
+# server from fake_assistants_server.py (also in-process), drives N concurrent
+# conversations of /agent/init followed by /agent/chat/stream turns, and writes a
+# JSON report. Pass an earlier report as --baseline to fail on regressions.
+#
+#   python scripts/load_test.py --conversations 200 --concurrency 50 --output run.json
+#   python scripts/load_test.py --conversations 200 --concurrency 50 --baseline run.json
+#
+# Latencies are in milliseconds. Memory is the RSS of this process, which hosts both
+# the server and the load generator; memory per stream is the RSS growth at peak
+# over the peak number of concurrently open streams.
+
+LOAD_TEST_APP_ID = "load-test-app"
+
+# (report path, True if lower is better)
+COMPARED_METRICS = [
+    ("init_ms.p50", True), ("init_ms.p95", True), ("init_ms.p99", True),
+    ("stream_ms.p50", True), ("stream_ms.p95", True), ("stream_ms.p99", True),
+    ("ttfc_ms.p50", True), ("ttfc_ms.p95", True), ("ttfc_ms.p99", True),
+    ("throughput_turns_per_s", False),
+    ("memory_per_stream_kb", True),
+]
+
+
+class TColors:
+    OKGREEN = '\033[92m'
+    FAIL = '\033[91m'
+    WARNING = '\033[93m'
+    ENDC = '\033[0m'
+
+
+def llm_profile(args) -> LatencyProfile:
+    return LatencyProfile(request_ms=args.llm_request_ms, run_ms=args.llm_run_ms, first_token_ms=args.llm_first_token_ms,
+                          token_interval_ms=args.llm_token_interval_ms, answer_words=args.llm_answer_words,
+                          tool_rounds=args.llm_tool_rounds)
+
+
+def configure_environment(args, llm_port: int) -> None:
+    """Settings are read at import time, so this must run before anything under src/ is imported."""
+    os.environ["MONGO_URI"] = args.mongo_uri
+    os.environ["MONGO_DB_NAME"] = args.db_name
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{llm_port}/v1"
+    os.environ["OPENAI_API_KEY"] = "sk-load-test"
+    os.environ["RUN_POLL_INITIAL_INTERVAL_SECONDS"] = str(args.run_poll_interval)
+
+
+def seed_app_config(mongo_uri: str, db_name: str, run_mode: str) -> None:
+    client = pymongo.MongoClient(mongo_uri, serverSelectionTimeoutMS=3000)
+    try:
+        now = datetime.utcnow()
+        client[db_name].app_repo.update_one(
+            {"app_id": LOAD_TEST_APP_ID},
+            {"$set": {
+                "app_id": LOAD_TEST_APP_ID,
+                "name": "Load Test Agent",
+                "description": "AppRepo entry used by scripts/load_test.py.",
+                "assistant_id": "asst_load_test",
+                "allowed_tools": ["ExecuteBIQueryTool", "GetCubeMetadataTool"],
+                "config": {"run_mode": run_mode},
+                "updated_at": now
+            }, "$setOnInsert": {"created_at": now}},
+            upsert=True
+        )
+    finally:
+        client.close()
+
+
+def drop_database(mongo_uri: str, db_name: str) -> None:
+    client = pymongo.MongoClient(mongo_uri, serverSelectionTimeoutMS=3000)
+    try:
+        client.drop_database(db_name)
+    finally:
+        client.close()
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource # Peak rather than current RSS, but still comparable between runs
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def percentile(values, pct: float) -> float:
+    """Nearest-rank percentile."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)) - 1, 0)
+    return ordered[rank]
+
+
+def summarize(values) -> dict:
+    return {
+        "count": len(values),
+        "p50": round(percentile(values, 50), 2),
+        "p95": round(percentile(values, 95), 2),
+        "p99": round(percentile(values, 99), 2),
+        "max": round(max(values), 2) if values else 0.0,
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def start_server(app, port: int):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result() # Surfaces startup errors
+            raise RuntimeError("Server exited during startup.")
+        await asyncio.sleep(0.05)
+    return server, task
+
+
+class LoadStats:
+    def __init__(self):
+        self.init_ms = []
+        self.stream_ms = []
+        self.ttfc_ms = []
+        self.errors = 0
+        self.turns = 0
+        self.open_streams = 0
+        self.peak_open_streams = 0
+        self.peak_rss_mb = 0.0
+
+
+async def run_conversation(client: httpx.AsyncClient, index: int, turns: int, stats: LoadStats) -> None:
+    user_id = f"load-user-{index}"
+    start = time.perf_counter()
+    response = await client.post("/agent/init", json={"user_id": user_id, "app_id": LOAD_TEST_APP_ID, "enable_long_term_write": False})
+    if response.status_code != 200:
+        stats.errors += 1
+        return
+    stats.init_ms.append((time.perf_counter() - start) * 1000)
+    session_id = response.json()["session_id"]
+
+    for turn in range(turns):
+        start = time.perf_counter()
+        first_chunk_at = None
+        failed = False
+        stats.open_streams += 1
+        stats.peak_open_streams = max(stats.peak_open_streams, stats.open_streams)
+        try:
+            payload = {"session_id": session_id, "user_id": user_id, "message": f"Show me the top 5 denial reasons ({turn})"}
+            async with client.stream("POST", "/agent/chat/stream", json=payload) as stream:
+                if stream.status_code != 200:
+                    failed = True
+                else:
+                    async for line in stream.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        event = json.loads(line[5:])
+                        if event["event"] == "message_chunk" and first_chunk_at is None:
+                            first_chunk_at = time.perf_counter()
+                        elif event["event"] == "error":
+                            failed = True
+                        elif event["event"] == "done":
+                            break
+        except httpx.HTTPError:
+            failed = True
+        finally:
+            stats.open_streams -= 1
+        if failed:
+            stats.errors += 1
+            continue
+        stats.turns += 1
+        stats.stream_ms.append((time.perf_counter() - start) * 1000)
+        if first_chunk_at is not None:
+            stats.ttfc_ms.append((first_chunk_at - start) * 1000)
+
+
+async def sample_memory(stats: LoadStats, interval: float = 0.05) -> None:
+    while True:
+        stats.peak_rss_mb = max(stats.peak_rss_mb, rss_mb())
+        await asyncio.sleep(interval)
+
+
+async def run_load(args) -> dict:
+    from src.main import app
+
+    llm_server, llm_server_task = await start_server(build_fake_assistants_app(llm_profile(args)), args.llm_port)
+    server, server_task = await start_server(app, args.port or free_port())
+    base_url = f"http://127.0.0.1:{server.config.port}"
+    stats = LoadStats()
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=httpx.Timeout(120.0)) as client:
+            # Warm-up: connection pools, indexes and caches, excluded from the results.
+            await run_conversation(client, -1, 1, LoadStats())
+
+            baseline_rss = rss_mb()
+            stats.peak_rss_mb = baseline_rss
+            sampler = asyncio.create_task(sample_memory(stats))
+            semaphore = asyncio.Semaphore(args.concurrency)
+
+            async def bounded(index: int):
+                async with semaphore:
+                    await run_conversation(client, index, args.turns, stats)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(bounded(i) for i in range(args.conversations)))
+            duration = time.perf_counter() - start
+            sampler.cancel()
+    finally:
+        server.should_exit = True
+        await server_task
+        llm_server.should_exit = True
+        await llm_server_task
+
+    return {
+        "generated_at": datetime.utcnow().isoformat() + "Z",
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "config": {
+            "conversations": args.conversations,
+            "concurrency": args.concurrency,
+            "turns": args.turns,
+            "llm": llm_profile(args).dict(),
+            "run_mode": args.run_mode,
+            "run_poll_interval": args.run_poll_interval,
+        },
+        "results": {
+            "init_ms": summarize(stats.init_ms),
+            "stream_ms": summarize(stats.stream_ms),
+            "ttfc_ms": summarize(stats.ttfc_ms),
+            "turns": stats.turns,
+            "errors": stats.errors,
+            "duration_s": round(duration, 2),
+            "throughput_turns_per_s": round(stats.turns / duration, 2) if duration else 0.0,
+            "rss_baseline_mb": round(baseline_rss, 1),
+            "rss_peak_mb": round(stats.peak_rss_mb, 1),
+            "peak_open_streams": stats.peak_open_streams,
+            "memory_per_stream_kb": round((stats.peak_rss_mb - baseline_rss) * 1024 / max(stats.peak_open_streams, 1), 1),
+        },
+    }
+
+
+def lookup(results: dict, path: str) -> float:
+    value = results
+    for part in path.split("."):
+        value = value[part]
+    return value
+
+
+def compare_with_baseline(report: dict, baseline: dict, tolerance: float) -> int:
+    """Prints per-metric deltas against the baseline and returns the number of regressions."""
+    if report["config"] != baseline.get("config"):
+        print(f"{TColors.WARNING}Baseline was recorded with a different load config; deltas are not like-for-like.{TColors.ENDC}")
+    regressions = 0
+    print(f"\n{'metric':<26} {'baseline':>10} {'current':>10} {'delta':>8}")
+    print("-" * 57)
+    for path, lower_is_better in COMPARED_METRICS:
+        old, new = lookup(baseline["results"], path), lookup(report["results"], path)
+        delta = (new - old) / old if old else 0.0
+        regressed = delta > tolerance if lower_is_better else delta < -tolerance
+        regressions += regressed
+        marker = f"{TColors.FAIL}REGRESSED{TColors.ENDC}" if regressed else ""
+        print(f"{path:<26} {old:>10} {new:>10} {delta:>+7.1%} {marker}")
+    return regressions
+
+
+def print_report(report: dict) -> None:
+    results = report["results"]
+    print(f"\n{'':<10} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+    print("-" * 50)
+    for name in ("init_ms", "stream_ms", "ttfc_ms"):
+        row = results[name]
+        print(f"{name:<10} {row['p50']:>9} {row['p95']:>9} {row['p99']:>9} {row['max']:>9}")
+    print("-" * 50)
+    print(f"turns: {results['turns']}  errors: {results['errors']}  duration: {results['duration_s']} s  "
+          f"throughput: {results['throughput_turns_per_s']} turns/s")
+    print(f"RSS: {results['rss_baseline_mb']} -> {results['rss_peak_mb']} MB  "
+          f"peak open streams: {results['peak_open_streams']}  per stream: {results['memory_per_stream_kb']} KB")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Load-test the agent service in-process against a local mongod.")
+    parser.add_argument("--conversations", type=int, default=100, help="Conversations to run in total.")
+    parser.add_argument("--concurrency", type=int, default=25, help="Conversations in flight at once.")
+    parser.add_argument("--turns", type=int, default=2, help="Chat turns per conversation.")
+    parser.add_argument("--mongo-uri", default=os.getenv("MONGO_URI", "mongodb://localhost:27017/"))
+    parser.add_argument("--db-name", default="insightscribe_loadtest", help="Throwaway database, dropped afterwards.")
+    parser.add_argument("--keep-db", action="store_true", help="Do not drop the database after the run.")
+    parser.add_argument("--port", type=int, default=0, help="Server port (default: a free port).")
+    parser.add_argument("--llm-request-ms", type=float, default=5, help="Fake Assistants API latency per call.")
+    parser.add_argument("--llm-run-ms", type=float, default=200, help="Fake model time before each tool-call round.")
+    parser.add_argument("--llm-first-token-ms", type=float, default=100)
+    parser.add_argument("--llm-token-interval-ms", type=float, default=5)
+    parser.add_argument("--llm-answer-words", type=int, default=40)
+    parser.add_argument("--llm-tool-rounds", type=int, default=1)
+    parser.add_argument("--run-mode", choices=["stream", "poll"], default="stream", help="AppRepo run_mode for the test app.")
+    parser.add_argument("--run-poll-interval", type=float, default=0.05, help="Initial run polling interval, seconds.")
+    parser.add_argument("--output", help="Write the JSON report here.")
+    parser.add_argument("--baseline", help="Earlier JSON report to compare against; exits 1 on regression.")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative change before a metric counts as regressed.")
+    args = parser.parse_args()
+
+    args.llm_port = free_port()
+    configure_environment(args, args.llm_port)
+    try:
+        seed_app_config(args.mongo_uri, args.db_name, args.run_mode)
+    except pymongo.errors.ServerSelectionTimeoutError:
+        print(f"{TColors.FAIL}No MongoDB reachable at {args.mongo_uri}; start a local mongod or pass --mongo-uri.{TColors.ENDC}")
+        return 2
+    try:
+        report = asyncio.run(run_load(args))
+    finally:
+        if not args.keep_db:
+            drop_database(args.mongo_uri, args.db_name)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(report, baseline, args.tolerance)
+        if regressions:
+            print(f"{TColors.FAIL}{regressions} metric(s) regressed beyond {args.tolerance:.0%}.{TColors.ENDC}")
+            return 1
+        print(f"{TColors.OKGREEN}No regressions beyond {args.tolerance:.0%}.{TColors.ENDC}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
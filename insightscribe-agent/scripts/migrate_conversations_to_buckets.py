@@ -0,0 +1,58 @@
+import argparse
+import asyncio
+import os
+import sys
+from dotenv import load_dotenv
+
+# --- Setup Project Path ---
+# This allows the script to import modules from the 'src' directory
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+# Load environment variables before src.config builds its settings
+load_dotenv(dotenv_path=os.path.join(project_root, '.env'))
+
+from src.services.mongo_service import MongoService, LAYOUT_BUCKETED
+from src.config import settings
+
+
+async def migrate(dry_run: bool, min_turns: int, bucket_size: int):
+    """
+    Moves embedded conversations into the bucketed `session_turns` layout.
+    Safe to re-run: already-migrated sessions are skipped and partially written
+    buckets are overwritten.
+    """
+    mongo = MongoService()
+    await mongo.ensure_indexes()
+    query = {
+        "conversation_layout": {"$ne": LAYOUT_BUCKETED},
+        f"conversation.{min_turns - 1}": {"$exists": True}, # at least min_turns turns
+    }
+    migrated = skipped = 0
+    try:
+        print(f"Scanning sessions with at least {min_turns} embedded turns...")
+        async for doc in mongo.db.sessions.find(query, {"session_id": 1}):
+            session_id = doc["session_id"]
+            if dry_run:
+                print(f"  [dry-run] would migrate {session_id}")
+                migrated += 1
+                continue
+            if await mongo.migrate_session_to_buckets(session_id, bucket_size):
+                print(f"  -> migrated {session_id}")
+                migrated += 1
+            else:
+                skipped += 1
+    finally:
+        mongo.close()
+
+    print("-" * 50)
+    print(f"Migrated: {migrated}  Skipped: {skipped}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate embedded session conversations to bucketed storage.")
+    parser.add_argument("--dry-run", action="store_true", help="List sessions that would be migrated without changing them.")
+    parser.add_argument("--min-turns", type=int, default=1, help="Only migrate sessions with at least this many turns.")
+    parser.add_argument("--bucket-size", type=int, default=settings.CONVERSATION_BUCKET_SIZE, help="Turns per bucket document.")
+    args = parser.parse_args()
+    asyncio.run(migrate(args.dry_run, args.min_turns, args.bucket_size))
@@ -3,6 +3,7 @@ import httpx
 import os
 import sys
 import json
+import time
 from dotenv import load_dotenv
 import pymongo
 
@@ -20,6 +21,8 @@ BASE_URL = "http://127.0.0.1:8000" # URL of your running FastAPI server
 
 TEST_APP_ID = "innovare-demo"
 TEST_USER_ID = "e2e-test-user"
+# LTM entries are written by the server's background LTMWriter, a flush interval or more after the turn.
+LTM_WRITE_WAIT_SECONDS = float(os.getenv("LTM_WRITER_FLUSH_INTERVAL_SECONDS", 1.0)) + 10
 
 # --- Test Utilities ---
 class TColors:
@@ -51,6 +54,23 @@ def parse_sse_event(line: str) -> dict | None:
             return None
     return None
 
+def read_conversation(db, session_id: str) -> list | None:
+    """Returns a session's stored turns in order, for either conversation layout, or None if it does not exist."""
+    header = db.sessions.find_one({"session_id": session_id})
+    if header is None:
+        return None
+    if header.get("conversation_layout") == "bucketed":
+        buckets = db.session_turns.find({"session_id": session_id}).sort("bucket_no", 1)
+        return [turn for bucket in buckets for turn in bucket["turns"]]
+    return header.get("conversation", [])
+
+def assert_admitted(response: httpx.Response) -> None:
+    """Chat streams can be refused by admission control (rate limits, stream caps, load shedding)."""
+    if response.status_code in (429, 503):
+        print(f"  {TColors.WARNING}Rejected by admission control (Retry-After: {response.headers.get('Retry-After')}); "
+              f"check the ADMISSION_* settings and /admin/admission/stats.{TColors.ENDC}")
+    assert_test(response.status_code == 200, f"Chat stream endpoint should return 200 OK (got {response.status_code}).")
+
 async def main():
     """Main function to run the end-to-end agent test."""
     print("Starting Agent End-to-End Test Suite...")
@@ -94,7 +114,7 @@ async def main():
             received_events = []
             print("  Connecting to stream...")
             async with client.stream("POST", f"{BASE_URL}/agent/chat/stream", json=chat_payload, timeout=30) as response:
-                assert_test(response.status_code == 200, "Chat stream endpoint should return 200 OK.")
+                assert_admitted(response)
                 
                 async for line in response.aiter_lines():
                     event = parse_sse_event(line)
@@ -117,11 +137,10 @@ async def main():
         mongo_client = pymongo.MongoClient(MONGO_URI)
         db = mongo_client[MONGO_DB_NAME]
         
-        # Verify Short-Term Memory
-        stm_doc = db.session_memory.find_one({"session_id": session_id})
-        assert_test(stm_doc is not None, "STM document for the session should exist.")
-        if stm_doc:
-            conversation = stm_doc.get("conversation", [])
+        # Verify Short-Term Memory; turns are embedded in the session or, for bucketed sessions, in session_turns.
+        conversation = read_conversation(db, session_id)
+        assert_test(conversation is not None, "STM document for the session should exist.")
+        if conversation is not None:
             assert_test(len(conversation) > 0, "STM conversation history should not be empty.")
             assert_test(conversation[0].get("role") == "user", "First turn in STM should be from the user.")
 
@@ -134,13 +153,20 @@ async def main():
                 "message": "This is my preference: always use bar charts."
             }
             async with client.stream("POST", f"{BASE_URL}/agent/chat/stream", json=ltm_payload, timeout=30) as response:
+                assert_admitted(response)
                 async for _ in response.aiter_lines(): # Consume the stream
                     pass
         
-        ltm_doc = db.long_term_memory.find_one({"user_id": TEST_USER_ID, "type": "preference"})
-        assert_test(ltm_doc is not None, "LTM document for the preference should have been created.")
+        # The turn only queues the write; wait for the writer to flush it.
+        ltm_query = {"user_id": TEST_USER_ID, "app_id": TEST_APP_ID, "type": "summary", "content.text": {"$regex": "bar charts"}}
+        deadline = time.monotonic() + LTM_WRITE_WAIT_SECONDS
+        ltm_doc = db.long_term_memory.find_one(ltm_query)
+        while ltm_doc is None and time.monotonic() < deadline:
+            await asyncio.sleep(0.5)
+            ltm_doc = db.long_term_memory.find_one(ltm_query)
+        assert_test(ltm_doc is not None, f"LTM summary of the message should be written within {LTM_WRITE_WAIT_SECONDS:.0f}s.")
         if ltm_doc:
-            assert_test("preference" in ltm_doc.get("content", {}).get("summary_text", ""), "LTM summary should contain the correct text.")
+            assert_test("always use bar charts" in ltm_doc.get("content", {}).get("text", ""), "LTM summary should contain the correct text.")
 
     except httpx.ConnectError as e:
         print(f"\n{TColors.FAIL}FATAL ERROR: Could not connect to the FastAPI server at {BASE_URL}{TColors.ENDC}")
@@ -157,6 +183,7 @@ async def main():
             db = mongo_client[MONGO_DB_NAME]
             print(f"  Deleting test session: {session_id}")
             db.sessions.delete_one({"session_id": session_id})
+            db.session_turns.delete_many({"session_id": session_id})
             print(f"  Deleting LTM entries for user: {TEST_USER_ID}")
             db.long_term_memory.delete_many({"user_id": TEST_USER_ID})
         elif not session_id:
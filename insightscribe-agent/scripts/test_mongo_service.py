@@ -10,8 +10,13 @@ import uuid
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.insert(0, project_root)
 
-from src.services.mongo_service import MongoService
+# Settings are read when src.config is imported, so the .env file has to be loaded first.
+load_dotenv(dotenv_path=os.path.join(project_root, '.env'))
+
+from src.services.container import Services
+from src.services.mongo_service import MongoService, LAYOUT_BUCKETED
 from src.models.db_models import AppRepo, SessionMemory, LongTermMemoryEntry, ConversationTurn
+from src.models.records import LTMRecord
 
 # --- Test Utilities ---
 # For colorful console output
@@ -54,26 +59,30 @@ async def test_read_app_repo(mongo: MongoService):
     app_config_missing = await mongo.get_app_config(app_id_missing)
     assert_test(app_config_missing is None, "Non-existing AppRepo should return None.")
 
-async def test_session_lifecycle(mongo: MongoService):
-    """Tests the full lifecycle of a short-term memory session."""
-    print_test_header("Session Memory (STM) Lifecycle")
+async def test_session_lifecycle(mongo: MongoService, layout: str):
+    """Tests the full lifecycle of a short-term memory session stored in the given conversation layout."""
+    print_test_header(f"Session Memory (STM) Lifecycle, {layout} layout")
     
     test_session_id = f"test-session-{uuid.uuid4().hex}"
     test_user_id = "test-user-stm"
     test_app_id = "innovare-demo"
+    bucketed = layout == LAYOUT_BUCKETED
     
     try:
         # Step 1: Create a session
         print("  Step 1: Creating a new session...")
-        # The create_or_update_session method is not in MongoService, so we'll use create_session and then update
-        # For testing purposes, we'll create a dummy session object first
+        # SessionManager normally builds the session from Settings; here the layout is set explicitly
+        # so both layouts are covered whatever CONVERSATION_STORAGE says. Bucketed sessions use
+        # two turns per bucket so the appends below cross a bucket boundary.
         now = datetime.utcnow()
         expires_at = now + timedelta(hours=1) # Dummy TTL for test
         session_to_create = SessionMemory(
             session_id=test_session_id,
             user_id=test_user_id,
             app_id=test_app_id,
-            expires_at=expires_at
+            expires_at=expires_at,
+            conversation_layout=layout,
+            bucket_size=2 if bucketed else None
         )
         await mongo.create_session(session_to_create)
         session = await mongo.get_session(test_session_id) # Retrieve to confirm creation
@@ -82,73 +91,91 @@ async def test_session_lifecycle(mongo: MongoService):
         assert_test(isinstance(session, SessionMemory), "Result should be a SessionMemory instance.")
         assert_test(session.session_id == test_session_id, "Session ID should match.")
         
-        # Step 2: Append a message to the conversation
-        print("  Step 2: Appending a message...")
-        user_turn = ConversationTurn(role="user", text="Hello, agent!")
-        await mongo.append_to_conversation(test_session_id, user_turn)
+        # Step 2: Append messages to the conversation
+        print("  Step 2: Appending three messages...")
+        texts = ["Hello, agent!", "Hello! How can I help?", "Show me the top denial reasons."]
+        turn_count = None
+        for i, text in enumerate(texts):
+            turn_count = await mongo.append_to_conversation(
+                test_session_id, ConversationTurn(role="user" if i % 2 == 0 else "assistant", text=text))
+        assert_test(turn_count == 3, f"append_to_conversation should return the new turn_count (got {turn_count}).")
         
         # Step 3: Retrieve and verify the updated session
         print("  Step 3: Retrieving session to verify update...")
         updated_session = await mongo.get_session(test_session_id)
-        assert_test(len(updated_session.conversation) == 1, "Conversation history should have 1 entry.")
-        assert_test(updated_session.conversation[0].text == "Hello, agent!", "Message text should be correct.")
+        assert_test([t.text for t in updated_session.conversation] == texts, "Conversation history should hold the 3 turns in order.")
+        assert_test(updated_session.query_count == 2, "Two user turns should be counted as queries.")
+        windowed = await mongo.get_session(test_session_id, conversation_window=2)
+        assert_test([t.text for t in windowed.conversation] == texts[-2:], "A conversation_window of 2 should return the last 2 turns.")
+        window = await mongo.get_conversation_window(test_session_id, 2, raw=True)
+        assert_test([t.text for t in window] == texts[-2:], "get_conversation_window(raw=True) should return the last 2 turns.")
+        if bucketed:
+            buckets = await mongo.db.session_turns.count_documents({"session_id": test_session_id})
+            assert_test(buckets == 2, f"Three turns should fill two buckets of 2 (got {buckets}).")
         
     finally:
         # Step 4: Cleanup
         print("  Step 4: Cleaning up created session...")
         deleted_count = await mongo.delete_session_by_id(test_session_id)
         assert_test(deleted_count == 1, "Cleanup should delete 1 session document.")
+        if bucketed:
+            remaining = await mongo.db.session_turns.count_documents({"session_id": test_session_id})
+            assert_test(remaining == 0, "Cleanup should delete the session's turn buckets.")
 
 async def test_ltm_lifecycle(mongo: MongoService):
-    """Tests the full lifecycle of a long-term memory entry."""
+    """Tests the full lifecycle of long-term memory entries."""
     print_test_header("Long-Term Memory (LTM) Lifecycle")
     
-    test_user_id = "test-user-ltm"
+    test_user_id = f"test-user-ltm-{uuid.uuid4().hex}"
     test_app_id = "innovare-demo"
-    ltm_id_to_delete = None
+    older = LongTermMemoryEntry(
+        user_id=test_user_id,
+        app_id=test_app_id,
+        type="preference",
+        content={"text": "User prefers bar charts for financial data."}
+    )
+    newer = LongTermMemoryEntry(
+        user_id=test_user_id,
+        app_id=test_app_id,
+        type="summary",
+        content={"text": "User asked about denial reasons."}
+    )
 
     try:
-        # Step 1: Create an LTM entry
-        print("  Step 1: Creating a new LTM entry...")
-        ltm_entry = LongTermMemoryEntry(
-            user_id=test_user_id,
-            app_id=test_app_id,
-            type="preference",
-            content={"summary_text": "User prefers bar charts for financial data."}
-        )
-        # The add_ltm_entry method does not return the ID directly, it inserts.
-        # We need to retrieve it after insertion to get the ID for deletion.
-        await mongo.add_ltm_entry(ltm_entry)
-        
-        # Retrieve the newly added LTM entry to get its ID
-        # This is a simplified retrieval; in a real scenario, you might query by content or timestamp
-        retrieved_ltm_entries = await mongo.get_ltm_for_user(test_user_id, app_id=test_app_id)
-        new_ltm_entry = next((e for e in retrieved_ltm_entries if e.content.get("summary_text") == "User prefers bar charts for financial data."), None)
-        
-        assert_test(new_ltm_entry is not None, "Newly added LTM entry should be retrievable.")
-        if new_ltm_entry:
-            ltm_id_to_delete = str(new_ltm_entry.id)
-            assert_test(ltm_id_to_delete is not None, "Adding an LTM entry should result in a retrievable ID.")
+        # Step 1: Create LTM entries, one at a time and as a batch (the path LTMWriter uses)
+        print("  Step 1: Creating two LTM entries...")
+        await mongo.add_ltm_entry(older)
+        await mongo.add_ltm_entries([newer])
+        # LTMWriter retries a batch with the same entry _ids; already-stored entries are skipped.
+        await mongo.add_ltm_entries([newer])
+        stored = await mongo.db.long_term_memory.count_documents({"user_id": test_user_id})
+        assert_test(stored == 2, f"Re-adding an entry with the same _id should not duplicate it (got {stored} documents).")
         
         # Step 2: Retrieve LTM for the user
         print("  Step 2: Retrieving LTM entries for the user...")
-        user_memories = await mongo.get_ltm_for_user(test_user_id)
-        assert_test(len(user_memories) > 0, "Should retrieve at least one memory entry.")
-        
-        found_memory = next((m for m in user_memories if str(m.id) == ltm_id_to_delete), None)
-        assert_test(found_memory is not None, "The newly created memory should be found.")
-        if found_memory:
+        user_memories = await mongo.get_ltm_for_user(test_user_id, app_id=test_app_id)
+        assert_test([m.id for m in user_memories] == [newer.id, older.id], "Entries should be returned most recent first.")
+        assert_test(all(isinstance(m, LongTermMemoryEntry) for m in user_memories), "Entries should be LongTermMemoryEntry instances.")
+        if user_memories:
             assert_test(
-                found_memory.content.get("summary_text") == "User prefers bar charts for financial data.",
-                "The memory summary text should match."
+                user_memories[-1].content.get("text") == "User prefers bar charts for financial data.",
+                "The memory text should match."
             )
+        limited = await mongo.get_ltm_for_user(test_user_id, app_id=test_app_id, limit=1)
+        assert_test([m.id for m in limited] == [newer.id], "limit=1 should return only the most recent entry.")
+        
+        # Step 3: Raw reads, as used when building the prompt context
+        print("  Step 3: Retrieving raw LTM records...")
+        records = await mongo.get_ltm_for_user(test_user_id, app_id=test_app_id, raw=True)
+        assert_test(all(isinstance(r, LTMRecord) for r in records), "raw=True should return LTMRecord views.")
+        assert_test([r.id for r in records] == [newer.id, older.id], "Raw records should keep the same order.")
 
     finally:
-        # Step 3: Cleanup
-        if ltm_id_to_delete:
-            print("  Step 3: Cleaning up created LTM entry...")
-            deleted_count = await mongo.delete_ltm_by_id(ltm_id_to_delete)
-            assert_test(deleted_count == 1, "Cleanup should delete 1 LTM document.")
+        # Step 4: Cleanup
+        print("  Step 4: Cleaning up created LTM entries...")
+        for entry in (older, newer):
+            deleted_count = await mongo.delete_ltm_by_id(str(entry.id))
+            assert_test(deleted_count == 1, f"Cleanup should delete LTM entry {entry.id}.")
 
 
 # --- Main Execution ---
@@ -158,17 +185,18 @@ async def main():
     print("Starting MongoService Test Suite...")
     print("-" * 50)
 
-    # Load .env file
-    dotenv_path = os.path.join(project_root, '.env')
-    load_dotenv(dotenv_path=dotenv_path)
-
-    # Instantiate the service
-    mongo_service = MongoService()
+    # Build the services the way the application does; only the MongoService is used here.
+    # Nothing is started, so no LTM writer, cache invalidation or index refresh runs in the background.
+    mongo_service = Services.from_settings().mongo_service
 
     # Run tests
-    await test_read_app_repo(mongo_service)
-    await test_session_lifecycle(mongo_service)
-    await test_ltm_lifecycle(mongo_service)
+    try:
+        await test_read_app_repo(mongo_service)
+        await test_session_lifecycle(mongo_service, "embedded")
+        await test_session_lifecycle(mongo_service, LAYOUT_BUCKETED)
+        await test_ltm_lifecycle(mongo_service)
+    finally:
+        mongo_service.close()
 
     # Print summary
     print("\n" + "-" * 50)
@@ -1,7 +1,18 @@
 from fastapi import APIRouter, Depends
-from src.services.session_service import session_manager
-from typing import List, Dict, Any
-from datetime import datetime, timedelta
+from src.api.dependencies import (
+    get_admission_controller, get_context_builder, get_ltm_writer, get_mongo_service, get_response_cache,
+    get_session_manager, get_tool_executor, get_tool_loader
+)
+from src.services.admission import AdmissionController
+from src.services.context_builder import ContextBuilder
+from src.services.mongo_service import MongoService
+from src.services.ltm_writer import LTMWriter
+from src.services.response_cache import ResponseCache
+from src.services.session_service import SessionManager
+from src.services.tool_executor import ToolExecutor
+from src.services.tool_loader import ToolLoader
+from typing import List, Dict, Any, Optional
+from datetime import datetime
 
 router = APIRouter()
 
@@ -10,39 +21,55 @@ async def get_app_repo():
     return {"message": "Get AppRepo"}
 
 @router.get("/sessions/analytics")
-async def get_session_analytics():
-    sessions = session_manager.collection.find({})
-    total_sessions = 0
-    total_queries = 0
-    total_tokens_used = 0
-    session_durations = []
-    query_counts = []
-
-    for session_data in sessions:
-        session = session_manager.get_session(session_data["session_id"])
-        if session:
-            total_sessions += 1
-            total_queries += session.query_count
-            total_tokens_used += session.total_tokens
-            query_counts.append(session.query_count)
-
-            if session.created_at and session.last_query_at:
-                duration = (session.last_query_at - session.created_at).total_seconds()
-                session_durations.append(duration)
-
-    avg_queries_per_session = total_queries / total_sessions if total_sessions > 0 else 0
-    avg_session_duration = sum(session_durations) / len(session_durations) if session_durations else 0
+async def get_session_analytics(app_id: Optional[str] = None, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                                mongo_service: MongoService = Depends(get_mongo_service)):
+    """Usage totals over live sessions created in [start, end), optionally for one app."""
+    return await mongo_service.get_session_analytics(app_id=app_id, start=start, end=end)
 
+@router.get("/sessions/analytics/hourly")
+async def get_hourly_session_analytics(app_id: Optional[str] = None, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                                       mongo_service: MongoService = Depends(get_mongo_service)):
+    """Per-app, per-hour rollups in [start, end). Unlike /sessions/analytics, these outlive expired sessions."""
+    buckets = await mongo_service.get_hourly_rollups(app_id=app_id, start=start, end=end)
     return {
-        "total_sessions": total_sessions,
-        "total_queries": total_queries,
-        "total_tokens_used": total_tokens_used,
-        "average_queries_per_session": avg_queries_per_session,
-        "average_session_duration_seconds": avg_session_duration,
-        "max_queries_in_session": max(query_counts) if query_counts else 0,
-        "min_queries_in_session": min(query_counts) if query_counts else 0,
+        "sessions_created": sum(b.get("sessions_created", 0) for b in buckets),
+        "total_queries": sum(b.get("queries", 0) for b in buckets),
+        "total_tokens_used": sum(b.get("tokens", 0) for b in buckets),
+        "buckets": buckets,
     }
 
+@router.get("/cache/stats")
+async def get_cache_stats(mongo_service: MongoService = Depends(get_mongo_service),
+                          tool_executor: ToolExecutor = Depends(get_tool_executor),
+                          response_cache: ResponseCache = Depends(get_response_cache),
+                          session_manager: SessionManager = Depends(get_session_manager),
+                          context_builder: ContextBuilder = Depends(get_context_builder)):
+    return {
+        "app_config": mongo_service.app_config_cache.stats(),
+        "tool_results": tool_executor.result_cache.stats() if tool_executor.result_cache else None,
+        "ltm_indexes": mongo_service.ltm_index.stats(),
+        "responses": response_cache.stats(),
+        "sessions": session_manager.stats(),
+        "context_token_lengths": context_builder.stats(),
+    }
+
+@router.delete("/cache/responses/{app_id}")
+async def invalidate_response_cache(app_id: str, response_cache: ResponseCache = Depends(get_response_cache)):
+    """Drops an app's cached answers, e.g. after its data was refreshed outside a data_version bump."""
+    return {"app_id": app_id, "scopes_dropped": response_cache.invalidate_app(app_id)}
+
+@router.get("/tools/stats")
+async def get_tool_stats(tool_loader: ToolLoader = Depends(get_tool_loader)):
+    return tool_loader.stats()
+
+@router.get("/admission/stats")
+async def get_admission_stats(admission_controller: AdmissionController = Depends(get_admission_controller)):
+    return admission_controller.stats()
+
+@router.get("/ltm/writer/stats")
+async def get_ltm_writer_stats(ltm_writer: LTMWriter = Depends(get_ltm_writer)):
+    return ltm_writer.stats()
+
 @router.post("/apprepo")
 async def create_app_repo():
     return {"message": "Create AppRepo"}
@@ -1,19 +1,28 @@
+import asyncio
 import logging
 from fastapi import APIRouter, HTTPException, Depends
 from sse_starlette.sse import EventSourceResponse
-import json
+import time
+from starlette.background import BackgroundTask
 
-from ..models.api_models import InitRequest, InitResponse, ChatRequest
-from ..services.session_service import session_manager
-from ..services.agent_orchestrator import AgentOrchestrator
-from ..services.mongo_service import mongo_service
-from ..main import request_user_id, request_session_id # Import ContextVars
+from ..models.api_models import InitRequest, InitResponse, ChatRequest, MAX_SHORT_TERM_WINDOW
+from ..services.admission import AdmissionController, AdmissionRejected
+from ..services.container import Services
+from ..services.session_service import SessionManager
+from ..services.mongo_service import MongoService
+from ..services.stream_coalescer import StreamFlushPolicy, coalesce_events, HEARTBEAT
+from ..services.sse_encoding import HEARTBEAT_FRAME, encode_event
+from ..services.metrics import SSE_ACTIVE_STREAMS, SSE_STREAMS_TOTAL, SSE_TIME_TO_FIRST_CHUNK_SECONDS
+from ..request_context import request_user_id, request_session_id
+from .dependencies import get_admission_controller, get_mongo_service, get_services, get_session_manager
 
 router = APIRouter(prefix="/agent", tags=["Agent"])
 logger = logging.getLogger(__name__)
 
 @router.post("/init", response_model=InitResponse)
-async def init_agent_session(req: InitRequest):
+async def init_agent_session(req: InitRequest,
+                             session_manager: SessionManager = Depends(get_session_manager),
+                             mongo_service: MongoService = Depends(get_mongo_service)):
     """Initializes a new agent session."""
     request_user_id.set(req.user_id) # Set user_id in context
     logger.info(f"Initializing session for user: {req.user_id}, app: {req.app_id}")
@@ -45,13 +54,19 @@ async def init_agent_session(req: InitRequest):
         raise HTTPException(status_code=500, detail="Internal server error.")
 
 @router.post("/chat/stream")
-async def chat_stream(req: ChatRequest):
+async def chat_stream(req: ChatRequest,
+                      services: Services = Depends(get_services),
+                      session_manager: SessionManager = Depends(get_session_manager),
+                      mongo_service: MongoService = Depends(get_mongo_service),
+                      admission_controller: AdmissionController = Depends(get_admission_controller)):
     """Handles a user message and streams back the agent's response."""
+    received_at = time.perf_counter()
     request_user_id.set(req.user_id) # Set user_id in context
     request_session_id.set(req.session_id) # Set session_id in context
     logger.info(f"Received chat message: '{req.message}'")
 
-    session = await session_manager.get_session(req.session_id)
+    # Load only the turns any short-term window can use; the orchestrator reuses this session object.
+    session = await session_manager.get_session(req.session_id, conversation_window=MAX_SHORT_TERM_WINDOW)
     if not session or session.user_id != req.user_id:
         logger.warning(f"Session not found or user mismatch for session_id: {req.session_id}, user_id: {req.user_id}")
         raise HTTPException(status_code=404, detail="Session not found or user mismatch.")
@@ -61,14 +76,52 @@ async def chat_stream(req: ChatRequest):
         logger.error(f"App config for session {req.session_id} not found for app_id: {session.app_id}")
         raise HTTPException(status_code=404, detail="App config for session not found.")
 
-    # Append user message to history before starting orchestration
-    await session_manager.append_message(req.session_id, "user", req.message)
-    logger.debug("User message appended to session history.")
-    
-    orchestrator = AgentOrchestrator(session, app_config)
+    # Per-app policies are parsed before a stream slot is taken, so a bad config cannot hold one.
+    flush_policy = StreamFlushPolicy.for_app(app_config)
 
-    async def event_generator():
-        async for event in orchestrator.run(req.message):
-            yield json.dumps(event)
-    
-    return EventSourceResponse(event_generator())
+    # Rejected requests are turned away before anything is written to the session.
+    try:
+        ticket = await admission_controller.acquire(req.user_id, app_config)
+    except AdmissionRejected as e:
+        logger.warning(f"{e} (retry after {e.retry_after_seconds}s)")
+        raise HTTPException(status_code=e.status_code, detail=f"{e} ({e.reason}).",
+                            headers={"Retry-After": str(e.retry_after_seconds)})
+
+    # Until the response owns the ticket, any failure must give the slot back.
+    try:
+        # Append user message to history before starting orchestration. If another worker wrote
+        # to the session since it was read, a fresh copy comes back in its place.
+        session = await session_manager.append_message(session, "user", req.message, conversation_window=MAX_SHORT_TERM_WINDOW)
+        logger.debug("User message appended to session history.")
+
+        orchestrator = services.orchestrator(session, app_config)
+
+        async def event_generator():
+            SSE_STREAMS_TOTAL.inc()
+            SSE_ACTIVE_STREAMS.inc()
+            first_chunk_sent = False
+            try:
+                async for event in coalesce_events(orchestrator.run(req.message), flush_policy):
+                    if event is HEARTBEAT:
+                        yield HEARTBEAT_FRAME
+                        continue
+                    if not first_chunk_sent and event["event"] == "message_chunk":
+                        first_chunk_sent = True
+                        SSE_TIME_TO_FIRST_CHUNK_SECONDS.observe(time.perf_counter() - received_at)
+                        admission_controller.observe_first_chunk(time.perf_counter() - received_at)
+                    # Frames are encoded here, once, and passed through by EventSourceResponse.
+                    yield encode_event(event)
+            except asyncio.CancelledError:
+                # sse-starlette cancels the response when the client disconnects; the
+                # cancellation reaches the orchestrator, which stops its tools and run.
+                logger.info("Client disconnected mid-stream; cancelling the agent turn.")
+                raise
+            finally:
+                SSE_ACTIVE_STREAMS.dec()
+                ticket.release()
+
+        # The background task frees the slot if the client left before the stream started.
+        return EventSourceResponse(event_generator(), background=BackgroundTask(ticket.release))
+    except BaseException:
+        ticket.release()
+        raise
@@ -0,0 +1,45 @@
+from fastapi import Request
+
+from ..services.admission import AdmissionController
+from ..services.container import Services
+from ..services.context_builder import ContextBuilder
+from ..services.llm_client import LLMClient
+from ..services.ltm_writer import LTMWriter
+from ..services.mongo_service import MongoService
+from ..services.response_cache import ResponseCache
+from ..services.session_service import SessionManager
+from ..services.tool_executor import ToolExecutor
+from ..services.tool_loader import ToolLoader
+
+# FastAPI dependency providers for the services the lifespan keeps on app.state.services.
+# Tests can swap any of them with app.dependency_overrides.
+
+def get_services(request: Request) -> Services:
+    return request.app.state.services
+
+def get_mongo_service(request: Request) -> MongoService:
+    return request.app.state.services.mongo_service
+
+def get_llm_client(request: Request) -> LLMClient:
+    return request.app.state.services.llm_client
+
+def get_session_manager(request: Request) -> SessionManager:
+    return request.app.state.services.session_manager
+
+def get_tool_loader(request: Request) -> ToolLoader:
+    return request.app.state.services.tool_loader
+
+def get_tool_executor(request: Request) -> ToolExecutor:
+    return request.app.state.services.tool_executor
+
+def get_ltm_writer(request: Request) -> LTMWriter:
+    return request.app.state.services.ltm_writer
+
+def get_response_cache(request: Request) -> ResponseCache:
+    return request.app.state.services.response_cache
+
+def get_admission_controller(request: Request) -> AdmissionController:
+    return request.app.state.services.admission_controller
+
+def get_context_builder(request: Request) -> ContextBuilder:
+    return request.app.state.services.context_builder
@@ -4,8 +4,106 @@ import os
 class Settings(BaseSettings):
     MONGO_URI: str = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
     MONGO_DB_NAME: str = os.getenv("MONGO_DB_NAME", "insightscribe")
+    # Connection pool shared by every request in a worker process
+    MONGO_MIN_POOL_SIZE: int = os.getenv("MONGO_MIN_POOL_SIZE", 0)
+    MONGO_MAX_POOL_SIZE: int = os.getenv("MONGO_MAX_POOL_SIZE", 100)
+    MONGO_WAIT_QUEUE_TIMEOUT_MS: int = os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 2000) # Max wait for a free pooled connection
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000)
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "your_openai_api_key")
+    OPENAI_BASE_URL: str = os.getenv("OPENAI_BASE_URL", "") # Empty uses the OpenAI API; set to point at a compatible stand-in
+    # One HTTP connection pool for all Assistants API calls in a worker process
+    OPENAI_MAX_CONNECTIONS: int = os.getenv("OPENAI_MAX_CONNECTIONS", 100)
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS: int = os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", 20)
+    OPENAI_TIMEOUT_SECONDS: float = os.getenv("OPENAI_TIMEOUT_SECONDS", 60)
+    OPENAI_MAX_RETRIES: int = os.getenv("OPENAI_MAX_RETRIES", 2)
+    # How runs are driven unless AppRepo config["run_mode"] says otherwise: "stream" or "poll"
+    RUN_MODE: str = os.getenv("RUN_MODE", "stream")
+    # Agent run polling: exponential backoff between status checks, capped at the max
+    RUN_POLL_INITIAL_INTERVAL_SECONDS: float = os.getenv("RUN_POLL_INITIAL_INTERVAL_SECONDS", 0.25)
+    RUN_POLL_MAX_INTERVAL_SECONDS: float = os.getenv("RUN_POLL_MAX_INTERVAL_SECONDS", 2.0)
+    RUN_POLL_BACKOFF_FACTOR: float = os.getenv("RUN_POLL_BACKOFF_FACTOR", 2.0)
+    # Parsed AppRepo cache (per worker); change streams or polling invalidate entries early
+    APP_CONFIG_CACHE_MAX_SIZE: int = os.getenv("APP_CONFIG_CACHE_MAX_SIZE", 256)
+    APP_CONFIG_CACHE_TTL_SECONDS: float = os.getenv("APP_CONFIG_CACHE_TTL_SECONDS", 300)
+    # Polling (used without change streams) sees updated_at bumps and deletions; other writes wait for the TTL
+    APP_CONFIG_CACHE_POLL_INTERVAL_SECONDS: float = os.getenv("APP_CONFIG_CACHE_POLL_INTERVAL_SECONDS", 30)
+    # SSE message_chunk coalescing defaults; overridable per AppRepo via config["streaming"]
+    STREAM_FLUSH_MAX_BYTES: int = os.getenv("STREAM_FLUSH_MAX_BYTES", 1024)
+    STREAM_FLUSH_MAX_CHUNKS: int = os.getenv("STREAM_FLUSH_MAX_CHUNKS", 64)
+    STREAM_FLUSH_MAX_DELAY_MS: float = os.getenv("STREAM_FLUSH_MAX_DELAY_MS", 50)
+    STREAM_HEARTBEAT_SECONDS: float = os.getenv("STREAM_HEARTBEAT_SECONDS", 15)
+    # Tool execution: shared worker threads, default per-call timeout and per-tool concurrency cap
+    TOOL_EXECUTOR_MAX_WORKERS: int = os.getenv("TOOL_EXECUTOR_MAX_WORKERS", 16)
+    TOOL_CALL_TIMEOUT_SECONDS: float = os.getenv("TOOL_CALL_TIMEOUT_SECONDS", 30)
+    TOOL_MAX_CONCURRENCY: int = os.getenv("TOOL_MAX_CONCURRENCY", 8)
+    TOOL_POOL_SIZE: int = os.getenv("TOOL_POOL_SIZE", 4) # Default max instances per pooled tool
+    # Where tool discovery caches which module defines each tool; empty uses the temp directory.
+    # Point it into the image and run discovery at build time to skip the scan on every pod start.
+    TOOL_MANIFEST_PATH: str = os.getenv("TOOL_MANIFEST_PATH", "")
+    # Tool result cache: per-worker LRU size, and whether to share results across workers via MongoDB
+    TOOL_CACHE_MAX_SIZE: int = os.getenv("TOOL_CACHE_MAX_SIZE", 1024)
+    TOOL_CACHE_SHARED: bool = os.getenv("TOOL_CACHE_SHARED", False)
+    # Per-(user, app) LTM vector indexes held in memory for similarity search
+    LTM_INDEX_MAX_INDEXES: int = os.getenv("LTM_INDEX_MAX_INDEXES", 256)
+    LTM_INDEX_REFRESH_SECONDS: float = os.getenv("LTM_INDEX_REFRESH_SECONDS", 30) # Catch up on entries from other workers
+    LTM_INDEX_REBUILD_SECONDS: float = os.getenv("LTM_INDEX_REBUILD_SECONDS", 3600) # Full rebuild, drops deleted entries
+    # Catch-up re-reads entries this far behind the newest created_at it has seen, to cover entries
+    # stamped before, but inserted after, that one (insert latency plus clock skew between workers)
+    LTM_INDEX_CATCH_UP_OVERLAP_SECONDS: float = os.getenv("LTM_INDEX_CATCH_UP_OVERLAP_SECONDS", 60)
+    # Per-app answer cache, opted into with AppRepo config["response_cache"]; defaults for its keys.
+    # Bounded to RESPONSE_CACHE_MAX_SCOPES (app, user) scopes of RESPONSE_CACHE_MAX_ENTRIES_PER_SCOPE answers each.
+    RESPONSE_CACHE_MAX_SCOPES: int = os.getenv("RESPONSE_CACHE_MAX_SCOPES", 1024)
+    RESPONSE_CACHE_MAX_ENTRIES_PER_SCOPE: int = os.getenv("RESPONSE_CACHE_MAX_ENTRIES_PER_SCOPE", 128)
+    RESPONSE_CACHE_TTL_SECONDS: float = os.getenv("RESPONSE_CACHE_TTL_SECONDS", 900)
+    RESPONSE_CACHE_SIMILARITY_THRESHOLD: float = os.getenv("RESPONSE_CACHE_SIMILARITY_THRESHOLD", 0.92)
+    # Chat stream admission (per worker; per-app overrides in AppRepo config.admission; 0 disables a limit)
+    ADMISSION_USER_REQUESTS_PER_MINUTE: float = os.getenv("ADMISSION_USER_REQUESTS_PER_MINUTE", 30)
+    ADMISSION_USER_BURST: int = os.getenv("ADMISSION_USER_BURST", 10)
+    ADMISSION_APP_REQUESTS_PER_SECOND: float = os.getenv("ADMISSION_APP_REQUESTS_PER_SECOND", 0)
+    ADMISSION_APP_BURST: int = os.getenv("ADMISSION_APP_BURST", 50)
+    ADMISSION_MAX_STREAMS_PER_USER: int = os.getenv("ADMISSION_MAX_STREAMS_PER_USER", 3)
+    ADMISSION_MAX_STREAMS_PER_APP: int = os.getenv("ADMISSION_MAX_STREAMS_PER_APP", 200)
+    ADMISSION_MAX_QUEUE_WAIT_SECONDS: float = os.getenv("ADMISSION_MAX_QUEUE_WAIT_SECONDS", 2.0)
+    ADMISSION_MAX_STREAMS: int = os.getenv("ADMISSION_MAX_STREAMS", 500) # All apps, per worker
+    ADMISSION_QUEUE_SIZE: int = os.getenv("ADMISSION_QUEUE_SIZE", 100)
+    # Shed load while p90 time to first chunk exceeds this (0 disables), down to SHED_FACTOR of the open streams
+    ADMISSION_TTFC_SLO_SECONDS: float = os.getenv("ADMISSION_TTFC_SLO_SECONDS", 10)
+    ADMISSION_SHED_FACTOR: float = os.getenv("ADMISSION_SHED_FACTOR", 0.8)
+    ADMISSION_RETRY_AFTER_SECONDS: float = os.getenv("ADMISSION_RETRY_AFTER_SECONDS", 2)
+    # Prompt context budget (per-app overrides in AppRepo config.context); recent turns get what LTM leaves.
+    # LTM goes into the run's instructions; recent turns are thread messages, bounded with truncation_strategy.
+    CONTEXT_MAX_TOKENS: int = os.getenv("CONTEXT_MAX_TOKENS", 2000)
+    CONTEXT_LTM_SHARE: float = os.getenv("CONTEXT_LTM_SHARE", 0.4)
+    CONTEXT_MAX_TURN_TOKENS: int = os.getenv("CONTEXT_MAX_TURN_TOKENS", 400)
+    CONTEXT_LTM_CANDIDATES: int = os.getenv("CONTEXT_LTM_CANDIDATES", 20)
+    # tiktoken encoding (e.g. o200k_base; needs tiktoken installed); empty estimates ~4 characters per token
+    CONTEXT_TOKENIZER: str = os.getenv("CONTEXT_TOKENIZER", "")
+    CONTEXT_TOKEN_CACHE_SIZE: int = os.getenv("CONTEXT_TOKEN_CACHE_SIZE", 50000)
+    # Embedding model for semantic lookups (response cache, LTM writer); empty disables embeddings
+    EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "")
+    # Background LTM writer: bounded queue, batch size/flush interval, and what to do when the queue is full
+    # (drop_oldest | drop_newest | spill; spill appends to LTM_WRITER_SPILL_PATH and is replayed on start)
+    LTM_WRITER_QUEUE_SIZE: int = os.getenv("LTM_WRITER_QUEUE_SIZE", 1000)
+    LTM_WRITER_BATCH_SIZE: int = os.getenv("LTM_WRITER_BATCH_SIZE", 50)
+    LTM_WRITER_FLUSH_INTERVAL_SECONDS: float = os.getenv("LTM_WRITER_FLUSH_INTERVAL_SECONDS", 1.0)
+    LTM_WRITER_WORKERS: int = os.getenv("LTM_WRITER_WORKERS", 1)
+    LTM_WRITER_OVERFLOW_POLICY: str = os.getenv("LTM_WRITER_OVERFLOW_POLICY", "drop_oldest")
+    LTM_WRITER_SPILL_PATH: str = os.getenv("LTM_WRITER_SPILL_PATH", "")
+    LTM_WRITER_DRAIN_TIMEOUT_SECONDS: float = os.getenv("LTM_WRITER_DRAIN_TIMEOUT_SECONDS", 10)
+    # Maintain per-app, per-hour usage rollups (session_rollups) alongside session counters
+    ANALYTICS_ROLLUPS_ENABLED: bool = os.getenv("ANALYTICS_ROLLUPS_ENABLED", True)
     SESSION_TTL_HOURS: int = os.getenv("SESSION_TTL_HOURS", 24) # Default to 24 hours
+    # Per-worker session cache: header plus the last SESSION_CACHE_TURNS turns (keep >= MAX_SHORT_TERM_WINDOW).
+    # With it on, TTL bumps and token counts are written for all sessions once per SESSION_TTL_REFRESH_INTERVAL_SECONDS.
+    SESSION_CACHE_ENABLED: bool = os.getenv("SESSION_CACHE_ENABLED", True)
+    SESSION_CACHE_MAX_SIZE: int = os.getenv("SESSION_CACHE_MAX_SIZE", 10000)
+    SESSION_CACHE_TTL_SECONDS: float = os.getenv("SESSION_CACHE_TTL_SECONDS", 300)
+    SESSION_CACHE_TURNS: int = os.getenv("SESSION_CACHE_TURNS", 10)
+    SESSION_TTL_REFRESH_INTERVAL_SECONDS: float = os.getenv("SESSION_TTL_REFRESH_INTERVAL_SECONDS", 60)
+    # Conversation layout for new sessions: "embedded" (array in the session document) or
+    # "bucketed" (fixed-size documents in session_turns, keeps the session document small)
+    CONVERSATION_STORAGE: str = os.getenv("CONVERSATION_STORAGE", "embedded")
+    CONVERSATION_BUCKET_SIZE: int = os.getenv("CONVERSATION_BUCKET_SIZE", 100)
 
     class Config:
         env_file = ".env"
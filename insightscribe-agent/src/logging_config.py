@@ -0,0 +1,45 @@
+import atexit
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from typing import List, Optional
+
+from .request_context import RequestContextFilter
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(user_id)s - %(session_id)s - %(message)s'
+
+
+def configure_logging(level: int = logging.INFO, handlers: Optional[List[logging.Handler]] = None) -> QueueListener:
+    """
+    Routes all logging through a QueueHandler so request handlers only enqueue records;
+    a QueueListener thread formats them and does the (possibly slow) stream I/O.
+    The context filter sits on the QueueHandler because the contextvars have to be read
+    in the task that logged, not in the listener thread.
+    """
+    if handlers is None:
+        handlers = [logging.StreamHandler()]
+    formatter = logging.Formatter(LOG_FORMAT)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    # Flush whatever is still queued when the process exits.
+    atexit.register(stop_logging, listener)
+    return listener
+
+
+def stop_logging(listener: QueueListener) -> None:
+    """Drains the queue and stops the listener thread; safe to call more than once."""
+    if listener._thread is not None:
+        listener.stop()
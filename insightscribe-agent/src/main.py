@@ -1,58 +1,105 @@
+import asyncio
 import logging
-from contextvars import ContextVar
-from fastapi import FastAPI, Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Dict
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
+from .request_context import RequestContextMiddleware
+from .logging_config import configure_logging
 from .api import admin_router, agent_router # Assuming you move CRUD to admin_router
+from .services.container import Services
+from .services.metrics import APP_STARTUP_STEP_SECONDS, registry as metrics_registry
 
-# Configure basic logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(user_id)s - %(session_id)s - %(message)s',
-    handlers=[logging.StreamHandler()]
-)
+# Handlers only enqueue records; a background listener thread formats and writes them.
+log_listener = configure_logging()
 logger = logging.getLogger(__name__)
 
-# ContextVars for request-specific data
-request_user_id: ContextVar[str | None] = ContextVar("request_user_id", default=None)
-request_session_id: ContextVar[str | None] = ContextVar("request_session_id", default=None)
-
-class RequestContextMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app: ASGIApp):
-        super().__init__(app)
-
-    async def dispatch(self, request: Request, call_next):
-        # Reset context vars for each request
-        request_user_id.set(None)
-        request_session_id.set(None)
-        
-        # Create a custom logger adapter to inject context vars
-        # This allows us to use logger.info("message") and have user_id/session_id automatically added
-        class ContextAdapter(logging.LoggerAdapter):
-            def process(self, msg, kwargs):
-                extra = kwargs.get('extra', {})
-                extra['user_id'] = request_user_id.get() or 'N/A'
-                extra['session_id'] = request_session_id.get() or 'N/A'
-                kwargs['extra'] = extra
-                return msg, kwargs
-        
-        # Apply the adapter to the root logger for this request
-        # Note: This approach modifies the global logger for the duration of the request.
-        # For more robust solutions in production, consider libraries like `loguru` or
-        # passing a logger instance with bound context through dependencies.
-        # For this task, we'll use a simpler approach.
-        original_logger_class = logging.getLoggerClass()
-        logging.setLoggerClass(ContextAdapter)
-        
-        response = await call_next(request)
-        
-        # Restore original logger class
-        logging.setLoggerClass(original_logger_class)
-        return response
+class StartupSteps:
+    """
+    Times the lifespan's startup steps. Steps run inline block startup; warm-ups run in the
+    background, and those that gate readiness keep /ready at 503 until they have finished.
+    """
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+        self._warmups: Dict[str, asyncio.Task] = {}
+        self._gating: set = set()
+
+    async def run(self, name: str, step: Awaitable[Any]) -> None:
+        started = time.perf_counter()
+        try:
+            await step
+        except Exception as e:
+            self.errors[name] = str(e)
+            raise
+        finally:
+            self.seconds[name] = time.perf_counter() - started
+            APP_STARTUP_STEP_SECONDS.set(self.seconds[name], step=name)
+            logger.info(f"Startup step {name} took {self.seconds[name] * 1000:.1f} ms")
+
+    def warm_up(self, name: str, step: Awaitable[Any], gates_readiness: bool = False) -> None:
+        self._warmups[name] = asyncio.create_task(self._run_logged(name, step))
+        if gates_readiness:
+            self._gating.add(name)
+
+    async def _run_logged(self, name: str, step: Awaitable[Any]) -> None:
+        try:
+            await self.run(name, step)
+        except Exception as e:
+            logger.error(f"Startup step {name} failed: {e}")
+
+    @property
+    def ready(self) -> bool:
+        return all(self._warmups[name].done() and name not in self.errors for name in self._gating)
+
+    async def cancel(self) -> None:
+        """Cancels warm-ups still running, e.g. when the app shuts down right after starting."""
+        for task in self._warmups.values():
+            task.cancel()
+        await asyncio.gather(*self._warmups.values(), return_exceptions=True)
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "steps_ms": {name: round(seconds * 1000, 1) for name, seconds in self.seconds.items()},
+            "pending": sorted(name for name, task in self._warmups.items() if not task.done()),
+            "errors": self.errors,
+        }
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Nothing is built at import time. Building the services does no I/O; they connect below
+    # or on first use. Handlers reach them through the providers in src/api/dependencies.py.
+    startup = app.state.startup = StartupSteps()
+    started = time.perf_counter()
+    services = app.state.services = Services.from_settings()
+    await startup.run("tools.discover", asyncio.to_thread(services.tool_loader.discover))
+    await startup.run("app_config_cache.start", services.mongo_service.app_config_cache.start())
+    await startup.run("ltm_writer.start", services.ltm_writer.start())
+    await startup.run("session_manager.start", services.session_manager.start())
+    # MongoDB is usable as soon as the server answers, so index creation gates readiness;
+    # the OpenAI client and tool instances are also built on first use if a request beats them.
+    startup.warm_up("mongo.ensure_indexes", services.mongo_service.ensure_indexes(), gates_readiness=True)
+    startup.warm_up("llm_client.start", services.llm_client.start())
+    startup.warm_up("tools.startup", services.tool_loader.startup())
+    logger.info(f"Started in {(time.perf_counter() - started) * 1000:.1f} ms; warm-ups continue in the background.")
+    yield
+    await startup.cancel()
+    # Drain pending LTM writes and session updates first: they still need MongoDB.
+    await services.ltm_writer.stop()
+    await services.session_manager.stop()
+    await services.mongo_service.app_config_cache.stop()
+    services.tool_executor.shutdown()
+    await services.tool_loader.shutdown()
+    await services.llm_client.close()
+    services.mongo_service.close()
 
 app = FastAPI(
     title="InsightScribe Agent Service",
-    description="Orchestrates AI agents, tools, and memory for BI tasks."
+    description="Orchestrates AI agents, tools, and memory for BI tasks.",
+    lifespan=lifespan
 )
 
 app.add_middleware(RequestContextMiddleware)
@@ -67,3 +114,14 @@ app.include_router(admin_router.router, prefix="/admin", tags=["Admin"])
 async def root():
     logger.info("Health check endpoint accessed.")
     return {"status": "ok", "message": "InsightScribe Agent Service is running."}
+
+@app.get("/ready", tags=["Health Check"])
+async def ready():
+    """Readiness probe: 503 until the warm-ups that gate readiness have finished. Reports startup step timings."""
+    report = app.state.startup.report()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
+@app.get("/metrics", tags=["Health Check"], response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text exposition of the in-process metrics."""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
@@ -1,11 +1,14 @@
 from pydantic import BaseModel, Field
 from typing import List, Dict, Any, Optional
 
+# Upper bound for InitRequest.short_term_window; also the number of turns loaded per chat request.
+MAX_SHORT_TERM_WINDOW = 10
+
 class InitRequest(BaseModel):
     user_id: str
     app_id: str
     enable_long_term_write: bool = Field(default=True)
-    short_term_window: int = Field(default=3, ge=1, le=10)
+    short_term_window: int = Field(default=3, ge=1, le=MAX_SHORT_TERM_WINDOW)
 
 class InitResponse(BaseModel):
     session_id: str
@@ -29,6 +29,13 @@ class SessionMemory(BaseModel):
     user_id: str = Field(...)
     app_id: str = Field(...)
     conversation: List[ConversationTurn] = Field(default_factory=list)
+    conversation_layout: str = "embedded" # "embedded" or "bucketed" (turns stored in session_turns)
+    turn_count: int = 0
+    bucket_size: Optional[int] = None # Turns per session_turns document, for bucketed sessions
+    # Usage counters, maintained incrementally for analytics
+    query_count: int = 0
+    total_tokens: int = 0
+    last_query_at: Optional[datetime] = None
     ephemeral_state: Dict[str, Any] = Field(default_factory=dict)
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
@@ -0,0 +1,48 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+
+class TurnRecord:
+    """
+    Read-only view of a stored ConversationTurn, built straight from the BSON document
+    without validation. For internal hot paths; use ConversationTurn where data is written.
+    """
+    __slots__ = ("role", "text", "timestamp")
+
+    FIELDS = {"role": 1, "text": 1, "timestamp": 1}
+
+    def __init__(self, role: str, text: str, timestamp: datetime):
+        self.role = role
+        self.text = text
+        self.timestamp = timestamp
+
+    @classmethod
+    def from_doc(cls, doc: Dict[str, Any]) -> "TurnRecord":
+        return cls(doc["role"], doc["text"], doc["timestamp"])
+
+    def __repr__(self) -> str:
+        return f"TurnRecord(role={self.role!r}, timestamp={self.timestamp!r})"
+
+
+class LTMRecord:
+    """
+    Read-only view of a LongTermMemoryEntry with only the fields prompt assembly needs.
+    The _id stays a bson ObjectId and the embedding a plain list, neither re-validated.
+    """
+    __slots__ = ("id", "type", "content", "embedding", "created_at")
+
+    FIELDS = {"_id": 1, "type": 1, "content": 1, "embedding": 1, "created_at": 1}
+
+    def __init__(self, id: Any, type: str, content: Dict[str, Any], embedding: Optional[List[float]], created_at: datetime):
+        self.id = id
+        self.type = type
+        self.content = content
+        self.embedding = embedding
+        self.created_at = created_at
+
+    @classmethod
+    def from_doc(cls, doc: Dict[str, Any]) -> "LTMRecord":
+        return cls(doc["_id"], doc["type"], doc["content"], doc.get("embedding"), doc["created_at"])
+
+    def __repr__(self) -> str:
+        return f"LTMRecord(id={self.id!r}, type={self.type!r}, created_at={self.created_at!r})"
@@ -0,0 +1,41 @@
+import logging
+from contextvars import ContextVar
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+# ContextVars for request-specific data
+request_user_id: ContextVar[str | None] = ContextVar("request_user_id", default=None)
+request_session_id: ContextVar[str | None] = ContextVar("request_session_id", default=None)
+
+
+class RequestContextFilter(logging.Filter):
+    """Copies the request's user_id/session_id onto every record, defaulting to 'N/A'."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.user_id = request_user_id.get() or 'N/A'
+        record.session_id = request_session_id.get() or 'N/A'
+        return True
+
+
+class RequestContextMiddleware:
+    """
+    Pure ASGI middleware that gives each HTTP request a clean user_id/session_id context.
+    Unlike BaseHTTPMiddleware it does not run the endpoint in a separate task or relay the
+    response body through a stream, so values bound by the endpoint stay visible while an
+    SSE response is being sent and chunks reach the server without an extra hop.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        user_token = request_user_id.set(None)
+        session_token = request_session_id.set(None)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request_user_id.reset(user_token)
+            request_session_id.reset(session_token)
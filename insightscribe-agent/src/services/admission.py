@@ -0,0 +1,305 @@
+import asyncio
+import bisect
+import itertools
+import logging
+import math
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Hashable, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from ..config import settings
+from ..models.db_models import AppRepo
+from .cache import LRUTTLCache
+from .metrics import ADMISSION_DECISIONS, ADMISSION_QUEUE_DEPTH, ADMISSION_QUEUE_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Keys of the three concurrency limits a stream counts against
+SCOPE_USER = "user"
+SCOPE_APP = "app"
+SCOPE_WORKER = "worker"
+
+
+class AdmissionPolicy(BaseModel):
+    """
+    Per-app admission limits, configured under AppRepo config["admission"].
+    Unset keys fall back to Settings; 0 turns a limit off.
+    """
+    user_requests_per_minute: float = settings.ADMISSION_USER_REQUESTS_PER_MINUTE
+    user_burst: int = settings.ADMISSION_USER_BURST
+    app_requests_per_second: float = settings.ADMISSION_APP_REQUESTS_PER_SECOND
+    app_burst: int = settings.ADMISSION_APP_BURST
+    max_streams_per_user: int = settings.ADMISSION_MAX_STREAMS_PER_USER
+    max_streams_per_app: int = settings.ADMISSION_MAX_STREAMS_PER_APP
+    # How long a request may wait for a stream slot before it is turned away.
+    max_queue_wait_seconds: float = settings.ADMISSION_MAX_QUEUE_WAIT_SECONDS
+
+    @classmethod
+    def for_app(cls, app_config: AppRepo) -> "AdmissionPolicy":
+        return cls(**app_config.config.get("admission", {}))
+
+
+class AdmissionRejected(Exception):
+    """A chat stream was turned away. status_code is 429 for a tenant's own limits, 503 when the worker sheds load."""
+
+    def __init__(self, status_code: int, reason: str, retry_after_seconds: float):
+        super().__init__(f"Chat stream rejected: {reason}")
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after_seconds = max(1, math.ceil(retry_after_seconds))
+
+
+class TokenBucket:
+    """Refills at rate tokens per second up to burst."""
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, burst: float, now: float):
+        self.tokens = burst
+        self.updated = now
+
+    def wait_seconds(self, rate: float, burst: float, now: float) -> float:
+        """Refills the bucket and returns 0 if a token is available, otherwise how long until one is."""
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+
+class AdmissionTicket:
+    """A granted stream slot. release() must be called when the stream ends; extra calls are no-ops."""
+    __slots__ = ("_controller", "_keys", "queued_seconds")
+
+    def __init__(self, controller: "AdmissionController", keys: Tuple[Tuple[str, Hashable], ...], queued_seconds: float):
+        self._controller = controller
+        self._keys = keys
+        self.queued_seconds = queued_seconds
+
+    def release(self) -> None:
+        if self._keys:
+            keys, self._keys = self._keys, ()
+            self._controller._release(keys)
+
+
+class AdmissionController:
+    """
+    Decides whether a chat stream may start on this worker. All state is per worker process.
+
+    Requests are first checked against their user's and their app's rate-limit buckets;
+    an empty bucket is answered with 429 and the time until the next token. They then
+    need a stream slot under the per-user, per-app and per-worker caps, and draw their
+    tokens only once the slot is granted (a bucket drained meanwhile goes into debt).
+    When a cap is full they wait, FIFO per cap, in a queue bounded to queue_size requests
+    and for at most the app's max_queue_wait_seconds. Requests keep their arrival order:
+    a new request does not take a slot while older ones wait for that cap, and a woken
+    request that is blocked again, by another cap, keeps its place and hands its wake-up
+    to the next request in line.
+
+    The worker counts as overloaded while the 90th percentile of recent time-to-first-chunk
+    exceeds ttfc_slo_seconds. While it is, nothing queues, and the worker cap drops to
+    shed_factor of the streams open when the breach was detected so open streams recover
+    instead of every stream slowing down; new streams above it get 503.
+    """
+
+    def __init__(self, max_streams: int, queue_size: int, ttfc_slo_seconds: float, shed_factor: float,
+                 retry_after_seconds: float, slo_window_seconds: float = 30, slo_min_samples: int = 20,
+                 slo_max_samples: int = 1000, max_tracked_buckets: int = 100_000):
+        self.max_streams = max_streams
+        self.queue_size = queue_size
+        self.ttfc_slo_seconds = ttfc_slo_seconds
+        self.shed_factor = shed_factor
+        self.retry_after_seconds = retry_after_seconds
+        self.slo_window_seconds = slo_window_seconds
+        self.slo_min_samples = slo_min_samples
+        # Idle buckets are forgotten after an hour, which refills them.
+        self._buckets = LRUTTLCache(max_size=max_tracked_buckets, ttl_seconds=3600)
+        self._active: Dict[Tuple[str, Hashable], int] = {}
+        # Per cap, (arrival number, future) of the requests waiting for it, oldest first
+        self._waiters: Dict[Tuple[str, Hashable], List[Tuple[int, asyncio.Future]]] = {}
+        self._arrivals = itertools.count()
+        self._waiting = 0
+        self._ttfc_samples: Deque[Tuple[float, float]] = deque(maxlen=slo_max_samples)
+        self._shed_limit: Optional[int] = None # Worker cap while overloaded
+        self.decisions: Dict[str, int] = {}
+
+    async def acquire(self, user_id: str, app_config: AppRepo) -> AdmissionTicket:
+        """Returns a ticket for a new stream, waiting for a slot if needed. Raises AdmissionRejected."""
+        policy = AdmissionPolicy.for_app(app_config)
+        app_id = app_config.app_id
+        started = time.monotonic()
+        buckets = self._check_tokens(user_id, app_id, policy, started)
+
+        limits = (
+            ((SCOPE_USER, (app_id, user_id)), policy.max_streams_per_user),
+            ((SCOPE_APP, app_id), policy.max_streams_per_app),
+            ((SCOPE_WORKER, None), self.max_streams),
+        )
+        deadline = started + policy.max_queue_wait_seconds
+        arrival = next(self._arrivals)
+        queued = False
+        woken_on = None # The cap whose freed slot this request was woken for
+        while True:
+            overloaded = self._update_overload(time.monotonic())
+            blocked, full = self._blocked_on(limits, overloaded, arrival)
+            if blocked is None:
+                break
+            if woken_on is not None and (blocked != woken_on or not full):
+                # The freed slot is not usable by this request; the next one waiting for it may be able to.
+                self._wake(woken_on)
+            woken_on = None
+            scope = blocked[0]
+            if overloaded:
+                self._reject(503, "overloaded", self.retry_after_seconds)
+            if self._waiting >= self.queue_size:
+                self._reject(503, "queue_full", self.retry_after_seconds)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                # A tenant at its own cap is told to slow down; a full worker is unavailable.
+                self._reject(503 if scope == SCOPE_WORKER else 429, f"{scope}_streams", self.retry_after_seconds)
+
+            waiter = asyncio.get_running_loop().create_future()
+            entry = (arrival, waiter)
+            waiters = self._waiters.setdefault(blocked, [])
+            bisect.insort(waiters, entry, key=lambda e: e[0]) # A request woken earlier goes back to its place
+            self._waiting += 1
+            ADMISSION_QUEUE_DEPTH.set(self._waiting)
+            queued = True
+            try:
+                await asyncio.wait_for(waiter, remaining)
+            except asyncio.TimeoutError:
+                pass # Checked once more before giving up, in case a slot freed just now
+            except asyncio.CancelledError:
+                # The client left; a wake-up already handed to it goes to the next request in line.
+                if waiter.done() and not waiter.cancelled():
+                    self._wake(blocked)
+                raise
+            finally:
+                self._waiting -= 1
+                ADMISSION_QUEUE_DEPTH.set(self._waiting)
+                head = waiters[0] is entry
+                waiters.remove(entry)
+                if head and waiters:
+                    # Requests queued only because this one was ahead of them may go now.
+                    self._wake(blocked)
+                if not waiters and self._waiters.get(blocked) is waiters:
+                    del self._waiters[blocked]
+            if waiter.done() and not waiter.cancelled():
+                woken_on = blocked
+
+        # Tokens are drawn only now, so a request rejected at any step above costs nothing.
+        for bucket in buckets:
+            bucket.take()
+        keys = tuple(key for key, _ in limits)
+        for key in keys:
+            self._active[key] = self._active.get(key, 0) + 1
+        queued_seconds = time.monotonic() - started
+        if queued:
+            ADMISSION_QUEUE_WAIT_SECONDS.observe(queued_seconds)
+        self._count("queued" if queued else "admitted")
+        return AdmissionTicket(self, keys, queued_seconds)
+
+    def _check_tokens(self, user_id: str, app_id: str, policy: AdmissionPolicy, now: float) -> List[TokenBucket]:
+        """Returns the request's rate-limit buckets, rejecting it if either is empty. Nothing is drawn yet."""
+        buckets = []
+        if policy.user_requests_per_minute > 0:
+            buckets.append((("user", app_id, user_id), policy.user_requests_per_minute / 60, max(1, policy.user_burst)))
+        if policy.app_requests_per_second > 0:
+            buckets.append((("app", app_id), policy.app_requests_per_second, max(1, policy.app_burst)))
+        checked = []
+        for key, rate, burst in buckets:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(burst, now)
+                self._buckets.set(key, bucket)
+            wait = bucket.wait_seconds(rate, burst, now)
+            if wait > 0:
+                self._reject(429, f"{key[0]}_rate_limited", wait)
+            checked.append(bucket)
+        return checked
+
+    def _blocked_on(self, limits, overloaded: bool, arrival: int) -> Tuple[Optional[Tuple[str, Hashable]], bool]:
+        """
+        Returns the first cap the request must wait for, and whether that cap is full (as
+        opposed to having older requests waiting for it), or (None, False) if it may start.
+        """
+        for key, limit in limits:
+            if key[0] == SCOPE_WORKER and overloaded:
+                limit = self._shed_limit
+            if limit > 0 and self._active.get(key, 0) >= limit:
+                return key, True
+            waiters = self._waiters.get(key)
+            if waiters and waiters[0][0] < arrival:
+                return key, False
+        return None, False
+
+    def _release(self, keys: Tuple[Tuple[str, Hashable], ...]) -> None:
+        for key in keys:
+            count = self._active.get(key, 0) - 1
+            if count > 0:
+                self._active[key] = count
+            else:
+                self._active.pop(key, None)
+            self._wake(key)
+
+    def _wake(self, key: Tuple[str, Hashable]) -> None:
+        """
+        Wakes the longest-waiting request blocked on key that is not awake yet. It stays in
+        line until it runs, so a request arriving meanwhile cannot take its slot.
+        """
+        for _, waiter in self._waiters.get(key, ()):
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+    def _reject(self, status_code: int, reason: str, retry_after_seconds: float) -> None:
+        self._count(reason)
+        raise AdmissionRejected(status_code, reason, retry_after_seconds)
+
+    def _count(self, outcome: str) -> None:
+        self.decisions[outcome] = self.decisions.get(outcome, 0) + 1
+        ADMISSION_DECISIONS.inc(outcome=outcome)
+
+    def observe_first_chunk(self, seconds: float) -> None:
+        """Records a stream's time to first chunk, queueing included; the overload check uses the recent ones."""
+        self._ttfc_samples.append((time.monotonic(), seconds))
+
+    def _ttfc_p90(self, now: float) -> Optional[float]:
+        while self._ttfc_samples and self._ttfc_samples[0][0] < now - self.slo_window_seconds:
+            self._ttfc_samples.popleft()
+        if len(self._ttfc_samples) < self.slo_min_samples:
+            return None
+        values = sorted(seconds for _, seconds in self._ttfc_samples)
+        return values[int(len(values) * 0.9) - 1]
+
+    def _update_overload(self, now: float) -> bool:
+        if self.ttfc_slo_seconds <= 0:
+            return False
+        p90 = self._ttfc_p90(now)
+        overloaded = p90 is not None and p90 > self.ttfc_slo_seconds
+        if overloaded and self._shed_limit is None:
+            active = self._active.get((SCOPE_WORKER, None), 0)
+            self._shed_limit = max(1, int(active * self.shed_factor))
+            logger.warning(f"Time to first chunk p90 {p90:.2f}s exceeds the {self.ttfc_slo_seconds}s SLO; "
+                           f"shedding new streams above {self._shed_limit} (open: {active}).")
+        elif not overloaded and self._shed_limit is not None:
+            logger.info("Time to first chunk is back within the SLO; no longer shedding.")
+            self._shed_limit = None
+        return overloaded
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "active_streams": self._active.get((SCOPE_WORKER, None), 0),
+            "max_streams": self.max_streams,
+            "waiting": self._waiting,
+            "queue_size": self.queue_size,
+            "overloaded": self._update_overload(now),
+            "shed_limit": self._shed_limit,
+            "ttfc_p90_seconds": self._ttfc_p90(now),
+            "ttfc_slo_seconds": self.ttfc_slo_seconds,
+            "tracked_buckets": len(self._buckets),
+            "decisions": dict(self.decisions),
+        }
@@ -1,151 +1,396 @@
+import asyncio
 import json
 import time
-from typing import AsyncGenerator, Dict, Any
+from typing import AsyncGenerator, Dict, Any, List, Optional, Tuple
 import logging
 
-from ..models.db_models import SessionMemory, AppRepo, LongTermMemoryEntry
-from ..services.mongo_service import mongo_service
-from ..services.session_service import session_manager
-from ..services.tool_loader import tool_loader
+from ..models.db_models import SessionMemory, AppRepo
+from ..services.context_builder import ContextBuilder, ContextPolicy, PromptContext
+from ..services.mongo_service import MongoService
+from ..services.tool_executor import ToolExecutor
+from ..services.llm_client import LLMClient, LLMRun, TERMINAL_RUN_STATUSES
+from ..services.ltm_writer import LTMWriter, LTMWriteRequest
+from ..services.session_service import SessionManager
+from ..services.response_cache import ResponseCache, ResponseCachePolicy, ResponseLookup
+from ..services.tool_loader import ToolLoader
+from ..services.tokens import estimate_tokens
+from ..services.metrics import (
+    AGENT_CANCELLED_AFTER_SECONDS, AGENT_CANCELLED_RUNS, AGENT_CANCELLED_WORK,
+    LLM_ROUND_TRIPS, LLM_TIME_TO_FIRST_TOKEN_SECONDS, StageTimer
+)
 from ..config import settings
 
-# Placeholder for the actual OpenAI client
-# from openai import OpenAI
-# client = OpenAI(api_key=settings.OPENAI_API_KEY)
-
 logger = logging.getLogger(__name__)
 
+# Values for AppRepo.config["run_mode"] (default: RUN_MODE setting)
+RUN_MODE_STREAM = "stream" # Consume run events as they arrive
+RUN_MODE_POLL = "poll" # Poll run status with backoff; fallback for backends without streaming
+
+# Upstream cancel requests still in flight; holds references so the tasks aren't garbage collected.
+_upstream_cancellations = set()
+
 class AgentOrchestrator:
     """
     Orchestrates the agent's reasoning loop, including RAG, tool use,
     and streaming responses using the OpenAI Assistants API pattern.
     """
-    def __init__(self, session: SessionMemory, app_config: AppRepo):
+    def __init__(self, session: SessionMemory, app_config: AppRepo, *, llm_client: LLMClient,
+                 mongo_service: MongoService, session_manager: SessionManager, tool_loader: ToolLoader,
+                 tool_executor: ToolExecutor, ltm_writer: LTMWriter, response_cache: ResponseCache,
+                 context_builder: ContextBuilder):
         self.session = session
         self.app_config = app_config
-        self.tools = tool_loader.load_tools(app_config.allowed_tools)
+        self.llm_client = llm_client
+        self.mongo_service = mongo_service
+        self.session_manager = session_manager
+        self.tool_loader = tool_loader
+        self.tool_executor = tool_executor
+        self.ltm_writer = ltm_writer
+        self.response_cache = response_cache
+        self.context_builder = context_builder
 
     async def run(self, message: str) -> AsyncGenerator[Dict[str, Any], None]:
         """
         Main execution loop for an agentic turn. Yields events for streaming.
+        Each stage is timed; with `debug_timing` set in the AppRepo config the
+        per-stage breakdown is also sent as a `timing` event. With `response_cache`
+        enabled, a stored answer to the same (or a similar enough) question is replayed
+        after a `cache_hit` status instead of running the assistant.
+
+        If the client disconnects, the consuming task is cancelled (or this generator is
+        closed) wherever the turn is waiting: pending tool calls are aborted, the upstream
+        run is cancelled, and nothing more is yielded.
         """
+        timer = StageTimer()
+        turn = RunTurn(self.app_config.config.get("run_mode", settings.RUN_MODE))
+        cache_policy = ResponseCachePolicy.for_app(self.app_config)
         try:
-            # 1. --- Prepare Context (RAG + STM) ---
-            yield {"event": "status", "data": "Retrieving context..."}
-            ltm_entries = await mongo_service.get_ltm_for_user(self.session.user_id, self.session.app_id)
-            stm_history = await session_manager.get_conversation_history(
-                self.session.session_id,
-                self.session.ephemeral_state.get("short_term_window", 3)
-            )
-            # You would format ltm_entries and stm_history into the prompt/messages
-            logger.info(f"Retrieved LTM entries: {[e.content for e in ltm_entries]}")
-            logger.info(f"Retrieved STM history: {[t.text for t in stm_history]}")
-            logger.debug(f"Agent orchestrator received message: '{message}'")
-            
-            # 2. --- Interact with OpenAI Assistants API ---
-            # This is a simulation of the Assistants API flow.
-            # See references for actual implementation details.
-
-            # Step A: Get or create a thread for the session
-            thread_id = self.session.ephemeral_state.get("openai_thread_id")
-            if not thread_id:
-                # thread = client.beta.threads.create()
-                thread_id = f"fake_thread_{self.session.session_id}"
-                await mongo_service.update_session_state(self.session.session_id, {"ephemeral_state.openai_thread_id": thread_id})
-                yield {"event": "status", "data": "Created new conversation thread."}
-                logger.info(f"Created new OpenAI thread: {thread_id}")
-            logger.info(f"Using OpenAI thread_id: {thread_id}")
+            lookup = None
+            if cache_policy.enabled:
+                with timer.stage("response_cache_lookup"):
+                    lookup = await self.response_cache.lookup(self.app_config, self.session.user_id, message, cache_policy)
+
+            if lookup is not None and lookup.events is not None:
+                # Replay the stored answer, then add the exchange to the thread so follow-ups keep their context.
+                yield {"event": "status", "data": "cache_hit"}
+                for event in lookup.events:
+                    yield event
+                turn.cache_match = lookup.match
+                turn.response_text = "".join(e["data"] for e in lookup.events if e["event"] == "message_chunk")
+                thread_id, created = await self._get_thread(timer)
+                if created:
+                    yield {"event": "status", "data": "Created new conversation thread."}
+                with timer.stage("thread_sync"):
+                    await self.llm_client.add_message(thread_id, message)
+                    await self.llm_client.add_message(thread_id, turn.response_text, role="assistant")
+            else:
+                # 1. --- Prepare Context (RAG + STM) ---
+                yield {"event": "status", "data": "Retrieving context..."}
+                context_policy = ContextPolicy.for_app(self.app_config)
+                query_embedding = lookup.embedding if lookup is not None else None
+                with timer.stage("ltm_retrieval"):
+                    if query_embedding is None and settings.EMBEDDING_MODEL:
+                        try:
+                            query_embedding = (await self.llm_client.embed([message]))[0]
+                        except Exception as e:
+                            logger.warning(f"Could not embed message for LTM retrieval, using recent entries: {e}")
+                    ltm_entries = await self.mongo_service.get_ltm_for_user(
+                        self.session.user_id, self.session.app_id, limit=context_policy.ltm_candidates,
+                        query_embedding=query_embedding, raw=True)
+                with timer.stage("stm_history"):
+                    # The router loaded the session with its recent turns already, so no second read is needed.
+                    # Its last turn is this message, which the run gets from the thread, so it is left out.
+                    stm_history = self.session.conversation[:-1][-self.session.ephemeral_state.get("short_term_window", 3):]
+                with timer.stage("context_assembly"):
+                    context = self.context_builder.build(self.session.session_id, message, ltm_entries, stm_history,
+                                                    context_policy, query_embedding)
+                turn.context = context
+                logger.info(f"Prompt context: {context.tokens} tokens, {len(context.ltm_entries)} LTM entries, "
+                            f"{len(context.stm_turns)} turns ({context.truncated} truncated, {context.dropped} dropped)")
+                logger.debug(f"Agent orchestrator received message: '{message}'")
+
+                # 2. --- Interact with the Assistants API ---
+                if not self.app_config.assistant_id:
+                    raise ValueError(f"App '{self.app_config.app_id}' has no assistant_id configured.")
+
+                # Step A: Get or create a thread for the session
+                thread_id, created = await self._get_thread(timer)
+                if created:
+                    yield {"event": "status", "data": "Created new conversation thread."}
+                turn.thread_id = thread_id
+
+                # Step B: Run the assistant on the thread, streaming its events or polling its status.
+                yield {"event": "status", "data": "Thinking..."}
+                drive = self._poll_run if turn.mode == RUN_MODE_POLL else self._stream_run
+                answer_events = []
+                async for event in drive(thread_id, message, timer, turn):
+                    answer_events.append(event)
+                    yield event
+                turn.observe()
+                if lookup is not None:
+                    # The run saw the user's LTM entries and the turns kept in context, so an answer built on either is theirs.
+                    self._remember_answer(lookup, cache_policy, answer_events,
+                                          personalized=bool(context.ltm_entries or context.stm_turns))
+
+            # Fall back to an estimate when the backend reports no usage; replayed answers cost no model tokens.
+            with timer.stage("usage_recording"):
+                if turn.cache_match:
+                    run_tokens = 0
+                else:
+                    run_tokens = turn.total_tokens or estimate_tokens(message) + estimate_tokens(turn.response_text)
+                await self.session_manager.record_run_usage(self.session.session_id, self.session.app_id, run_tokens)
+
+            # 3. --- Persist Memory ---
+            # Summarizing and storing happen in the background writer, after the stream has ended.
+            if self.session.ephemeral_state.get("enable_ltm_write"):
+                turn.ltm_write_submitted = True
+                queued = self.ltm_writer.submit(LTMWriteRequest(
+                    user_id=self.session.user_id,
+                    app_id=self.app_config.app_id,
+                    session_id=self.session.session_id,
+                    message=message,
+                    response_text=turn.response_text
+                ))
+                if queued:
+                    yield {"event": "status", "data": "Queued for long-term memory."}
+                    logger.info("Long-term memory write queued.")
 
-            # Step B: Add user message to the thread
-            # client.beta.threads.messages.create(thread_id=thread_id, role="user", content=message)
-            logger.debug(f"Added user message to thread: '{message}'")
-            
-            # Step C: Create a run
-            yield {"event": "status", "data": "Thinking..."}
-            logger.info("Initiating agent run.")
-            # run = client.beta.threads.runs.create(
-            #     thread_id=thread_id,
-            #     assistant_id=self.app_config.assistant_id # Store assistant_id in AppRepo
-            # )
-            
-            # Step D: Poll the run status and handle tool calls (the "Error Loop")
-            while True: # Keep polling until the run is completed or failed
-                # run = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
-                run_status = "requires_action" # MOCK STATUS
-                
-                if run_status == "requires_action":
-                    logger.info("Agent requires action: tool call detected.")
-                    # MOCK TOOL CALLS
-                    required_actions = {
-                        "tool_calls": [
-                            {"id": "call_abc", "function": {"name": "ExecuteBIQueryTool", "arguments": '{"query_string": "top 5 denial reasons"}'}}
-                        ]
-                    }
-                    yield {"event": "tool_call", "data": {"tool_name": "ExecuteBIQueryTool", "params": json.loads(required_actions["tool_calls"][0]["function"]["arguments"])}}
-                    
-                    tool_outputs = []
-                    for tool_call in required_actions["tool_calls"]:
-                        tool_name = tool_call["function"]["name"]
-                        tool_params = json.loads(tool_call["function"]["arguments"])
-                        
-                        if tool_name in self.tools:
-                            tool_instance = self.tools[tool_name]
-                            try:
-                                # Assuming tools have a 'run' method that returns an object with a 'summary' attribute
-                                result = tool_instance.execute(**tool_params) # Changed from .run to .execute
-                                tool_outputs.append({"tool_call_id": tool_call["id"], "output": json.dumps(result)}) # Assuming result is dict/json serializable
-                                logger.info(f"Tool '{tool_name}' executed successfully with result: {result}")
-                            except Exception as e:
-                                tool_outputs.append({"tool_call_id": tool_call["id"], "output": f"Error: {str(e)}"})
-                                logger.error(f"Error executing tool '{tool_name}': {e}", exc_info=True)
-                        else:
-                            tool_outputs.append({"tool_call_id": tool_call["id"], "output": f"Error: Tool '{tool_name}' not found."})
-                            logger.warning(f"Tool '{tool_name}' not found in allowed tools.")
-                    
-                    # Submit tool outputs back to the run
-                    # client.beta.threads.runs.submit_tool_outputs(thread_id=thread_id, run_id=run.id, tool_outputs=tool_outputs)
-                    logger.info("Submitted tool outputs.")
-                    
-                    run_status = "completed" # MOCK status change after submitting
-                    time.sleep(1) # Simulate network latency
-                
-                elif run_status == "completed":
-                    logger.info("Agent run completed. Retrieving response.")
-                    # messages = client.beta.threads.messages.list(thread_id=thread_id)
-                    # agent_response_text = messages.data[0].content[0].text.value
-                    agent_response_text = "Here are the results based on your query. I have used the ExecuteBIQuery tool."
-                    
-                    # Stream the final response
-                    for char in agent_response_text:
-                        yield {"event": "message_chunk", "data": char}
-                        time.sleep(0.02) # Simulate token streaming
-                    
-                    # 5. --- Persist Memory ---
-                    if self.session.ephemeral_state.get("enable_ltm_write"):
-                        logger.info("Long-term memory write enabled. Persisting summary.")
-                        # In a real system, a separate summarizer agent would create this.
-                        ltm_summary_content = {"text": f"User asked '{message}' and received a response about BI query results."}
-                        ltm_entry = LongTermMemoryEntry(
-                            user_id=self.session.user_id,
-                            app_id=self.app_config.app_id,
-                            type="summary",
-                            content=ltm_summary_content
-                        )
-                        await mongo_service.add_ltm_entry(ltm_entry)
-                        yield {"event": "status", "data": "Saved to long-term memory."}
-                        logger.info("Long-term memory entry saved.")
-
-                    break # Exit the polling loop
-
-                elif run_status in ["failed", "cancelled", "expired"]:
-                    logger.error(f"Agent run failed, cancelled, or expired with status: {run_status}")
-                    raise Exception(f"Run failed with status: {run_status}")
-                
-                time.sleep(0.5) # Wait before polling again
+            if self.app_config.config.get("debug_timing"):
+                yield {"event": "timing", "data": {**timer.summary(), **turn.summary()}}
 
+        except (asyncio.CancelledError, GeneratorExit):
+            self._abandon(turn)
+            raise
         except Exception as e:
             logger.error(f"Agent orchestration error: {e}", exc_info=True)
             yield {"event": "error", "data": str(e)}
         finally:
             logger.info("Agent orchestration stream finished.")
-            yield {"event": "done", "data": "Stream finished."}
+        # Outside the finally: a cancelled or closed generator must not yield again.
+        yield {"event": "done", "data": "Stream finished."}
+
+    async def _get_thread(self, timer: StageTimer) -> Tuple[str, bool]:
+        """Returns the session's thread id, creating the thread on first use, and whether it was just created."""
+        thread_id = self.session.ephemeral_state.get("openai_thread_id")
+        if thread_id:
+            logger.info(f"Using OpenAI thread_id: {thread_id}")
+            return thread_id, False
+        with timer.stage("thread_creation"):
+            thread_id = await self.llm_client.create_thread()
+            # Conditional, so two first messages racing on different workers end up on one thread.
+            stored = await self.session_manager.set_ephemeral_state_if_absent(self.session.session_id, "openai_thread_id", thread_id)
+        self.session.ephemeral_state["openai_thread_id"] = stored
+        if stored != thread_id:
+            logger.info(f"Another request created thread {stored} first; using it instead of {thread_id}.")
+            return stored, False
+        logger.info(f"Created new OpenAI thread: {thread_id}")
+        return thread_id, True
+
+    def _remember_answer(self, lookup: ResponseLookup, policy: ResponseCachePolicy, events: List[Dict[str, Any]], personalized: bool) -> None:
+        """Stores a completed answer in the response cache when it is safe to reuse."""
+        if policy.standalone_only and len(self.session.conversation) > 1:
+            return
+        tool_calls = [event["data"] for event in events if event["event"] == "tool_call"]
+        if any(call["status"] != "ok" for call in tool_calls) or not any(event["event"] == "message_chunk" for event in events):
+            return
+        # An answer lives no longer than the shortest-lived cached tool result it was built from.
+        ttl_seconds = policy.ttl_seconds
+        for call in tool_calls:
+            tool_cls = self.tool_loader.get_tool_class(call["tool_name"])
+            if tool_cls is not None and tool_cls.cache_ttl_seconds:
+                ttl_seconds = min(ttl_seconds, tool_cls.cache_ttl_seconds)
+        # Consecutive chunks are kept as one; the coalescer reframes them on replay anyway.
+        stored = []
+        for event in events:
+            if event["event"] == "message_chunk" and stored and stored[-1]["event"] == "message_chunk":
+                stored[-1] = {"event": "message_chunk", "data": stored[-1]["data"] + event["data"]}
+            else:
+                stored.append(event)
+        self.response_cache.store(self.app_config, self.session.user_id, lookup, stored, policy, ttl_seconds, personalized)
+
+    def _abandon(self, turn: "RunTurn") -> None:
+        """
+        Bookkeeping for a turn whose client went away. Runs while the task is being
+        cancelled, so it must not await; the upstream cancel is sent from its own task.
+        """
+        logger.info(f"Client disconnected {turn.elapsed_seconds():.2f}s into the turn; abandoning it.")
+        AGENT_CANCELLED_AFTER_SECONDS.observe(turn.elapsed_seconds(), mode=turn.mode)
+        if self.session.ephemeral_state.get("enable_ltm_write") and not turn.ltm_write_submitted:
+            AGENT_CANCELLED_WORK.inc(kind="ltm_write")
+        if turn.run_id is None:
+            AGENT_CANCELLED_RUNS.inc(mode=turn.mode, upstream="not_started")
+        elif turn.run_status in TERMINAL_RUN_STATUSES:
+            AGENT_CANCELLED_RUNS.inc(mode=turn.mode, upstream="finished")
+        else:
+            task = asyncio.create_task(self._cancel_upstream_run(turn))
+            _upstream_cancellations.add(task)
+            task.add_done_callback(_upstream_cancellations.discard)
+
+    async def _cancel_upstream_run(self, turn: "RunTurn") -> None:
+        try:
+            run = await self.llm_client.cancel_run(turn.thread_id, turn.run_id)
+        except Exception as e:
+            # Usually the run reached a terminal status before the cancel arrived.
+            logger.warning(f"Could not cancel upstream run {turn.run_id}: {e}")
+            AGENT_CANCELLED_RUNS.inc(mode=turn.mode, upstream="cancel_failed")
+            return
+        logger.info(f"Cancelled upstream run {turn.run_id} (status: {run.status}).")
+        AGENT_CANCELLED_RUNS.inc(mode=turn.mode, upstream="cancelled")
+        AGENT_CANCELLED_WORK.inc(kind="upstream_run")
+
+    async def _run_tool_round(self, run: LLMRun, timer: StageTimer, tool_outputs: List[Dict[str, str]]) -> AsyncGenerator[Dict[str, Any], None]:
+        """Executes one requires_action round, yielding tool events and filling tool_outputs."""
+        logger.info("Agent requires action: tool call detected.")
+        tool_names = ", ".join(call["function"]["name"] for call in run.tool_calls)
+        yield {"event": "status", "data": f"Running tools: {tool_names}"}
+
+        # All calls of this round run concurrently; outcomes come back in call order.
+        with timer.stage("tool_execution"):
+            outcomes = await self.tool_executor.run_tool_calls(self.app_config.allowed_tools, run.tool_calls, self.app_config.app_id)
+        for outcome in outcomes:
+            yield {"event": "tool_call", "data": {
+                "tool_name": outcome["tool_name"],
+                "params": outcome["params"],
+                "status": outcome["status"],
+                "cached": outcome["cached"],
+                "duration_ms": outcome["duration_ms"]
+            }}
+            tool_outputs.append({"tool_call_id": outcome["tool_call_id"], "output": outcome["output"]})
+
+    async def _poll_run(self, thread_id: str, message: str, timer: StageTimer, turn: "RunTurn") -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Polling mode: drives the run as a state machine until it reaches a terminal status.
+        Every wait is an asyncio sleep so other streams on this worker keep running.
+        """
+        with timer.stage("run_creation"):
+            await self.llm_client.add_message(thread_id, message)
+            run = await self.llm_client.create_run(thread_id, self.app_config.assistant_id, turn.instructions(), turn.last_messages())
+        turn.round_trips += 2
+        logger.info(f"Initiated agent run {run.id}.")
+
+        poll_interval = settings.RUN_POLL_INITIAL_INTERVAL_SECONDS
+        while True:
+            turn.track(run)
+            if run.status in ("queued", "in_progress"):
+                with timer.stage("run_polling"):
+                    await asyncio.sleep(poll_interval)
+                    poll_interval = min(poll_interval * settings.RUN_POLL_BACKOFF_FACTOR, settings.RUN_POLL_MAX_INTERVAL_SECONDS)
+                    run = await self.llm_client.retrieve_run(thread_id, run.id)
+                turn.round_trips += 1
+
+            elif run.status == "requires_action":
+                tool_outputs = []
+                async for event in self._run_tool_round(run, timer, tool_outputs):
+                    yield event
+                with timer.stage("tool_output_submission"):
+                    run = await self.llm_client.submit_tool_outputs(thread_id, run.id, tool_outputs)
+                turn.round_trips += 1
+                logger.info("Submitted tool outputs.")
+                # A new tool round restarts the backoff so its result is picked up promptly.
+                poll_interval = settings.RUN_POLL_INITIAL_INTERVAL_SECONDS
+
+            elif run.status == "completed":
+                logger.info("Agent run completed. Retrieving response.")
+                with timer.stage("response_retrieval"):
+                    turn.response_text = await self.llm_client.get_response_text(thread_id, run.id)
+                turn.round_trips += 1
+                turn.mark_first_token()
+                turn.total_tokens = run.total_tokens
+                with timer.stage("response_streaming"):
+                    yield {"event": "message_chunk", "data": turn.response_text}
+                return
+
+            elif run.status in TERMINAL_RUN_STATUSES:
+                logger.error(f"Agent run ended with status: {run.status} ({run.last_error})")
+                raise Exception(f"Run failed with status: {run.status}")
+
+            else:
+                raise Exception(f"Unexpected run status: {run.status}")
+
+    async def _stream_run(self, thread_id: str, message: str, timer: StageTimer, turn: "RunTurn") -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Streaming mode: consumes run events as they arrive and forwards text deltas straight
+        to the client. A stream ends when the run finishes or needs tool outputs; submitting
+        the outputs opens the next stream, so no time is spent waiting between status checks.
+        """
+        with timer.stage("run_creation"):
+            await self.llm_client.add_message(thread_id, message)
+        events = self.llm_client.stream_run(thread_id, self.app_config.assistant_id, turn.instructions(), turn.last_messages())
+        turn.round_trips += 2
+        chunks = []
+        while True:
+            run = None
+            with timer.stage("run_streaming"):
+                async for event in events:
+                    if event.text is not None:
+                        turn.mark_first_token()
+                        chunks.append(event.text)
+                        yield {"event": "message_chunk", "data": event.text}
+                    else:
+                        run = event.run
+                        turn.track(run)
+            if run is None:
+                raise Exception("Run stream ended without reporting a run status.")
+
+            if run.status == "requires_action":
+                tool_outputs = []
+                async for event in self._run_tool_round(run, timer, tool_outputs):
+                    yield event
+                events = self.llm_client.stream_tool_outputs(thread_id, run.id, tool_outputs)
+                turn.round_trips += 1
+                logger.info("Submitted tool outputs.")
+            elif run.status == "completed":
+                logger.info(f"Agent run {run.id} completed.")
+                turn.response_text = "".join(chunks)
+                turn.total_tokens = run.total_tokens
+                return
+            else:
+                logger.error(f"Agent run ended with status: {run.status} ({run.last_error})")
+                raise Exception(f"Run failed with status: {run.status}")
+
+
+class RunTurn:
+    """Per-turn run bookkeeping: which run, what it produced, and how long the first token took."""
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.thread_id: Optional[str] = None
+        self.run_id: Optional[str] = None
+        self.run_status: Optional[str] = None # Last status seen, to tell whether the run still needs cancelling
+        self.round_trips = 0 # Assistants API calls made for this turn
+        self.response_text = ""
+        self.total_tokens: Optional[int] = None
+        self.cache_match: Optional[str] = None # "exact" or "semantic" when the answer was replayed from the response cache
+        self.context: Optional[PromptContext] = None # Memory sent with the run, and the turns it keeps
+        self.ltm_write_submitted = False # Set once the turn was handed to the LTM writer, whatever it then did with it
+        self._started = time.perf_counter()
+        self.ttft_seconds: Optional[float] = None
+
+    def track(self, run: LLMRun) -> None:
+        self.run_id = run.id
+        self.run_status = run.status
+
+    def instructions(self) -> Optional[str]:
+        return self.context.instructions if self.context is not None and self.context.instructions else None
+
+    def last_messages(self) -> Optional[int]:
+        return self.context.last_messages if self.context is not None else None
+
+    def elapsed_seconds(self) -> float:
+        return time.perf_counter() - self._started
+
+    def mark_first_token(self) -> None:
+        if self.ttft_seconds is None:
+            self.ttft_seconds = self.elapsed_seconds()
+
+    def observe(self) -> None:
+        LLM_ROUND_TRIPS.observe(self.round_trips, mode=self.mode)
+        if self.ttft_seconds is not None:
+            LLM_TIME_TO_FIRST_TOKEN_SECONDS.observe(self.ttft_seconds, mode=self.mode)
+
+    def summary(self) -> Dict[str, Any]:
+        ttft_ms = round(self.ttft_seconds * 1000, 2) if self.ttft_seconds is not None else None
+        summary = {"run_mode": self.mode, "round_trips": self.round_trips, "ttft_ms": ttft_ms, "cache_match": self.cache_match}
+        if self.context is not None:
+            summary.update(self.context.summary())
+        return summary
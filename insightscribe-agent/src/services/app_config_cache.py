@@ -0,0 +1,179 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from ..models.db_models import AppRepo
+from .cache import LRUTTLCache, SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Server error codes meaning change streams are unavailable (standalone mongod, unsupported storage engine).
+CHANGE_STREAM_UNSUPPORTED_CODES = {40573, 40324, 303}
+# Each poll re-reads this much before the newest updated_at seen, for writers whose clocks lag behind.
+POLL_OVERLAP = timedelta(seconds=5)
+
+
+class AppConfigCache:
+    """
+    Caches parsed AppRepo documents per app_id.
+
+    Entries are bounded by LRU size and a TTL. Writes to the app_repo collection
+    are picked up through a change stream; when the deployment does not support
+    change streams (standalone mongod), the cache polls instead: documents whose
+    updated_at moved past the newest one already seen (less a small overlap, since
+    updated_at comes from the writers' clocks) are invalidated, and cached app_ids that
+    no longer exist are evicted. Writes that do not bump updated_at are invisible to polling; the TTL
+    bounds staleness for anything neither mechanism sees.
+    Cached AppRepo objects are shared between requests and must not be mutated.
+    """
+
+    def __init__(
+        self,
+        collection,
+        loader: Callable[[str], Awaitable[Optional[AppRepo]]],
+        max_size: int,
+        ttl_seconds: float,
+        poll_interval_seconds: float,
+    ):
+        self.collection = collection
+        self._loader = loader
+        self._cache = LRUTTLCache(max_size=max_size, ttl_seconds=ttl_seconds)
+        self._single_flight = SingleFlight()
+        self._poll_interval_seconds = poll_interval_seconds
+        self._generation = 0
+        self._app_ids_by_doc_id: Dict[Any, str] = {}
+        self._doc_ids_by_app_id: Dict[str, Any] = {}
+        self._watch_task: Optional[asyncio.Task] = None
+        self.invalidation_mode = "none"
+        self.invalidations = 0
+
+    async def get(self, app_id: str) -> Optional[AppRepo]:
+        app_config = self._cache.get(app_id)
+        if app_config is not None:
+            return app_config
+        return await self._single_flight.do(app_id, lambda: self._load(app_id))
+
+    async def _load(self, app_id: str) -> Optional[AppRepo]:
+        generation = self._generation
+        app_config = await self._loader(app_id)
+        # Skip caching if an invalidation arrived while the document was being read.
+        if app_config is not None and generation == self._generation:
+            self._cache.set(app_id, app_config)
+            self._app_ids_by_doc_id[app_config.id] = app_id
+            self._doc_ids_by_app_id[app_id] = app_config.id
+        return app_config
+
+    def invalidate(self, app_id: Optional[str] = None) -> None:
+        """Drops one app_id, or every entry when app_id is None."""
+        self._generation += 1
+        self.invalidations += 1
+        if app_id is None:
+            self._cache.clear()
+            self._app_ids_by_doc_id.clear()
+            self._doc_ids_by_app_id.clear()
+            return
+        self._cache.invalidate(app_id)
+        doc_id = self._doc_ids_by_app_id.pop(app_id, None)
+        if doc_id is not None:
+            self._app_ids_by_doc_id.pop(doc_id, None)
+        self._single_flight.forget(app_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._cache.stats(),
+            "coalesced_misses": self._single_flight.coalesced,
+            "invalidations": self.invalidations,
+            "invalidation_mode": self.invalidation_mode,
+        }
+
+    async def start(self) -> None:
+        """Starts background invalidation. Safe to call more than once."""
+        if self._watch_task is None or self._watch_task.done():
+            self._watch_task = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None:
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
+
+    async def _watch(self) -> None:
+        retry_delay = 1.0
+        while True:
+            try:
+                async with self.collection.watch(full_document="updateLookup") as stream:
+                    self.invalidation_mode = "change_stream"
+                    logger.info("Watching 'app_repo' change stream for AppRepo cache invalidation.")
+                    # Anything written before the stream opened may already be cached.
+                    self.invalidate()
+                    retry_delay = 1.0
+                    async for change in stream:
+                        self._handle_change(change)
+            except OperationFailure as e:
+                if e.code in CHANGE_STREAM_UNSUPPORTED_CODES:
+                    logger.info(f"Change streams unavailable ({e.code}); polling 'app_repo' every {self._poll_interval_seconds}s.")
+                    await self._poll()
+                    return
+                logger.warning(f"AppRepo change stream failed: {e}. Retrying in {retry_delay}s.")
+            except PyMongoError as e:
+                logger.warning(f"AppRepo change stream interrupted: {e}. Retrying in {retry_delay}s.")
+            # Changes may have been missed while the stream was down.
+            self.invalidation_mode = "none"
+            self.invalidate()
+            await asyncio.sleep(retry_delay)
+            retry_delay = min(retry_delay * 2, 30.0)
+
+    def _handle_change(self, change: Dict[str, Any]) -> None:
+        full_document = change.get("fullDocument") or {}
+        app_id = full_document.get("app_id")
+        if app_id is None:
+            # Deletes only carry the _id; map it back, or drop everything if unknown.
+            app_id = self._app_ids_by_doc_id.get(change.get("documentKey", {}).get("_id"))
+        if app_id is None:
+            self.invalidate()
+        else:
+            self.invalidate(app_id)
+        logger.debug(f"AppRepo cache invalidated by '{change.get('operationType')}' on {app_id or 'unknown app_id'}.")
+
+    async def _poll(self) -> None:
+        self.invalidation_mode = "polling"
+        # The watermark is the newest updated_at read from the collection, never this host's clock.
+        # Documents re-read inside the overlap are only invalidated if their updated_at changed.
+        last_seen: Optional[datetime] = None
+        seen: Dict[Any, datetime] = {}
+        started = False
+        while True:
+            try:
+                if not started:
+                    newest = await self.collection.find_one(
+                        {"updated_at": {"$ne": None}}, {"updated_at": 1}, sort=[("updated_at", -1)]
+                    )
+                    last_seen = newest["updated_at"] if newest else None
+                    # Anything written before the watermark was read may already be cached.
+                    self.invalidate()
+                    started = True
+                else:
+                    query = {"updated_at": {"$gt": last_seen - POLL_OVERLAP}} if last_seen else {"updated_at": {"$ne": None}}
+                    async for doc in self.collection.find(query, {"app_id": 1, "updated_at": 1}):
+                        if seen.get(doc["_id"]) != doc["updated_at"]:
+                            seen[doc["_id"]] = doc["updated_at"]
+                            self.invalidate(doc["app_id"])
+                        last_seen = max(last_seen, doc["updated_at"]) if last_seen else doc["updated_at"]
+                    if last_seen:
+                        seen = {doc_id: updated_at for doc_id, updated_at in seen.items() if updated_at > last_seen - POLL_OVERLAP}
+                    # Deletes leave nothing behind to match on updated_at.
+                    cached = self._cache.keys()
+                    if cached:
+                        existing = {doc["app_id"] async for doc in self.collection.find({"app_id": {"$in": cached}}, {"app_id": 1})}
+                        for app_id in cached:
+                            if app_id not in existing:
+                                self.invalidate(app_id)
+            except PyMongoError as e:
+                logger.warning(f"AppRepo cache poll failed: {e}")
+            await asyncio.sleep(self._poll_interval_seconds)
@@ -0,0 +1,119 @@
+from ..config import settings
+from ..models.db_models import AppRepo, SessionMemory
+from .admission import AdmissionController
+from .agent_orchestrator import AgentOrchestrator
+from .context_builder import ContextBuilder
+from .llm_client import LLMClient, OpenAIAssistantsClient
+from .ltm_writer import LTMWriter
+from .mongo_service import MongoService
+from .response_cache import ResponseCache
+from .session_cache import InMemorySessionBackend
+from .session_service import SessionManager
+from .tokens import Tokenizer
+from .tool_executor import ToolExecutor
+from .tool_loader import ToolLoader
+from .tool_result_cache import ToolResultCache
+
+
+class Services:
+    """
+    The worker's long-lived services. The FastAPI lifespan builds one Services, keeps it on
+    app.state.services, and starts and stops the services; request handlers get them through
+    the providers in src/api/dependencies.py. Each service receives its collaborators as
+    constructor arguments, so nothing is wired up, or connects, at import time.
+    """
+
+    def __init__(self, mongo_service: MongoService, llm_client: LLMClient, tool_loader: ToolLoader,
+                 tool_executor: ToolExecutor, ltm_writer: LTMWriter, response_cache: ResponseCache,
+                 session_manager: SessionManager, admission_controller: AdmissionController,
+                 context_builder: ContextBuilder):
+        self.mongo_service = mongo_service
+        self.llm_client = llm_client
+        self.tool_loader = tool_loader
+        self.tool_executor = tool_executor
+        self.ltm_writer = ltm_writer
+        self.response_cache = response_cache
+        self.session_manager = session_manager
+        self.admission_controller = admission_controller
+        self.context_builder = context_builder
+
+    @classmethod
+    def from_settings(cls) -> "Services":
+        """Builds every service from Settings. Does no I/O."""
+        mongo_service = MongoService()
+        llm_client = OpenAIAssistantsClient(
+            api_key=settings.OPENAI_API_KEY,
+            base_url=settings.OPENAI_BASE_URL,
+            timeout_seconds=settings.OPENAI_TIMEOUT_SECONDS,
+            max_connections=settings.OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+            max_retries=settings.OPENAI_MAX_RETRIES,
+            embedding_model=settings.EMBEDDING_MODEL
+        )
+        embedder = llm_client.embed if settings.EMBEDDING_MODEL else None
+        tool_loader = ToolLoader(manifest_path=settings.TOOL_MANIFEST_PATH)
+        return cls(
+            mongo_service=mongo_service,
+            llm_client=llm_client,
+            tool_loader=tool_loader,
+            tool_executor=ToolExecutor(
+                tool_loader,
+                max_workers=settings.TOOL_EXECUTOR_MAX_WORKERS,
+                default_timeout_seconds=settings.TOOL_CALL_TIMEOUT_SECONDS,
+                default_max_concurrency=settings.TOOL_MAX_CONCURRENCY,
+                result_cache=ToolResultCache(
+                    max_size=settings.TOOL_CACHE_MAX_SIZE,
+                    collection=mongo_service.db.tool_result_cache if settings.TOOL_CACHE_SHARED else None,
+                ),
+            ),
+            ltm_writer=LTMWriter(
+                mongo_service,
+                max_queue_size=settings.LTM_WRITER_QUEUE_SIZE,
+                batch_size=settings.LTM_WRITER_BATCH_SIZE,
+                flush_interval_seconds=settings.LTM_WRITER_FLUSH_INTERVAL_SECONDS,
+                workers=settings.LTM_WRITER_WORKERS,
+                overflow_policy=settings.LTM_WRITER_OVERFLOW_POLICY,
+                spill_path=settings.LTM_WRITER_SPILL_PATH,
+                drain_timeout_seconds=settings.LTM_WRITER_DRAIN_TIMEOUT_SECONDS,
+                embedder=embedder
+            ),
+            response_cache=ResponseCache(
+                max_scopes=settings.RESPONSE_CACHE_MAX_SCOPES,
+                max_entries_per_scope=settings.RESPONSE_CACHE_MAX_ENTRIES_PER_SCOPE,
+                embedder=embedder
+            ),
+            session_manager=SessionManager(
+                mongo_service,
+                cache=InMemorySessionBackend(
+                    max_size=settings.SESSION_CACHE_MAX_SIZE,
+                    ttl_seconds=settings.SESSION_CACHE_TTL_SECONDS
+                ) if settings.SESSION_CACHE_ENABLED else None,
+                cached_turns=settings.SESSION_CACHE_TURNS,
+                flush_interval_seconds=settings.SESSION_TTL_REFRESH_INTERVAL_SECONDS
+            ),
+            admission_controller=AdmissionController(
+                max_streams=settings.ADMISSION_MAX_STREAMS,
+                queue_size=settings.ADMISSION_QUEUE_SIZE,
+                ttfc_slo_seconds=settings.ADMISSION_TTFC_SLO_SECONDS,
+                shed_factor=settings.ADMISSION_SHED_FACTOR,
+                retry_after_seconds=settings.ADMISSION_RETRY_AFTER_SECONDS
+            ),
+            context_builder=ContextBuilder(
+                tokenizer=Tokenizer(settings.CONTEXT_TOKENIZER),
+                max_cached_lengths=settings.CONTEXT_TOKEN_CACHE_SIZE
+            ),
+        )
+
+    def orchestrator(self, session: SessionMemory, app_config: AppRepo) -> AgentOrchestrator:
+        """An orchestrator for one chat turn, wired to these services."""
+        return AgentOrchestrator(
+            session, app_config,
+            llm_client=self.llm_client,
+            mongo_service=self.mongo_service,
+            session_manager=self.session_manager,
+            tool_loader=self.tool_loader,
+            tool_executor=self.tool_executor,
+            ltm_writer=self.ltm_writer,
+            response_cache=self.response_cache,
+            context_builder=self.context_builder,
+        )
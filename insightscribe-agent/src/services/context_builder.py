@@ -0,0 +1,167 @@
+import json
+import logging
+import math
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from pydantic import BaseModel
+
+from ..config import settings
+from ..models.db_models import AppRepo, ConversationTurn, LongTermMemoryEntry
+from ..models.records import LTMRecord
+from .cache import LRUTTLCache
+from .metrics import PROMPT_CONTEXT_ITEMS, PROMPT_CONTEXT_TOKENS
+from .tokens import Tokenizer
+
+logger = logging.getLogger(__name__)
+
+_WORDS = re.compile(r"\w+")
+
+LTM_HEADER = "Relevant long-term memory about this user:"
+# Role and framing the API adds around each thread message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class ContextPolicy(BaseModel):
+    """
+    Per-app prompt context budget, configured under AppRepo config["context"].
+    Unset keys fall back to Settings.
+    """
+    max_tokens: int = settings.CONTEXT_MAX_TOKENS
+    # Upper bound on the LTM part of the budget; whatever LTM leaves unused goes to recent turns.
+    ltm_share: float = settings.CONTEXT_LTM_SHARE
+    # Longer LTM entries are truncated. Recent turns are thread messages and are sent whole,
+    # so a turn that does not fit ends the window instead.
+    max_turn_tokens: int = settings.CONTEXT_MAX_TURN_TOKENS
+    ltm_candidates: int = settings.CONTEXT_LTM_CANDIDATES # Entries fetched before ranking
+    relevance_weight: float = 0.7 # Relevance vs. recency in the LTM ranking
+    recency_half_life_days: float = 30.0
+
+    @classmethod
+    def for_app(cls, app_config: AppRepo) -> "ContextPolicy":
+        return cls(**app_config.config.get("context", {}))
+
+
+class PromptContext(BaseModel):
+    """
+    What ContextBuilder.build selected. The LTM part is passed to the run as additional
+    instructions; the recent turns are already messages on the thread, so the run is only
+    told how many of them to keep (truncation_strategy last_messages).
+    """
+    instructions: str = ""
+    tokens: int = 0 # Instructions plus the kept turns
+    ltm_entries: List[Any] = [] # LongTermMemoryEntry or LTMRecord, as given to build()
+    stm_turns: List[Any] = [] # ConversationTurn or TurnRecord
+    truncated: int = 0 # LTM entries cut to max_turn_tokens
+    dropped: int = 0 # Candidates left out for lack of budget
+
+    def summary(self) -> Dict[str, Any]:
+        return {"context_tokens": self.tokens, "context_ltm": len(self.ltm_entries), "context_turns": len(self.stm_turns),
+                "context_truncated": self.truncated, "context_dropped": self.dropped}
+
+    @property
+    def last_messages(self) -> int:
+        """Thread messages the run may see: the kept turns plus the message being answered."""
+        return len(self.stm_turns) + 1
+
+
+def ltm_text(entry: Union[LongTermMemoryEntry, LTMRecord]) -> str:
+    text = entry.content.get("text")
+    return text if isinstance(text, str) else json.dumps(entry.content, default=str)
+
+
+class ContextBuilder:
+    """
+    Fills a token budget with long-term memory and recent turns.
+
+    LTM candidates are ranked by a blend of relevance to the message (cosine similarity
+    when both have embeddings, word overlap otherwise) and recency, then added best first
+    while they fit in their share of the budget. Recent turns fill the rest, newest first,
+    and stop at the first turn that no longer fits so the conversation has no gaps. Only
+    the LTM is rendered into instructions; the turns stay on the thread and the run keeps
+    just the selected ones.
+
+    Rendered lines and their token counts are cached per turn and per entry, so a session's
+    history is tokenized once rather than on every message.
+    """
+
+    def __init__(self, tokenizer: Tokenizer, max_cached_lengths: int):
+        self.tokenizer = tokenizer
+        self._lengths = LRUTTLCache(max_size=max_cached_lengths, ttl_seconds=math.inf)
+        self._header_tokens = tokenizer.count(LTM_HEADER)
+
+    def _render(self, key: Tuple[Any, ...], text: str, max_tokens: Optional[int]) -> Tuple[str, int, bool]:
+        """Returns (line, tokens, truncated) for a turn or entry, from the cache when possible. None keeps the whole text."""
+        cache_key = key + (max_tokens,)
+        rendered = self._lengths.get(cache_key)
+        if rendered is None:
+            line = self.tokenizer.truncate(text, max_tokens) if max_tokens is not None else text
+            rendered = (line, self.tokenizer.count(line) + 1, line is not text) # +1 for the newline
+            self._lengths.set(cache_key, rendered)
+        return rendered
+
+    def _rank(self, message: str, entries: Sequence[Union[LongTermMemoryEntry, LTMRecord]], query_embedding: Optional[List[float]],
+              policy: ContextPolicy, now: datetime) -> List[Union[LongTermMemoryEntry, LTMRecord]]:
+        query = np.asarray(query_embedding, dtype=np.float32) if query_embedding else None
+        query_norm = float(np.linalg.norm(query)) if query is not None else 0.0
+        words = set(_WORDS.findall(message.lower()))
+
+        def score(entry: Union[LongTermMemoryEntry, LTMRecord]) -> float:
+            if query_norm and entry.embedding and len(entry.embedding) == len(query):
+                vector = np.asarray(entry.embedding, dtype=np.float32)
+                norm = float(np.linalg.norm(vector))
+                relevance = float(vector @ query) / (norm * query_norm) if norm else 0.0
+            else:
+                relevance = len(words & set(_WORDS.findall(ltm_text(entry).lower()))) / len(words) if words else 0.0
+            age_days = max(0.0, (now - entry.created_at).total_seconds() / 86400)
+            recency = 0.5 ** (age_days / policy.recency_half_life_days)
+            return policy.relevance_weight * relevance + (1 - policy.relevance_weight) * recency
+
+        return sorted(entries, key=score, reverse=True)
+
+    def build(self, session_id: str, message: str, ltm_entries: Sequence[Union[LongTermMemoryEntry, LTMRecord]], stm_history: List[ConversationTurn],
+              policy: ContextPolicy, query_embedding: Optional[List[float]] = None) -> PromptContext:
+        context = PromptContext()
+        budget = policy.max_tokens - self._header_tokens
+        ltm_budget = int(policy.max_tokens * policy.ltm_share)
+
+        ltm_lines = []
+        for entry in self._rank(message, ltm_entries, query_embedding, policy, datetime.utcnow()):
+            line, tokens, truncated = self._render(("ltm", str(entry.id)), ltm_text(entry), policy.max_turn_tokens)
+            if tokens + 2 > ltm_budget: # "- " prefix
+                context.dropped += 1
+                continue
+            ltm_lines.append(f"- {line}")
+            ltm_budget -= tokens + 2
+            budget -= tokens + 2
+            context.ltm_entries.append(entry)
+            context.truncated += truncated
+
+        stm_tokens = 0
+        for position, turn in enumerate(reversed(stm_history)):
+            _, tokens, _ = self._render(("turn", session_id, turn.timestamp, turn.role), turn.text, None)
+            tokens += MESSAGE_OVERHEAD_TOKENS - 1 # _render counted a newline
+            if tokens > budget:
+                context.dropped += len(stm_history) - position
+                break
+            budget -= tokens
+            stm_tokens += tokens
+            context.stm_turns.insert(0, turn)
+
+        if ltm_lines:
+            context.instructions = "\n".join([LTM_HEADER] + ltm_lines)
+        context.tokens = (self.tokenizer.count(context.instructions) if ltm_lines else 0) + stm_tokens
+
+        PROMPT_CONTEXT_TOKENS.observe(context.tokens)
+        PROMPT_CONTEXT_ITEMS.inc(len(context.ltm_entries), kind="ltm", outcome="included")
+        PROMPT_CONTEXT_ITEMS.inc(len(context.stm_turns), kind="stm", outcome="included")
+        PROMPT_CONTEXT_ITEMS.inc(context.truncated, kind="any", outcome="truncated")
+        PROMPT_CONTEXT_ITEMS.inc(context.dropped, kind="any", outcome="dropped")
+        return context
+
+    def stats(self) -> Dict[str, Any]:
+        # Lengths never expire; JSON has no infinity, so the cache's ttl_seconds is reported as None.
+        return {"tokenizer": self.tokenizer.encoding.name if self.tokenizer.encoding is not None else "estimate",
+                **self._lengths.stats(), "ttl_seconds": None}
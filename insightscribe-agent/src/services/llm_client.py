@@ -0,0 +1,242 @@
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+logger = logging.getLogger(__name__)
+
+# Run statuses after which nothing more will happen to a run
+TERMINAL_RUN_STATUSES = ("completed", "failed", "cancelled", "expired", "incomplete")
+
+
+class LLMRun(BaseModel):
+    """The part of an Assistants run the orchestrator acts on."""
+    id: str
+    status: str
+    # Pending calls when status is "requires_action", in the shape ToolExecutor.run_tool_calls takes:
+    # {"id": ..., "function": {"name": ..., "arguments": "<json>"}}
+    tool_calls: List[Dict[str, Any]] = Field(default_factory=list)
+    total_tokens: Optional[int] = None # Reported once the run is terminal
+    last_error: Optional[str] = None
+
+
+class LLMStreamEvent(BaseModel):
+    """One event of a streamed run: either a piece of answer text or the run's latest state."""
+    text: Optional[str] = None
+    run: Optional[LLMRun] = None
+
+
+class LLMClient(ABC):
+    """Thread/run operations the agent loop needs from an Assistants-style backend."""
+
+    @abstractmethod
+    async def create_thread(self) -> str:
+        pass
+
+    @abstractmethod
+    async def add_message(self, thread_id: str, content: str, role: str = "user") -> None:
+        pass
+
+    @abstractmethod
+    async def create_run(self, thread_id: str, assistant_id: str, instructions: Optional[str] = None,
+                         last_messages: Optional[int] = None) -> LLMRun:
+        """Starts a run with extra instructions, seeing only the thread's last_messages messages if set."""
+        pass
+
+    @abstractmethod
+    async def retrieve_run(self, thread_id: str, run_id: str) -> LLMRun:
+        pass
+
+    @abstractmethod
+    async def submit_tool_outputs(self, thread_id: str, run_id: str, tool_outputs: List[Dict[str, str]]) -> LLMRun:
+        pass
+
+    @abstractmethod
+    def stream_run(self, thread_id: str, assistant_id: str, instructions: Optional[str] = None,
+                   last_messages: Optional[int] = None) -> AsyncIterator[LLMStreamEvent]:
+        """
+        Creates a run like create_run and yields its events until the run finishes or needs
+        tool outputs; the last run event tells which.
+        """
+        pass
+
+    @abstractmethod
+    def stream_tool_outputs(self, thread_id: str, run_id: str, tool_outputs: List[Dict[str, str]]) -> AsyncIterator[LLMStreamEvent]:
+        """Submits tool outputs and streams the continuation of the run, like stream_run."""
+        pass
+
+    @abstractmethod
+    async def cancel_run(self, thread_id: str, run_id: str) -> LLMRun:
+        pass
+
+    @abstractmethod
+    async def get_response_text(self, thread_id: str, run_id: str) -> str:
+        """Text of the assistant message produced by the run."""
+        pass
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """One embedding per text, same order. Backends without an embedding model leave this unimplemented."""
+        raise NotImplementedError(f"{type(self).__name__} does not provide embeddings.")
+
+    async def start(self) -> None:
+        """Begins any warm-up; called from the application lifespan."""
+        pass
+
+    async def close(self) -> None:
+        pass
+
+
+class OpenAIAssistantsClient(LLMClient):
+    """
+    LLMClient over the OpenAI Assistants API. One httpx connection pool is shared by
+    every request in the worker, so runs reuse warm TLS connections instead of each
+    turn paying for a handshake. base_url can point at a compatible stand-in, such as
+    scripts/fake_assistants_server.py.
+
+    Importing the openai SDK takes over a second, so nothing is imported or built until
+    start() (or the first call) does it on a worker thread; calls made meanwhile wait for it.
+    """
+
+    def __init__(self, api_key: str, base_url: Optional[str] = None, timeout_seconds: float = 60,
+                 max_connections: int = 100, max_keepalive_connections: int = 20, max_retries: int = 2,
+                 embedding_model: Optional[str] = None):
+        self.embedding_model = embedding_model or None
+        self._options = {
+            "api_key": api_key, "base_url": base_url or None, "timeout_seconds": timeout_seconds,
+            "max_connections": max_connections, "max_keepalive_connections": max_keepalive_connections,
+            "max_retries": max_retries,
+        }
+        self._build_task: Optional[asyncio.Future] = None
+        self._client = None
+        self._http_client = None
+
+    def _build(self):
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+        # Newer openai SDKs are built on httpx2, older ones on httpx; pool limits must come from the same library.
+        try:
+            from httpx2 import Limits, Timeout
+        except ImportError:
+            from httpx import Limits, Timeout
+
+        options = self._options
+        http_client = DefaultAsyncHttpxClient(
+            limits=Limits(max_connections=options["max_connections"], max_keepalive_connections=options["max_keepalive_connections"]),
+            timeout=Timeout(options["timeout_seconds"], connect=10.0)
+        )
+        client = AsyncOpenAI(api_key=options["api_key"], base_url=options["base_url"], max_retries=options["max_retries"],
+                             http_client=http_client)
+        return client, http_client
+
+    async def start(self) -> None:
+        await self._sdk()
+
+    async def _sdk(self):
+        if self._client is None:
+            if self._build_task is None:
+                self._build_task = asyncio.ensure_future(asyncio.to_thread(self._build))
+            # Shielded so a cancelled request does not cancel the build for everyone else.
+            self._client, self._http_client = await asyncio.shield(self._build_task)
+        return self._client
+
+    @staticmethod
+    def _to_run(run: Any) -> LLMRun:
+        tool_calls = []
+        if run.status == "requires_action" and run.required_action is not None:
+            tool_calls = [
+                {"id": call.id, "function": {"name": call.function.name, "arguments": call.function.arguments}}
+                for call in run.required_action.submit_tool_outputs.tool_calls
+            ]
+        return LLMRun(
+            id=run.id,
+            status=run.status,
+            tool_calls=tool_calls,
+            total_tokens=run.usage.total_tokens if run.usage is not None else None,
+            last_error=run.last_error.message if run.last_error is not None else None
+        )
+
+    async def create_thread(self) -> str:
+        client = await self._sdk()
+        thread = await client.beta.threads.create()
+        return thread.id
+
+    async def add_message(self, thread_id: str, content: str, role: str = "user") -> None:
+        client = await self._sdk()
+        await client.beta.threads.messages.create(thread_id=thread_id, role=role, content=content)
+
+    @staticmethod
+    def _run_options(instructions: Optional[str], last_messages: Optional[int]) -> Dict[str, Any]:
+        options: Dict[str, Any] = {}
+        if instructions:
+            options["additional_instructions"] = instructions
+        if last_messages is not None:
+            options["truncation_strategy"] = {"type": "last_messages", "last_messages": last_messages}
+        return options
+
+    async def create_run(self, thread_id: str, assistant_id: str, instructions: Optional[str] = None,
+                         last_messages: Optional[int] = None) -> LLMRun:
+        kwargs = self._run_options(instructions, last_messages)
+        client = await self._sdk()
+        run = await client.beta.threads.runs.create(thread_id=thread_id, assistant_id=assistant_id, **kwargs)
+        return self._to_run(run)
+
+    async def retrieve_run(self, thread_id: str, run_id: str) -> LLMRun:
+        client = await self._sdk()
+        return self._to_run(await client.beta.threads.runs.retrieve(run_id, thread_id=thread_id))
+
+    async def submit_tool_outputs(self, thread_id: str, run_id: str, tool_outputs: List[Dict[str, str]]) -> LLMRun:
+        client = await self._sdk()
+        run = await client.beta.threads.runs.submit_tool_outputs(run_id, thread_id=thread_id, tool_outputs=tool_outputs)
+        return self._to_run(run)
+
+    async def _iterate_stream(self, stream) -> AsyncIterator[LLMStreamEvent]:
+        try:
+            async for event in stream:
+                if event.event == "thread.message.delta":
+                    for part in event.data.delta.content or []:
+                        if part.type == "text" and part.text is not None and part.text.value:
+                            yield LLMStreamEvent(text=part.text.value)
+                elif event.event.startswith("thread.run.") and not event.event.startswith("thread.run.step."):
+                    yield LLMStreamEvent(run=self._to_run(event.data))
+        finally:
+            await stream.close()
+
+    async def stream_run(self, thread_id: str, assistant_id: str, instructions: Optional[str] = None,
+                         last_messages: Optional[int] = None) -> AsyncIterator[LLMStreamEvent]:
+        kwargs = self._run_options(instructions, last_messages)
+        client = await self._sdk()
+        stream = await client.beta.threads.runs.create(thread_id=thread_id, assistant_id=assistant_id, stream=True, **kwargs)
+        async for event in self._iterate_stream(stream):
+            yield event
+
+    async def stream_tool_outputs(self, thread_id: str, run_id: str, tool_outputs: List[Dict[str, str]]) -> AsyncIterator[LLMStreamEvent]:
+        client = await self._sdk()
+        stream = await client.beta.threads.runs.submit_tool_outputs(run_id, thread_id=thread_id, tool_outputs=tool_outputs, stream=True)
+        async for event in self._iterate_stream(stream):
+            yield event
+
+    async def cancel_run(self, thread_id: str, run_id: str) -> LLMRun:
+        client = await self._sdk()
+        return self._to_run(await client.beta.threads.runs.cancel(run_id, thread_id=thread_id))
+
+    async def get_response_text(self, thread_id: str, run_id: str) -> str:
+        client = await self._sdk()
+        page = await client.beta.threads.messages.list(thread_id=thread_id, run_id=run_id, order="desc", limit=1)
+        for message in page.data:
+            return "".join(part.text.value for part in message.content if part.type == "text")
+        return ""
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        if self.embedding_model is None:
+            return await super().embed(texts)
+        client = await self._sdk()
+        response = await client.embeddings.create(model=self.embedding_model, input=texts)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    async def close(self) -> None:
+        if self._build_task is None:
+            return
+        client = await self._sdk()
+        await client.close()
+        await self._http_client.aclose()
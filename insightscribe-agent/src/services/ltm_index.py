@@ -0,0 +1,141 @@
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .cache import LRUTTLCache, SingleFlight
+
+logger = logging.getLogger(__name__)
+
+_LOAD_BATCH_SIZE = 5000
+
+
+class LTMVectorIndex:
+    """
+    Exact cosine-similarity index over the LTM embeddings of one (user_id, app_id).
+    Vectors are stored L2-normalized in a contiguous float32 matrix that grows by
+    doubling, so a search is a single matrix-vector product plus a partial sort.
+    """
+
+    def __init__(self, dim: int, capacity: int = 64):
+        self.dim = dim
+        self._matrix = np.zeros((max(capacity, 1), dim), dtype=np.float32)
+        self._ids: List[Any] = []
+        self._id_set = set()
+        self.last_created_at: Optional[datetime] = None
+        self.refreshed_at = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add_many(self, ids: List[Any], embeddings: np.ndarray, created_at: Optional[datetime] = None) -> None:
+        keep = [i for i, doc_id in enumerate(ids) if doc_id not in self._id_set]
+        if keep:
+            vectors = np.asarray(embeddings, dtype=np.float32)[keep]
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.where(norms == 0, 1, norms)
+            count = len(self._ids)
+            needed = count + len(keep)
+            if needed > self._matrix.shape[0]:
+                grown = np.zeros((max(needed, self._matrix.shape[0] * 2), self.dim), dtype=np.float32)
+                grown[:count] = self._matrix[:count]
+                self._matrix = grown
+            self._matrix[count:needed] = vectors
+            for i in keep:
+                self._ids.append(ids[i])
+                self._id_set.add(ids[i])
+        if created_at is not None and (self.last_created_at is None or created_at > self.last_created_at):
+            self.last_created_at = created_at
+
+    def search(self, query: np.ndarray, k: int) -> List[Tuple[Any, float]]:
+        count = len(self._ids)
+        if count == 0 or k <= 0:
+            return []
+        query = np.asarray(query, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        scores = self._matrix[:count] @ (query / norm)
+        k = min(k, count)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self._ids[i], float(scores[i])) for i in top]
+
+
+class LTMIndexRegistry:
+    """
+    Holds one LTMVectorIndex per (user_id, app_id), built lazily from MongoDB on first
+    search and kept in an LRU. New entries written by this worker are added immediately;
+    entries written by other workers are picked up by an incremental created_at catch-up
+    every refresh_seconds. The catch-up re-reads catch_up_overlap_seconds behind the newest
+    created_at it has seen, since an entry can be stamped before, and inserted after, that one.
+    Indexes are rebuilt from scratch after rebuild_seconds, which also drops deleted entries.
+    """
+
+    def __init__(self, collection, max_indexes: int, refresh_seconds: float, rebuild_seconds: float,
+                 catch_up_overlap_seconds: float = 60):
+        self.collection = collection
+        self._catch_up_overlap = timedelta(seconds=catch_up_overlap_seconds)
+        self._indexes = LRUTTLCache(max_size=max_indexes, ttl_seconds=rebuild_seconds)
+        self._single_flight = SingleFlight()
+        self._refresh_seconds = refresh_seconds
+
+    async def search(self, user_id: str, app_id: str, query_embedding: List[float], k: int) -> List[Tuple[Any, float]]:
+        """Returns up to k (entry _id, cosine score) pairs, best first."""
+        key = (user_id, app_id)
+        index = self._indexes.get(key)
+        if index is None:
+            index = await self._single_flight.do(key, lambda: self._build(user_id, app_id, len(query_embedding)))
+        elif time.monotonic() - index.refreshed_at > self._refresh_seconds:
+            await self._single_flight.do(key, lambda: self._catch_up(user_id, app_id, index))
+        if index.dim != len(query_embedding):
+            logger.warning(f"Query embedding has {len(query_embedding)} dims; LTM index for {key} has {index.dim}.")
+            return []
+        return index.search(np.asarray(query_embedding, dtype=np.float32), k)
+
+    def add(self, user_id: str, app_id: str, entry_id: Any, embedding: List[float], created_at: datetime) -> None:
+        """Adds a freshly inserted entry to the index, if that index is currently loaded."""
+        index = self._indexes.get((user_id, app_id))
+        if index is not None and index.dim == len(embedding):
+            index.add_many([entry_id], np.asarray([embedding], dtype=np.float32), created_at)
+
+    def invalidate(self, user_id: str, app_id: str) -> None:
+        self._indexes.invalidate((user_id, app_id))
+        self._single_flight.forget((user_id, app_id))
+
+    async def _build(self, user_id: str, app_id: str, dim: int) -> LTMVectorIndex:
+        start = time.perf_counter()
+        index = LTMVectorIndex(dim)
+        await self._load_into(index, {"user_id": user_id, "app_id": app_id})
+        self._indexes.set((user_id, app_id), index)
+        logger.info(f"Built LTM vector index for ({user_id}, {app_id}): {len(index)} entries in {(time.perf_counter() - start) * 1000:.1f} ms.")
+        return index
+
+    async def _catch_up(self, user_id: str, app_id: str, index: LTMVectorIndex) -> LTMVectorIndex:
+        query = {"user_id": user_id, "app_id": app_id}
+        if index.last_created_at is not None:
+            # Entries already in the index are deduplicated by _id.
+            query["created_at"] = {"$gte": index.last_created_at - self._catch_up_overlap}
+        await self._load_into(index, query)
+        return index
+
+    async def _load_into(self, index: LTMVectorIndex, query: Dict[str, Any]) -> None:
+        query = {**query, "embedding": {"$type": "array"}}
+        cursor = self.collection.find(query, {"embedding": 1, "created_at": 1}).batch_size(_LOAD_BATCH_SIZE)
+        while True:
+            batch = await cursor.to_list(length=_LOAD_BATCH_SIZE)
+            if not batch:
+                break
+            batch = [doc for doc in batch if len(doc["embedding"]) == index.dim]
+            if batch:
+                index.add_many(
+                    [doc["_id"] for doc in batch],
+                    np.array([doc["embedding"] for doc in batch], dtype=np.float32),
+                    max(doc["created_at"] for doc in batch)
+                )
+        index.refreshed_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._indexes.stats(), "coalesced_loads": self._single_flight.coalesced}
@@ -0,0 +1,233 @@
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from bson import ObjectId
+from pydantic import BaseModel, Field
+
+from ..models.db_models import LongTermMemoryEntry
+from .metrics import LTM_WRITER_ENTRIES, LTM_WRITER_QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+# Values for LTMWriter.overflow_policy: what submit() does when the queue is full
+OVERFLOW_DROP_NEWEST = "drop_newest" # Reject the new request
+OVERFLOW_DROP_OLDEST = "drop_oldest" # Evict the oldest queued request to make room
+OVERFLOW_SPILL = "spill" # Append the request to the spill file; replayed on next start
+
+
+class LTMWriteRequest(BaseModel):
+    """A finished chat turn to be summarized into long-term memory."""
+    user_id: str
+    app_id: str
+    session_id: str
+    message: str
+    response_text: str
+    requested_at: datetime = Field(default_factory=datetime.utcnow)
+    # Becomes the entry's _id, so a request written twice (e.g. spilled after an insert that did
+    # reach MongoDB before its caller was cancelled) is stored once.
+    entry_id: str = Field(default_factory=lambda: str(ObjectId()))
+
+
+# Summarizes a batch of turns into LongTermMemoryEntry.content dicts (one per request, same order).
+Summarizer = Callable[[List[LTMWriteRequest]], Awaitable[List[Dict[str, Any]]]]
+# Embeds a batch of summary texts (one vector per text, same order).
+Embedder = Callable[[List[str]], Awaitable[List[List[float]]]]
+
+
+async def template_summarizer(requests: List[LTMWriteRequest]) -> List[Dict[str, Any]]:
+    # In a real system, a separate summarizer agent would create these.
+    return [{"text": f"User asked '{r.message}' and received a response about BI query results."} for r in requests]
+
+
+class LTMWriter:
+    """
+    Writes long-term memory off the chat path. submit() only enqueues onto a bounded
+    queue and never waits; workers pull batches (up to batch_size, or whatever arrived
+    within flush_interval_seconds), summarize and embed each batch in one call, and
+    store it with a single insert_many. When the queue is full, overflow_policy decides
+    which request is lost, or spills it to disk. stop() drains the queue; requests still
+    queued after drain_timeout_seconds are spilled when a spill path is set. start() feeds
+    spilled requests back through the queue, so stop() drains or re-spills them like any other.
+    Each request carries the _id of its entry, which makes spilling a batch whose insert may
+    already have gone through safe: the second insert is ignored as a duplicate.
+    """
+
+    def __init__(self, store, max_queue_size: int, batch_size: int, flush_interval_seconds: float, workers: int,
+                 overflow_policy: str = OVERFLOW_DROP_OLDEST, spill_path: Optional[str] = None,
+                 drain_timeout_seconds: float = 10, summarizer: Summarizer = template_summarizer,
+                 embedder: Optional[Embedder] = None):
+        self.store = store
+        self.max_queue_size = max_queue_size
+        self.batch_size = max(batch_size, 1)
+        self.flush_interval_seconds = flush_interval_seconds
+        self.worker_count = max(workers, 1)
+        self.overflow_policy = overflow_policy
+        self.spill_path = spill_path or None
+        self.drain_timeout_seconds = drain_timeout_seconds
+        self.summarizer = summarizer
+        self.embedder = embedder
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._replay_task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._stats = {"queued": 0, "written": 0, "dropped": 0, "spilled": 0, "failed": 0, "batches": 0}
+
+    def _count(self, outcome: str, n: int = 1) -> None:
+        self._stats[outcome] += n
+        LTM_WRITER_ENTRIES.inc(n, outcome=outcome)
+
+    def submit(self, request: LTMWriteRequest) -> bool:
+        """Queues a request without waiting. Returns False if it was dropped."""
+        if self._queue is None or self._closing:
+            return self._overflow(request)
+        try:
+            self._queue.put_nowait(request)
+        except asyncio.QueueFull:
+            if self.overflow_policy == OVERFLOW_DROP_OLDEST:
+                self._queue.get_nowait()
+                self._queue.task_done()
+                self._count("dropped")
+                self._queue.put_nowait(request)
+            else:
+                return self._overflow(request)
+        self._count("queued")
+        LTM_WRITER_QUEUE_DEPTH.set(self._queue.qsize())
+        return True
+
+    def _overflow(self, request: LTMWriteRequest) -> bool:
+        if self.overflow_policy == OVERFLOW_SPILL and self.spill_path:
+            self._spill([request])
+            return True
+        self._count("dropped")
+        logger.warning(f"LTM write for session {request.session_id} dropped: queue full or writer stopped.")
+        return False
+
+    def _spill(self, requests: List[LTMWriteRequest]) -> None:
+        try:
+            with open(self.spill_path, "a", encoding="utf-8") as f:
+                for request in requests:
+                    f.write(request.json() + "\n")
+            self._count("spilled", len(requests))
+        except OSError as e:
+            self._count("failed", len(requests))
+            logger.error(f"Could not spill {len(requests)} LTM write(s) to {self.spill_path}: {e}")
+
+    def _take_spilled(self) -> List[LTMWriteRequest]:
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return []
+        with open(self.spill_path, encoding="utf-8") as f:
+            requests = [LTMWriteRequest(**json.loads(line)) for line in f if line.strip()]
+        os.remove(self.spill_path)
+        return requests
+
+    async def start(self) -> None:
+        self._closing = False
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+        spilled = await asyncio.to_thread(self._take_spilled)
+        if spilled:
+            logger.info(f"Replaying {len(spilled)} spilled LTM write(s).")
+            self._replay_task = asyncio.create_task(self._replay(spilled))
+
+    async def stop(self) -> None:
+        if self._queue is None:
+            return
+        self._closing = True
+        if self._replay_task is not None:
+            # Whatever the replay has not queued yet goes back to the spill file.
+            self._replay_task.cancel()
+            await asyncio.gather(self._replay_task, return_exceptions=True)
+            self._replay_task = None
+        try:
+            await asyncio.wait_for(self._queue.join(), self.drain_timeout_seconds)
+        except asyncio.TimeoutError:
+            logger.warning(f"LTM writer did not drain within {self.drain_timeout_seconds}s; {self._queue.qsize()} request(s) left.")
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        leftovers = []
+        while not self._queue.empty():
+            leftovers.append(self._queue.get_nowait())
+        if leftovers:
+            if self.spill_path:
+                self._spill(leftovers)
+            else:
+                self._count("dropped", len(leftovers))
+        self._workers = []
+        self._queue = None
+        LTM_WRITER_QUEUE_DEPTH.set(0)
+
+    async def _worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            try:
+                deadline = loop.time() + self.flush_interval_seconds
+                while len(batch) < self.batch_size:
+                    if not self._queue.empty():
+                        batch.append(self._queue.get_nowait())
+                        continue
+                    timeout = deadline - loop.time()
+                    if timeout <= 0 or self._closing:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                LTM_WRITER_QUEUE_DEPTH.set(self._queue.qsize())
+                await self._write_batch(batch)
+            except asyncio.CancelledError:
+                # Only reached when stop() gave up draining; keep what this worker was holding.
+                if self.spill_path:
+                    self._spill(batch)
+                else:
+                    self._count("dropped", len(batch))
+                raise
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _replay(self, requests: List[LTMWriteRequest]) -> None:
+        # Waits for room rather than applying overflow_policy: these requests were already accepted once.
+        for i, request in enumerate(requests):
+            try:
+                await self._queue.put(request)
+            except asyncio.CancelledError:
+                self._spill(requests[i:])
+                raise
+            self._count("queued")
+            LTM_WRITER_QUEUE_DEPTH.set(self._queue.qsize())
+
+    async def _write_batch(self, batch: List[LTMWriteRequest]) -> None:
+        try:
+            summaries = await self.summarizer(batch)
+            embeddings = await self.embedder([s.get("text", "") for s in summaries]) if self.embedder else [None] * len(batch)
+            entries = [
+                LongTermMemoryEntry(
+                    _id=request.entry_id,
+                    user_id=request.user_id,
+                    app_id=request.app_id,
+                    type="summary",
+                    content=summary,
+                    embedding=embedding
+                )
+                for request, summary, embedding in zip(batch, summaries, embeddings)
+            ]
+            await self.store.add_ltm_entries(entries)
+        except Exception as e:
+            logger.error(f"Failed to write a batch of {len(batch)} LTM entries: {e}", exc_info=True)
+            if self.spill_path:
+                self._spill(batch)
+            else:
+                self._count("failed", len(batch))
+            return
+        self._stats["batches"] += 1
+        self._count("written", len(entries))
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats, "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+                "max_queue_size": self.max_queue_size, "overflow_policy": self.overflow_policy}
@@ -0,0 +1,245 @@
+import functools
+import math
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds, from a fast Mongo read up to a long agent run.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in sorted(self._values.items())]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [per-bucket counts (non-cumulative, last slot is +Inf), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels: str) -> int:
+        series = self._series.get(self._key(labels))
+        return series[2] if series else 0
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, math.inf), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', _format_value(bound)))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    In-process metrics rendered in the Prometheus text format. Recording is a dict update
+    on the event loop thread; all formatting happens on scrape, so the hot path pays
+    nothing extra when /metrics is never requested.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class StageTimer:
+    """
+    Times the stages of one agent turn. Durations of a stage entered repeatedly (run
+    polling, tool rounds) are summed; each span is also observed in AGENT_STAGE_SECONDS.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages_ms: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            AGENT_STAGE_SECONDS.observe(elapsed, stage=name)
+            self.stages_ms[name] = round(self.stages_ms.get(name, 0.0) + elapsed * 1000, 2)
+
+    def summary(self) -> Dict[str, object]:
+        return {"stages_ms": dict(self.stages_ms), "total_ms": round((time.perf_counter() - self.started) * 1000, 2)}
+
+
+def timed_mongo_op(fn: Callable) -> Callable:
+    """Records the latency of a MongoService coroutine method under its method name."""
+    method = fn.__name__
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            MONGO_OP_SECONDS.observe(time.perf_counter() - start, method=method)
+    return wrapper
+
+
+registry = MetricsRegistry()
+
+AGENT_STAGE_SECONDS = registry.histogram(
+    "agent_stage_seconds", "Time spent in each stage of an agent turn.", ["stage"])
+MONGO_OP_SECONDS = registry.histogram(
+    "mongo_op_seconds", "Latency of MongoService operations.", ["method"])
+TOOL_CALL_SECONDS = registry.histogram(
+    "tool_call_seconds", "Latency of tool calls, including cache lookups.", ["tool", "status", "cached"])
+SSE_ACTIVE_STREAMS = registry.gauge(
+    "sse_active_streams", "Chat streams currently open.")
+SSE_STREAMS_TOTAL = registry.counter(
+    "sse_streams_total", "Chat streams opened.")
+SSE_TIME_TO_FIRST_CHUNK_SECONDS = registry.histogram(
+    "sse_time_to_first_chunk_seconds", "Time from receiving a chat request to sending its first message chunk.")
+LLM_TIME_TO_FIRST_TOKEN_SECONDS = registry.histogram(
+    "llm_time_to_first_token_seconds", "Time from starting a run to the first answer text.", ["mode"])
+LLM_ROUND_TRIPS = registry.histogram(
+    "llm_round_trips_per_turn", "Assistants API calls per chat turn.", ["mode"],
+    buckets=(1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 30, 50))
+LTM_WRITER_ENTRIES = registry.counter(
+    "ltm_writer_entries_total", "Long-term memory write requests by outcome.", ["outcome"])
+LTM_WRITER_QUEUE_DEPTH = registry.gauge(
+    "ltm_writer_queue_depth", "Long-term memory write requests waiting in the queue.")
+AGENT_CANCELLED_RUNS = registry.counter(
+    "agent_cancelled_runs_total",
+    "Agent turns abandoned because the client disconnected, by run mode and what happened to the upstream run.",
+    ["mode", "upstream"])
+AGENT_CANCELLED_WORK = registry.counter(
+    "agent_cancelled_work_total",
+    "Work not done because the client disconnected: upstream runs cancelled, tool calls aborted, LTM writes skipped.",
+    ["kind"])
+AGENT_CANCELLED_AFTER_SECONDS = registry.histogram(
+    "agent_cancelled_after_seconds", "How far into the turn the client disconnected.", ["mode"])
+RESPONSE_CACHE_LOOKUPS = registry.counter(
+    "response_cache_lookups_total", "Answer cache lookups by result: exact, semantic or miss.", ["result"])
+SESSION_CACHE_LOOKUPS = registry.counter(
+    "session_cache_lookups_total", "Session reads served from the session cache (hit) or MongoDB (miss), and appends that found the read copy out of date (stale).",
+    ["result"])
+SESSION_HEADER_UPDATES = registry.counter(
+    "session_header_updates_total",
+    "Session TTL bumps written to MongoDB (ttl_written) or folded into a pending bump (ttl_coalesced).",
+    ["kind"])
+APP_STARTUP_STEP_SECONDS = registry.gauge(
+    "app_startup_step_seconds", "How long each step of the most recent startup took.", ["step"])
+PROMPT_CONTEXT_TOKENS = registry.histogram(
+    "prompt_context_tokens", "Tokens of LTM and recent turns sent with each run.",
+    buckets=(0, 100, 250, 500, 1000, 2000, 4000, 8000, 16000))
+PROMPT_CONTEXT_ITEMS = registry.counter(
+    "prompt_context_items_total", "LTM entries and turns included in, truncated for, or dropped from the prompt context.",
+    ["kind", "outcome"])
+ADMISSION_DECISIONS = registry.counter(
+    "admission_decisions_total",
+    "Chat stream admission outcomes: admitted, queued (admitted after waiting), or the reason for a rejection.",
+    ["outcome"])
+ADMISSION_QUEUE_DEPTH = registry.gauge(
+    "admission_queue_depth", "Chat requests waiting for a stream slot.")
+ADMISSION_QUEUE_WAIT_SECONDS = registry.histogram(
+    "admission_queue_wait_seconds", "How long admitted chat requests waited for a stream slot.")
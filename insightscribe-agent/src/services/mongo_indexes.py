@@ -0,0 +1,117 @@
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+
+class IndexSpec(BaseModel):
+    collection: str
+    keys: List[Tuple[str, int]]
+    unique: bool = False
+    expire_after_seconds: Optional[int] = None # Set for TTL indexes
+
+
+class QueryShape(BaseModel):
+    """A query MongoService issues, with representative values, used to check index coverage."""
+    name: str
+    collection: str
+    filter: Dict[str, Any]
+    sort: Optional[List[Tuple[str, int]]] = None
+
+
+# Every index MongoService relies on. Names are left to MongoDB's defaults so that
+# indexes created by earlier versions are recognised as the same index.
+INDEXES: List[IndexSpec] = [
+    IndexSpec(collection="sessions", keys=[("session_id", ASCENDING)], unique=True),
+    IndexSpec(collection="sessions", keys=[("expires_at", ASCENDING)], expire_after_seconds=0),
+    IndexSpec(collection="sessions", keys=[("app_id", ASCENDING), ("created_at", ASCENDING)]),
+    IndexSpec(collection="sessions", keys=[("created_at", ASCENDING)]),
+    IndexSpec(collection="session_rollups", keys=[("app_id", ASCENDING), ("hour", ASCENDING)]),
+    IndexSpec(collection="session_rollups", keys=[("hour", ASCENDING)]),
+    IndexSpec(collection="session_turns", keys=[("session_id", ASCENDING), ("bucket_no", ASCENDING)], unique=True),
+    IndexSpec(collection="session_turns", keys=[("expires_at", ASCENDING)], expire_after_seconds=0),
+    IndexSpec(collection="app_repo", keys=[("app_id", ASCENDING)], unique=True),
+    IndexSpec(collection="app_repo", keys=[("updated_at", ASCENDING)]),
+    IndexSpec(collection="long_term_memory", keys=[("user_id", ASCENDING), ("app_id", ASCENDING), ("created_at", ASCENDING)]),
+    IndexSpec(collection="tool_result_cache", keys=[("expires_at", ASCENDING)], expire_after_seconds=0),
+]
+
+_NOW = datetime(2025, 1, 1)
+
+# The hot query shapes in MongoService. Each one should be answered by an index above.
+QUERY_SHAPES: List[QueryShape] = [
+    QueryShape(name="get_session", collection="sessions", filter={"session_id": "sess-x"}),
+    QueryShape(name="append_embedded", collection="sessions",
+               filter={"session_id": "sess-x", "conversation_layout": {"$ne": "bucketed"}}),
+    QueryShape(name="session_analytics_for_app", collection="sessions",
+               filter={"app_id": "app-x", "created_at": {"$gte": _NOW, "$lt": _NOW}}),
+    QueryShape(name="session_analytics", collection="sessions", filter={"created_at": {"$gte": _NOW, "$lt": _NOW}}),
+    QueryShape(name="hourly_rollups_for_app", collection="session_rollups",
+               filter={"app_id": "app-x", "hour": {"$gte": _NOW, "$lt": _NOW}}, sort=[("hour", ASCENDING)]),
+    QueryShape(name="hourly_rollups", collection="session_rollups",
+               filter={"hour": {"$gte": _NOW, "$lt": _NOW}}, sort=[("hour", ASCENDING)]),
+    QueryShape(name="read_bucketed_turns", collection="session_turns",
+               filter={"session_id": "sess-x", "bucket_no": {"$gte": 0, "$lte": 3}}, sort=[("bucket_no", ASCENDING)]),
+    QueryShape(name="refresh_bucket_ttl", collection="session_turns",
+               filter={"session_id": "sess-x", "bucket_no": {"$lt": 3}, "expires_at": {"$lt": _NOW}}),
+    QueryShape(name="get_app_config", collection="app_repo", filter={"app_id": "app-x"}),
+    QueryShape(name="poll_app_repo_changes", collection="app_repo", filter={"updated_at": {"$gt": _NOW}}),
+    QueryShape(name="recent_ltm_for_app", collection="long_term_memory",
+               filter={"user_id": "user-x", "app_id": "app-x"}, sort=[("created_at", DESCENDING)]),
+    QueryShape(name="recent_ltm_for_user", collection="long_term_memory",
+               filter={"user_id": "user-x"}, sort=[("created_at", DESCENDING)]),
+    QueryShape(name="ltm_index_catch_up", collection="long_term_memory",
+               filter={"user_id": "user-x", "app_id": "app-x", "created_at": {"$gte": _NOW}, "embedding": {"$type": "array"}}),
+    QueryShape(name="get_tool_result", collection="tool_result_cache", filter={"_id": "key-x", "expires_at": {"$gt": _NOW}}),
+]
+
+
+async def ensure_indexes(db) -> None:
+    """Creates every registered index. Idempotent: existing identical indexes are left alone."""
+    for spec in INDEXES:
+        options: Dict[str, Any] = {"background": True}
+        if spec.unique:
+            options["unique"] = True
+        if spec.expire_after_seconds is not None:
+            options["expireAfterSeconds"] = spec.expire_after_seconds
+        try:
+            name = await db[spec.collection].create_index(spec.keys, **options)
+            logger.info(f"Ensured index '{name}' on '{spec.collection}'.")
+        except PyMongoError as e:
+            logger.error(f"Error ensuring index {spec.keys} on '{spec.collection}': {e}")
+
+
+def _plan_stages(plan: Any) -> List[str]:
+    """Collects every 'stage' name in an explain plan tree (classic and SBE formats)."""
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(_plan_stages(item))
+    return stages
+
+
+async def find_collscans(db) -> List[Dict[str, Any]]:
+    """
+    Explains every registered query shape and returns those whose winning plan
+    contains a COLLSCAN, i.e. shapes that no index supports.
+    """
+    report = []
+    for shape in QUERY_SHAPES:
+        cursor = db[shape.collection].find(shape.filter)
+        if shape.sort:
+            cursor = cursor.sort(shape.sort)
+        explain = await cursor.explain()
+        stages = _plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {}))
+        if "COLLSCAN" in stages:
+            report.append({"query": shape.name, "collection": shape.collection, "stages": stages})
+    return report
@@ -1,56 +1,124 @@
-from pymongo import MongoClient, ASCENDING
-from pymongo.errors import CollectionInvalid
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError
+from datetime import datetime, timedelta
 from src.config import settings
 from src.models.db_models import SessionMemory, AppRepo, ConversationTurn, LongTermMemoryEntry
-from typing import Optional, List
+from src.models.records import LTMRecord, TurnRecord
+from src.services import mongo_indexes
+from src.services.app_config_cache import AppConfigCache
+from src.services.ltm_index import LTMIndexRegistry
+from src.services.metrics import timed_mongo_op
+from typing import Dict, Optional, List, Union
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Values for SessionMemory.conversation_layout
+LAYOUT_EMBEDDED = "embedded" # Turns live in the session document's `conversation` array
+LAYOUT_BUCKETED = "bucketed" # Turns live in fixed-size documents in `session_turns`
+
+DUPLICATE_KEY_ERROR = 11000
+
+def rollup_hour(at: datetime) -> datetime:
+    """The session_rollups bucket a moment falls in."""
+    return at.replace(minute=0, second=0, microsecond=0)
+
 class MongoService:
     def __init__(self):
-        self.client = MongoClient(settings.MONGO_URI)
+        # Motor connects lazily, so building the client here does no network I/O.
+        # All requests in the worker share this client's connection pool.
+        self.client = AsyncIOMotorClient(
+            settings.MONGO_URI,
+            minPoolSize=settings.MONGO_MIN_POOL_SIZE,
+            maxPoolSize=settings.MONGO_MAX_POOL_SIZE,
+            waitQueueTimeoutMS=settings.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+            serverSelectionTimeoutMS=settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        )
         self.db = self.client[settings.MONGO_DB_NAME]
-        self._ensure_indexes()
-
-    def _ensure_indexes(self):
-        # Ensure TTL index for sessions
-        try:
-            self.db.sessions.create_index(
-                "expires_at",
-                expireAfterSeconds=0,
-                background=True
-            )
-            logger.info("Ensured TTL index on 'sessions' collection.")
-        except CollectionInvalid:
-            logger.warning("Collection 'sessions' does not exist yet. Index will be created on first insert.")
-        except Exception as e:
-            logger.error(f"Error ensuring TTL index on sessions: {e}")
+        self.app_config_cache = AppConfigCache(
+            self.db.app_repo,
+            self._fetch_app_config,
+            max_size=settings.APP_CONFIG_CACHE_MAX_SIZE,
+            ttl_seconds=settings.APP_CONFIG_CACHE_TTL_SECONDS,
+            poll_interval_seconds=settings.APP_CONFIG_CACHE_POLL_INTERVAL_SECONDS,
+        )
+        self.ltm_index = LTMIndexRegistry(
+            self.db.long_term_memory,
+            max_indexes=settings.LTM_INDEX_MAX_INDEXES,
+            refresh_seconds=settings.LTM_INDEX_REFRESH_SECONDS,
+            rebuild_seconds=settings.LTM_INDEX_REBUILD_SECONDS,
+            catch_up_overlap_seconds=settings.LTM_INDEX_CATCH_UP_OVERLAP_SECONDS,
+        )
 
-        # Ensure unique index for app_id in app_repo
-        try:
-            self.db.app_repo.create_index(
-                "app_id",
-                unique=True,
-                background=True
-            )
-            logger.info("Ensured unique index on 'app_repo.app_id'.")
-        except CollectionInvalid:
-            logger.warning("Collection 'app_repo' does not exist yet. Index will be created on first insert.")
-        except Exception as e:
-            logger.error(f"Error ensuring unique index on app_repo: {e}")
+    async def ensure_indexes(self):
+        """Creates the indexes in the registry (src/services/mongo_indexes.py). Called once at application startup."""
+        await mongo_indexes.ensure_indexes(self.db)
 
+    @timed_mongo_op
     async def create_session(self, session: SessionMemory):
         """Inserts a new session document."""
         await self.db.sessions.insert_one(session.dict(by_alias=True))
+        await self._bump_rollup(session.app_id, session.created_at, {"sessions_created": 1})
 
-    async def get_session(self, session_id: str) -> Optional[SessionMemory]:
-        """Retrieves a session by session_id."""
-        session_data = await self.db.sessions.find_one({"session_id": session_id})
+    @timed_mongo_op
+    async def get_session(self, session_id: str, conversation_window: Optional[int] = None) -> Optional[SessionMemory]:
+        """
+        Retrieves a session by session_id.
+        If conversation_window is given, only the last N turns are read (server-side $slice),
+        so the returned session's conversation holds at most that many turns.
+        """
+        projection = None
+        if conversation_window is not None:
+            projection = {"conversation": {"$slice": -conversation_window}}
+        session_data = await self.db.sessions.find_one({"session_id": session_id}, projection)
         if session_data:
+            if session_data.get("conversation_layout") == LAYOUT_BUCKETED:
+                session_data["conversation"] = await self._read_bucketed_turns(session_data, conversation_window)
             return SessionMemory(**session_data)
         return None
 
+    @timed_mongo_op
+    async def get_conversation_window(self, session_id: str, window_size: int,
+                                      raw: bool = False) -> Optional[List[Union[ConversationTurn, TurnRecord]]]:
+        """
+        Retrieves only the last N conversation turns of a session, or None if the session does not exist.
+        With raw, turns are returned as unvalidated TurnRecords.
+        """
+        session_data = await self.db.sessions.find_one(
+            {"session_id": session_id},
+            {
+                "_id": 0, "session_id": 1, "conversation_layout": 1, "turn_count": 1, "bucket_size": 1,
+                "conversation": {"$slice": -window_size}
+            }
+        )
+        if session_data is None:
+            return None
+        turns = session_data.get("conversation", [])
+        if session_data.get("conversation_layout") == LAYOUT_BUCKETED:
+            turns = await self._read_bucketed_turns(session_data, window_size)
+        if raw:
+            return [TurnRecord.from_doc(turn) for turn in turns]
+        return [ConversationTurn(**turn) for turn in turns]
+
+    async def _read_bucketed_turns(self, header: dict, window_size: Optional[int]) -> List[dict]:
+        """Reads the last window_size turns (all turns if None) from a bucketed session's turn documents."""
+        turn_count = header.get("turn_count", 0)
+        if turn_count == 0 or window_size == 0:
+            return []
+        bucket_size = header["bucket_size"]
+        last_bucket = (turn_count - 1) // bucket_size
+        first_bucket = 0 if window_size is None else max(0, turn_count - window_size) // bucket_size
+        cursor = self.db.session_turns.find(
+            {"session_id": header["session_id"], "bucket_no": {"$gte": first_bucket, "$lte": last_bucket}},
+            {"_id": 0, "turns": 1}
+        ).sort("bucket_no", ASCENDING)
+        turns = []
+        async for bucket in cursor:
+            turns.extend(bucket["turns"])
+        return turns if window_size is None else turns[-window_size:]
+
+    @timed_mongo_op
     async def update_session_state(self, session_id: str, updates: dict):
         """Updates specific fields of a session."""
         await self.db.sessions.update_one(
@@ -58,49 +126,340 @@ class MongoService:
             {"$set": updates}
         )
 
-    async def append_to_conversation(self, session_id: str, turn: ConversationTurn):
-        """Appends a conversation turn and updates the session's updated_at and expires_at."""
+    @timed_mongo_op
+    async def set_session_state_if_absent(self, session_id: str, key: str, value) -> Optional[object]:
+        """
+        Sets ephemeral_state.<key> only if the session does not have it yet, so concurrent
+        requests agree on one value. Returns the value stored afterwards (the given one, or
+        the one another request set first), or None if the session does not exist.
+        """
+        field = f"ephemeral_state.{key}"
+        result = await self.db.sessions.update_one(
+            {"session_id": session_id, field: {"$exists": False}},
+            {"$set": {field: value}}
+        )
+        if result.modified_count:
+            return value
+        session_data = await self.db.sessions.find_one({"session_id": session_id}, {"_id": 0, field: 1})
+        if session_data is None:
+            return None
+        return session_data.get("ephemeral_state", {}).get(key)
+
+    @timed_mongo_op
+    async def append_to_conversation(self, session_id: str, turn: ConversationTurn, refresh_ttl: bool = True,
+                                     bump_rollup: bool = True) -> Optional[int]:
+        """
+        Appends a conversation turn and updates the session's updated_at and, unless
+        refresh_ttl is False (the caller bumps it later through flush_session_updates),
+        expires_at. User turns also advance the session's query counters and, unless
+        bump_rollup is False (the caller batches it into bump_rollups), the hourly rollup.
+        Returns the session's turn_count after the append, or None if the session does not exist.
+        """
         now = datetime.utcnow()
         expires_at = now + timedelta(hours=settings.SESSION_TTL_HOURS)
-        await self.db.sessions.update_one(
-            {"session_id": session_id},
-            {
-                "$push": {"conversation": turn.dict()},
-                "$set": {"updated_at": now, "expires_at": expires_at}
-            }
+        header_update = {"$inc": {"turn_count": 1}, "$set": {"updated_at": now}}
+        if refresh_ttl:
+            header_update["$set"]["expires_at"] = expires_at
+        if turn.role == "user":
+            header_update["$inc"]["query_count"] = 1
+            header_update["$set"]["last_query_at"] = now
+        # Each session records its own layout, so un-migrated sessions keep working after the
+        # default changes. Try the configured layout first; the other is only hit on a mismatch.
+        if settings.CONVERSATION_STORAGE == LAYOUT_BUCKETED:
+            header = await self._append_bucketed(session_id, turn, header_update, now, expires_at)
+            if header is None:
+                header = await self._append_embedded(session_id, turn, header_update)
+        else:
+            header = await self._append_embedded(session_id, turn, header_update)
+            if header is None:
+                header = await self._append_bucketed(session_id, turn, header_update, now, expires_at)
+        if header is None:
+            return None
+        if turn.role == "user" and bump_rollup:
+            await self._bump_rollup(header["app_id"], now, {"queries": 1})
+        return header["turn_count"]
+
+    async def _append_embedded(self, session_id: str, turn: ConversationTurn, header_update: dict) -> Optional[dict]:
+        """Returns the session's app_id and new turn_count, or None if the session is missing or bucketed."""
+        return await self.db.sessions.find_one_and_update(
+            {"session_id": session_id, "conversation_layout": {"$ne": LAYOUT_BUCKETED}},
+            {**header_update, "$push": {"conversation": turn.dict()}},
+            projection={"_id": 0, "app_id": 1, "turn_count": 1},
+            return_document=ReturnDocument.AFTER
         )
 
+    async def _append_bucketed(self, session_id: str, turn: ConversationTurn, header_update: dict,
+                               now: datetime, expires_at: datetime) -> Optional[dict]:
+        """Returns the session's app_id and new turn_count, or None if the session is missing or embedded."""
+        # Reserve the turn's position on the (small) session header first; it decides the bucket.
+        header = await self.db.sessions.find_one_and_update(
+            {"session_id": session_id, "conversation_layout": LAYOUT_BUCKETED},
+            header_update,
+            projection={"_id": 0, "app_id": 1, "turn_count": 1, "bucket_size": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if header is None:
+            return None
+        bucket_no = (header["turn_count"] - 1) // header["bucket_size"]
+        # Buckets outlive the header by half a TTL so they never expire while the session is alive.
+        # Older buckets are only rewritten once their expiry falls behind the header's, which happens
+        # at most once per half TTL rather than on every append.
+        bucket_expires_at = expires_at + timedelta(hours=settings.SESSION_TTL_HOURS / 2)
+        await self.db.session_turns.bulk_write([
+            UpdateOne(
+                {"session_id": session_id, "bucket_no": bucket_no},
+                {
+                    "$push": {"turns": turn.dict()},
+                    "$set": {"expires_at": bucket_expires_at},
+                    "$setOnInsert": {"created_at": now}
+                },
+                upsert=True
+            ),
+            UpdateMany(
+                {"session_id": session_id, "bucket_no": {"$lt": bucket_no}, "expires_at": {"$lt": expires_at}},
+                {"$set": {"expires_at": bucket_expires_at}}
+            )
+        ], ordered=False)
+        return header
+
+    @timed_mongo_op
+    async def record_run_usage(self, session_id: str, app_id: str, tokens: int):
+        """Adds the tokens consumed by an agent run to the session counters and the hourly rollup."""
+        await self.db.sessions.update_one({"session_id": session_id}, {"$inc": {"total_tokens": tokens}})
+        await self._bump_rollup(app_id, datetime.utcnow(), {"tokens": tokens})
+
+    @timed_mongo_op
+    async def flush_session_updates(self, updates: Dict[str, dict]):
+        """
+        Applies deferred per-session header updates in one round trip. Each value may hold
+        "expires_at" (only ever moved forward) and "total_tokens" (added to the counter).
+        """
+        operations = []
+        for session_id, update in updates.items():
+            ops = {}
+            if update.get("expires_at") is not None:
+                ops["$max"] = {"expires_at": update["expires_at"]}
+            if update.get("total_tokens"):
+                ops["$inc"] = {"total_tokens": update["total_tokens"]}
+            if ops:
+                operations.append(UpdateOne({"session_id": session_id}, ops))
+        if operations:
+            await self.db.sessions.bulk_write(operations, ordered=False)
+
+    async def _bump_rollup(self, app_id: str, at: datetime, increments: dict):
+        """Increments the per-app, per-hour counters in session_rollups."""
+        await self.bump_rollups({(app_id, rollup_hour(at)): increments})
+
+    @timed_mongo_op
+    async def bump_rollups(self, increments: Dict[tuple, dict]):
+        """Applies counter increments keyed by (app_id, rollup_hour(...)) to session_rollups in one round trip."""
+        if not settings.ANALYTICS_ROLLUPS_ENABLED or not increments:
+            return
+        await self.db.session_rollups.bulk_write([
+            UpdateOne(
+                {"_id": f"{app_id}:{hour.isoformat()}"},
+                {"$inc": counters, "$setOnInsert": {"app_id": app_id, "hour": hour}},
+                upsert=True
+            )
+            for (app_id, hour), counters in increments.items()
+        ], ordered=False)
+
+    @timed_mongo_op
+    async def get_session_analytics(self, app_id: Optional[str] = None, start: Optional[datetime] = None,
+                                    end: Optional[datetime] = None) -> dict:
+        """Aggregates usage over live sessions created in [start, end), in a single server-side pipeline."""
+        match = {}
+        if app_id:
+            match["app_id"] = app_id
+        if start or end:
+            match["created_at"] = {}
+            if start:
+                match["created_at"]["$gte"] = start
+            if end:
+                match["created_at"]["$lt"] = end
+        pipeline = [
+            {"$match": match},
+            {"$group": {
+                "_id": None,
+                "total_sessions": {"$sum": 1},
+                "total_queries": {"$sum": "$query_count"},
+                "total_tokens_used": {"$sum": "$total_tokens"},
+                "average_queries_per_session": {"$avg": {"$ifNull": ["$query_count", 0]}},
+                # $avg skips nulls, so sessions without any query do not count towards duration
+                "average_session_duration_seconds": {"$avg": {"$cond": [
+                    {"$gt": ["$last_query_at", None]},
+                    {"$divide": [{"$subtract": ["$last_query_at", "$created_at"]}, 1000]},
+                    None
+                ]}},
+                "max_queries_in_session": {"$max": {"$ifNull": ["$query_count", 0]}},
+                "min_queries_in_session": {"$min": {"$ifNull": ["$query_count", 0]}},
+            }},
+            {"$project": {"_id": 0}}
+        ]
+        results = await self.db.sessions.aggregate(pipeline).to_list(length=1)
+        analytics = {
+            "total_sessions": 0,
+            "total_queries": 0,
+            "total_tokens_used": 0,
+            "average_queries_per_session": 0,
+            "average_session_duration_seconds": 0,
+            "max_queries_in_session": 0,
+            "min_queries_in_session": 0,
+        }
+        if results:
+            analytics.update({k: v for k, v in results[0].items() if v is not None})
+        return analytics
+
+    @timed_mongo_op
+    async def get_hourly_rollups(self, app_id: Optional[str] = None, start: Optional[datetime] = None,
+                                 end: Optional[datetime] = None) -> List[dict]:
+        """Returns per-app, per-hour usage counters in [start, end), oldest first."""
+        query = {}
+        if app_id:
+            query["app_id"] = app_id
+        if start or end:
+            query["hour"] = {}
+            if start:
+                query["hour"]["$gte"] = start
+            if end:
+                query["hour"]["$lt"] = end
+        cursor = self.db.session_rollups.find(query, {"_id": 0}).sort("hour", ASCENDING)
+        return await cursor.to_list(length=None)
+
+    @timed_mongo_op
+    async def migrate_session_to_buckets(self, session_id: str, bucket_size: Optional[int] = None) -> bool:
+        """
+        Moves an embedded session's conversation into session_turns buckets.
+        Idempotent; returns False if the session is missing or already bucketed.
+        """
+        bucket_size = bucket_size or settings.CONVERSATION_BUCKET_SIZE
+        while True:
+            session_data = await self.db.sessions.find_one(
+                {"session_id": session_id, "conversation_layout": {"$ne": LAYOUT_BUCKETED}},
+                {"conversation": 1, "expires_at": 1}
+            )
+            if session_data is None:
+                return False
+            turns = session_data.get("conversation", [])
+            bucket_expires_at = session_data["expires_at"] + timedelta(hours=settings.SESSION_TTL_HOURS / 2)
+            requests = [
+                UpdateOne(
+                    {"session_id": session_id, "bucket_no": start // bucket_size},
+                    {
+                        "$set": {"turns": turns[start:start + bucket_size], "expires_at": bucket_expires_at},
+                        "$setOnInsert": {"created_at": datetime.utcnow()}
+                    },
+                    upsert=True
+                )
+                for start in range(0, len(turns), bucket_size)
+            ]
+            if requests:
+                await self.db.session_turns.bulk_write(requests, ordered=False)
+            # Only flip the header if no turn was appended while the buckets were written.
+            result = await self.db.sessions.update_one(
+                {"session_id": session_id, "conversation": {"$size": len(turns)}},
+                {
+                    "$set": {"conversation_layout": LAYOUT_BUCKETED, "turn_count": len(turns), "bucket_size": bucket_size},
+                    "$unset": {"conversation": ""}
+                }
+            )
+            if result.matched_count:
+                return True
+            logger.info(f"Session {session_id} changed during migration; retrying.")
+
     async def get_app_config(self, app_id: str) -> Optional[AppRepo]:
-        """Retrieves an AppRepo configuration by app_id."""
+        """Retrieves an AppRepo configuration by app_id, served from the in-process cache when possible."""
+        return await self.app_config_cache.get(app_id)
+
+    @timed_mongo_op
+    async def _fetch_app_config(self, app_id: str) -> Optional[AppRepo]:
+        """Reads and parses an AppRepo document, bypassing the cache."""
         app_data = await self.db.app_repo.find_one({"app_id": app_id})
         if app_data:
             return AppRepo(**app_data)
         return None
 
+    @timed_mongo_op
     async def add_ltm_entry(self, entry: LongTermMemoryEntry):
         """Adds a new long-term memory entry."""
         await self.db.long_term_memory.insert_one(entry.dict(by_alias=True))
+        if entry.embedding:
+            self.ltm_index.add(entry.user_id, entry.app_id, entry.id, entry.embedding, entry.created_at)
+
+    @timed_mongo_op
+    async def add_ltm_entries(self, entries: List[LongTermMemoryEntry]):
+        """
+        Adds a batch of long-term memory entries in one round trip. created_at is set to the
+        insert time, so other workers' index catch-ups, which read forward from the newest
+        created_at they have seen, find entries that were queued long before they were written.
+        """
+        if not entries:
+            return
+        now = datetime.utcnow()
+        for entry in entries:
+            entry.created_at = now
+        try:
+            await self.db.long_term_memory.insert_many([entry.dict(by_alias=True) for entry in entries], ordered=False)
+        except BulkWriteError as e:
+            # Entries whose _id is already stored were written by an earlier attempt; the rest went in.
+            if any(error["code"] != DUPLICATE_KEY_ERROR for error in e.details.get("writeErrors", [])) \
+                    or e.details.get("writeConcernErrors"):
+                raise
+            logger.info(f"Skipped {len(e.details['writeErrors'])} LTM entries that were already stored.")
+        for entry in entries:
+            if entry.embedding:
+                self.ltm_index.add(entry.user_id, entry.app_id, entry.id, entry.embedding, entry.created_at)
+
+    @timed_mongo_op
+    async def get_ltm_for_user(self, user_id: str, app_id: str = None, limit: int = 5,
+                               query_embedding: Optional[List[float]] = None,
+                               raw: bool = False) -> List[Union[LongTermMemoryEntry, LTMRecord]]:
+        """
+        Retrieves relevant long-term memory entries for a user.
+        With a query_embedding and app_id, returns the most similar entries (best first)
+        from the in-process vector index; otherwise the most recent entries.
+        With raw, only LTMRecord.FIELDS are read and entries are returned as unvalidated LTMRecords.
+        """
+        if query_embedding and app_id:
+            return await self.search_ltm(user_id, app_id, query_embedding, limit, raw=raw)
 
-    async def get_ltm_for_user(self, user_id: str, app_id: str = None, limit: int = 5) -> List[LongTermMemoryEntry]:
-        """Retrieves relevant long-term memory entries for a user."""
         query = {"user_id": user_id}
         if app_id:
             query["app_id"] = app_id
-        
-        # In a real RAG system, this would involve vector search.
-        # For now, it's a simple retrieval.
-        cursor = self.db.long_term_memory.find(query).sort("created_at", ASCENDING).limit(limit)
+        cursor = self.db.long_term_memory.find(query, LTMRecord.FIELDS if raw else None).sort("created_at", DESCENDING).limit(limit)
+        if raw:
+            return [LTMRecord.from_doc(doc) async for doc in cursor]
         return [LongTermMemoryEntry(**doc) async for doc in cursor]
 
+    @timed_mongo_op
+    async def search_ltm(self, user_id: str, app_id: str, query_embedding: List[float], k: int = 5,
+                         raw: bool = False) -> List[Union[LongTermMemoryEntry, LTMRecord]]:
+        """Returns the top-k LTM entries for (user_id, app_id) by cosine similarity, best first."""
+        hits = await self.ltm_index.search(user_id, app_id, query_embedding, k)
+        if not hits:
+            return []
+        cursor = self.db.long_term_memory.find({"_id": {"$in": [doc_id for doc_id, _ in hits]}}, LTMRecord.FIELDS if raw else None)
+        docs = {doc["_id"]: doc async for doc in cursor}
+        parse = LTMRecord.from_doc if raw else lambda doc: LongTermMemoryEntry(**doc)
+        return [parse(docs[doc_id]) for doc_id, _ in hits if doc_id in docs]
+
+    @timed_mongo_op
     async def delete_session_by_id(self, session_id: str) -> int:
-        """Deletes a session document. Used for test cleanup."""
+        """Deletes a session document and its turn buckets. Used for test cleanup."""
         result = await self.db.sessions.delete_one({"session_id": session_id})
+        await self.db.session_turns.delete_many({"session_id": session_id})
         return result.deleted_count
 
+    @timed_mongo_op
     async def delete_ltm_by_id(self, ltm_id: str) -> int:
         """Deletes an LTM document by its _id. Used for test cleanup."""
         from bson import ObjectId
-        result = await self.db.long_term_memory.delete_one({"_id": ObjectId(ltm_id)})
-        return result.deleted_count
+        deleted = await self.db.long_term_memory.find_one_and_delete({"_id": ObjectId(ltm_id)}, {"user_id": 1, "app_id": 1})
+        if deleted is None:
+            return 0
+        self.ltm_index.invalidate(deleted["user_id"], deleted["app_id"])
+        return 1
 
-mongo_service = MongoService()
+    def close(self):
+        """Closes the client and its connection pool."""
+        self.client.close()
@@ -0,0 +1,187 @@
+import logging
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from pydantic import BaseModel
+
+from ..config import settings
+from ..models.db_models import AppRepo
+from .cache import LRUTTLCache
+from .ltm_writer import Embedder
+from .metrics import RESPONSE_CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+# Stands in for the user_id of scopes whose answers any user of the app may be served.
+SHARED_SCOPE = "*"
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_message(message: str) -> str:
+    """Case, surrounding whitespace, repeated spaces and trailing punctuation do not change a question."""
+    return _WHITESPACE.sub(" ", message).strip().rstrip("?!.").strip().lower()
+
+
+class ResponseCachePolicy(BaseModel):
+    """
+    Per-app answer caching, configured under AppRepo config["response_cache"].
+    Unset keys fall back to Settings; caching is off unless enabled is set.
+    """
+    enabled: bool = False
+    ttl_seconds: float = settings.RESPONSE_CACHE_TTL_SECONDS
+    similarity_threshold: Optional[float] = settings.RESPONSE_CACHE_SIMILARITY_THRESHOLD # None: exact matches only
+    # Answers built without any of the user's LTM or earlier turns may be served to other users of the app.
+    share_across_users: bool = False
+    # Only answers to a session's first message are stored, so follow-ups that lean on
+    # earlier turns ("and for Q2?") are never reused out of context. When off, answers
+    # built with earlier turns in context are kept to the asking user's scope.
+    standalone_only: bool = True
+    # Part of the cache scope: bump it when the app's data is refreshed to retire every cached answer.
+    data_version: Optional[str] = None
+
+    @classmethod
+    def for_app(cls, app_config: AppRepo) -> "ResponseCachePolicy":
+        return cls(**app_config.config.get("response_cache", {}))
+
+
+class ResponseLookup(BaseModel):
+    """Outcome of ResponseCache.lookup; kept by the caller so a miss can be stored without re-embedding."""
+    normalized: str
+    embedding: Optional[List[float]] = None
+    events: Optional[List[Dict[str, Any]]] = None # Set on a hit
+    match: Optional[str] = None # "exact" or "semantic"
+    similarity: Optional[float] = None
+
+
+class ResponseCache:
+    """
+    In-process cache of finished agent answers, stored as the SSE events that carried
+    them so a hit replays the same sequence.
+
+    Answers are kept per scope: (app_id, assistant_id, data_version, user_id), where
+    user_id is SHARED_SCOPE for answers any user of the app may get. A lookup tries an
+    exact match on the normalized message, then the closest stored question by cosine
+    similarity when an embedder is configured. Scopes are LRU-bounded, as are the
+    answers within a scope; each answer expires after its own TTL.
+    """
+
+    def __init__(self, max_scopes: int, max_entries_per_scope: int, embedder: Optional[Embedder] = None):
+        self._scopes = LRUTTLCache(max_size=max_scopes, ttl_seconds=0)
+        self.max_entries_per_scope = max_entries_per_scope
+        self.embedder = embedder
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.embedding_errors = 0
+
+    @staticmethod
+    def _scope(app_config: AppRepo, policy: ResponseCachePolicy, user_id: str) -> Tuple[str, ...]:
+        return (app_config.app_id, app_config.assistant_id or "", policy.data_version or "", user_id)
+
+    def _live_entries(self, scope: Tuple[str, ...]) -> Optional["OrderedDict[str, Dict[str, Any]]"]:
+        entries = self._scopes.get(scope)
+        if entries is None:
+            return None
+        now = time.monotonic()
+        for key in [key for key, entry in entries.items() if entry["expires_at"] <= now]:
+            del entries[key]
+        return entries
+
+    async def lookup(self, app_config: AppRepo, user_id: str, message: str, policy: ResponseCachePolicy) -> ResponseLookup:
+        lookup = ResponseLookup(normalized=normalize_message(message))
+        scopes = [self._scope(app_config, policy, user_id)]
+        if policy.share_across_users:
+            scopes.append(self._scope(app_config, policy, SHARED_SCOPE))
+        candidates = [entries for entries in map(self._live_entries, scopes) if entries]
+
+        for entries in candidates:
+            entry = entries.get(lookup.normalized)
+            if entry is not None:
+                entries.move_to_end(lookup.normalized)
+                self.exact_hits += 1
+                RESPONSE_CACHE_LOOKUPS.inc(result="exact")
+                lookup.events, lookup.match = entry["events"], "exact"
+                return lookup
+
+        if self.embedder is not None and policy.similarity_threshold is not None:
+            try:
+                lookup.embedding = (await self.embedder([lookup.normalized]))[0]
+            except Exception as e:
+                self.embedding_errors += 1
+                logger.warning(f"Could not embed message for response cache lookup: {e}")
+            if lookup.embedding is not None:
+                best = self._most_similar(candidates, lookup.embedding)
+                if best is not None and best[1] >= policy.similarity_threshold:
+                    entry, lookup.similarity = best
+                    self.semantic_hits += 1
+                    RESPONSE_CACHE_LOOKUPS.inc(result="semantic")
+                    lookup.events, lookup.match = entry["events"], "semantic"
+                    return lookup
+
+        self.misses += 1
+        RESPONSE_CACHE_LOOKUPS.inc(result="miss")
+        return lookup
+
+    @staticmethod
+    def _most_similar(candidates: List["OrderedDict[str, Dict[str, Any]]"], embedding: List[float]) -> Optional[Tuple[Dict[str, Any], float]]:
+        entries = [entry for entries in candidates for entry in entries.values() if entry["embedding"] is not None]
+        entries = [entry for entry in entries if len(entry["embedding"]) == len(embedding)]
+        if not entries:
+            return None
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return None
+        # Stored embeddings are normalized when they are stored.
+        scores = np.stack([entry["embedding"] for entry in entries]) @ (query / norm)
+        best = int(np.argmax(scores))
+        return entries[best], float(scores[best])
+
+    def store(self, app_config: AppRepo, user_id: str, lookup: ResponseLookup, events: List[Dict[str, Any]],
+              policy: ResponseCachePolicy, ttl_seconds: float, personalized: bool) -> None:
+        """Stores a finished answer. Personalized answers (built with the user's LTM or turns) stay in their scope."""
+        shared = policy.share_across_users and not personalized
+        scope = self._scope(app_config, policy, SHARED_SCOPE if shared else user_id)
+        entries = self._scopes.get(scope)
+        if entries is None:
+            entries = OrderedDict()
+        embedding = None
+        if lookup.embedding is not None:
+            embedding = np.asarray(lookup.embedding, dtype=np.float32)
+            norm = np.linalg.norm(embedding)
+            embedding = embedding / norm if norm else None
+        entries[lookup.normalized] = {"events": events, "embedding": embedding, "expires_at": time.monotonic() + ttl_seconds}
+        entries.move_to_end(lookup.normalized)
+        while len(entries) > self.max_entries_per_scope:
+            entries.popitem(last=False)
+        # Scopes live as long as their longest-lived answer could.
+        self._scopes.set(scope, entries, ttl_seconds=max(ttl_seconds, policy.ttl_seconds))
+        self.stores += 1
+
+    def invalidate_app(self, app_id: str) -> int:
+        """Drops every cached answer of an app. Returns the number of scopes dropped."""
+        scopes = [scope for scope in self._scopes.keys() if scope[0] == app_id]
+        for scope in scopes:
+            self._scopes.invalidate(scope)
+        return len(scopes)
+
+    def stats(self) -> Dict[str, Any]:
+        scopes = self._scopes.stats()
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "scopes": scopes["size"],
+            "max_scopes": scopes["max_size"],
+            "scope_evictions": scopes["evictions"],
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+            "stores": self.stores,
+            "embeddings_enabled": self.embedder is not None,
+            "embedding_errors": self.embedding_errors,
+        }
@@ -0,0 +1,48 @@
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional
+
+from ..models.db_models import SessionMemory
+from .cache import LRUTTLCache
+
+
+class SessionCacheBackend(ABC):
+    """
+    Where SessionManager keeps recently used sessions. Backends store snapshots:
+    a session handed to set() or returned by get() must not be shared with other
+    callers, since request handlers mutate the objects they are given.
+    """
+
+    @abstractmethod
+    async def get(self, session_id: str) -> Optional[SessionMemory]:
+        pass
+
+    @abstractmethod
+    async def set(self, session: SessionMemory) -> None:
+        pass
+
+    @abstractmethod
+    async def delete(self, session_id: str) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class InMemorySessionBackend(SessionCacheBackend):
+    """Per-worker LRU of session snapshots. Not shared across workers or processes."""
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self._cache = LRUTTLCache(max_size=max_size, ttl_seconds=ttl_seconds)
+
+    async def get(self, session_id: str) -> Optional[SessionMemory]:
+        session = self._cache.get(session_id)
+        return session.copy(deep=True) if session is not None else None
+
+    async def set(self, session: SessionMemory) -> None:
+        self._cache.set(session.session_id, session.copy(deep=True))
+
+    async def delete(self, session_id: str) -> None:
+        self._cache.invalidate(session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return self._cache.stats()
@@ -1,16 +1,42 @@
+import asyncio
 import logging
 import uuid
 from datetime import datetime, timedelta
-from typing import List
+from typing import Any, Dict, List, Optional, Tuple
 
 from ..models.db_models import SessionMemory, ConversationTurn
-from ..services.mongo_service import mongo_service
+from ..services.mongo_service import MongoService, rollup_hour, LAYOUT_BUCKETED
+from ..services.metrics import SESSION_CACHE_LOOKUPS, SESSION_HEADER_UPDATES
+from ..services.session_cache import SessionCacheBackend
 from ..config import settings
 
 logger = logging.getLogger(__name__)
 
 class SessionManager:
-    """Manages the lifecycle of conversation sessions."""
+    """
+    Manages the lifecycle of conversation sessions.
+
+    With a cache backend, sessions are read through it (header plus the last cached_turns
+    turns) and appended turns are written through to both MongoDB and the cache. Keeping a
+    session alive, counting its tokens and the hourly rollup counters are deferred: pending
+    updates are flushed for all sessions in two bulk writes every flush_interval_seconds,
+    so a busy session sends at most one TTL bump per interval.
+
+    Cached copies can be behind what other workers wrote. Every append returns the stored
+    turn_count, and a copy whose count does not lead to it is replaced by a fresh read
+    before the turn uses it. Values that must not diverge, like the thread id, are set with
+    a conditional write (set_ephemeral_state_if_absent).
+    """
+
+    def __init__(self, mongo_service: MongoService, cache: Optional[SessionCacheBackend] = None, cached_turns: int = 10,
+                 flush_interval_seconds: float = 60):
+        self.mongo_service = mongo_service
+        self.cache = cache
+        self.cached_turns = cached_turns
+        self.flush_interval_seconds = flush_interval_seconds
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._pending_rollups: Dict[Tuple[str, datetime], Dict[str, int]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
 
     async def init_session(self, user_id: str, app_id: str, enable_ltm_write: bool, short_term_window: int) -> SessionMemory:
         """
@@ -18,7 +44,7 @@ class SessionManager:
         Validates that the app_id exists in the AppRepo.
         """
         logger.info(f"Attempting to initialize session for app_id: {app_id}")
-        app_config = await mongo_service.get_app_config(app_id)
+        app_config = await self.mongo_service.get_app_config(app_id)
         if not app_config:
             logger.error(f"AppRepo with app_id '{app_id}' not found during session init.")
             raise ValueError(f"AppRepo with app_id '{app_id}' not found.")
@@ -31,44 +57,214 @@ class SessionManager:
             session_id=session_id,
             user_id=user_id,
             app_id=app_id,
+            conversation_layout=settings.CONVERSATION_STORAGE,
+            bucket_size=settings.CONVERSATION_BUCKET_SIZE if settings.CONVERSATION_STORAGE == LAYOUT_BUCKETED else None,
             ephemeral_state={
                 "enable_ltm_write": enable_ltm_write,
                 "short_term_window": short_term_window
             },
             expires_at=expires_at
         )
-        
-        await mongo_service.create_session(session)
+
+        await self.mongo_service.create_session(session)
+        if self.cache is not None:
+            await self.cache.set(session)
         logger.info(f"Successfully created session: {session_id}")
         return session
 
-    async def get_session(self, session_id: str) -> SessionMemory | None:
-        """Retrieves a session from MongoDB."""
+    async def get_session(self, session_id: str, conversation_window: int | None = None) -> SessionMemory | None:
+        """
+        Retrieves a session, from the cache when possible.
+        Pass conversation_window to load only the most recent turns instead of the full history;
+        windows larger than the cached turns, and full histories, are always read from MongoDB.
+        """
         logger.debug(f"Retrieving session: {session_id}")
-        session = await mongo_service.get_session(session_id)
+        if self.cache is None or conversation_window is None or conversation_window > self.cached_turns:
+            session = await self.mongo_service.get_session(session_id, conversation_window)
+        else:
+            session = await self.cache.get(session_id)
+            SESSION_CACHE_LOOKUPS.inc(result="hit" if session is not None else "miss")
+            if session is None:
+                session = await self.mongo_service.get_session(session_id, self.cached_turns)
+                if session is not None:
+                    await self.cache.set(session)
+            if session is not None:
+                session.conversation = session.conversation[-conversation_window:] if conversation_window else []
         if not session:
             logger.warning(f"Session not found: {session_id}")
         return session
 
-    async def append_message(self, session_id: str, role: str, text: str) -> None:
-        """Appends a message to the conversation and refreshes the TTL."""
+    async def append_message(self, session: SessionMemory, role: str, text: str,
+                             conversation_window: Optional[int] = None) -> SessionMemory:
+        """
+        Appends a message to the conversation and refreshes the TTL. Returns the session as
+        the rest of the turn should see it: the given copy with the turn added or, when the
+        stored turn_count shows someone else wrote to the session since the copy was read,
+        a fresh read of its last conversation_window turns (all turns if None).
+        """
         # Note: For HIPAA compliance, consider redacting PHI from `text` before logging.
         # For this task, we will log the first 50 characters for context.
         log_text = text[:50] + '...' if len(text) > 50 else text
         logger.info(f"Appending message for role '{role}': '{log_text}'")
+        session_id = session.session_id
         turn = ConversationTurn(role=role, text=text)
-        await mongo_service.append_to_conversation(session_id, turn)
-        logger.debug("Message appended and TTL refreshed.")
+        if self.cache is None:
+            turn_count = await self.mongo_service.append_to_conversation(session_id, turn)
+            logger.debug("Message appended and TTL refreshed.")
+        else:
+            turn_count = await self.mongo_service.append_to_conversation(session_id, turn, refresh_ttl=False, bump_rollup=False)
+            if turn_count is not None:
+                if self._pending.get(session_id, {}).get("expires_at") is not None:
+                    SESSION_HEADER_UPDATES.inc(kind="ttl_coalesced")
+                self._defer(session_id, expires_at=turn.timestamp + timedelta(hours=settings.SESSION_TTL_HOURS))
+                if role == "user":
+                    self._defer_rollup(session.app_id, turn.timestamp, queries=1)
+            await self._write_through(session_id, turn, turn_count)
+            logger.debug("Message appended; TTL refresh deferred.")
+
+        if turn_count is not None and turn_count != session.turn_count + 1:
+            SESSION_CACHE_LOOKUPS.inc(result="stale")
+            logger.info(f"Session {session_id} changed elsewhere since it was read; reloading it.")
+            fresh = await self._reload(session_id, conversation_window)
+            if fresh is not None:
+                return fresh
+        session.conversation.append(turn)
+        session.turn_count = turn_count if turn_count is not None else session.turn_count + 1
+        return session
+
+    async def _reload(self, session_id: str, conversation_window: Optional[int]) -> Optional[SessionMemory]:
+        """Reads the session from MongoDB and, with a cache, replaces the cached copy."""
+        window = conversation_window
+        if self.cache is not None and window is not None:
+            window = max(window, self.cached_turns)
+        session = await self.mongo_service.get_session(session_id, window)
+        if session is None:
+            return None
+        if self.cache is not None:
+            cached = session.copy()
+            cached.conversation = session.conversation[-self.cached_turns:]
+            await self.cache.set(cached)
+        if conversation_window is not None:
+            session.conversation = session.conversation[-conversation_window:] if conversation_window else []
+        return session
+
+    async def _write_through(self, session_id: str, turn: ConversationTurn, turn_count: Optional[int]) -> None:
+        session = await self.cache.get(session_id)
+        if session is None:
+            return
+        if turn_count != session.turn_count + 1:
+            # Another worker appended to (or something deleted) the session since it was cached.
+            await self.cache.delete(session_id)
+            return
+        session.conversation = (session.conversation + [turn])[-self.cached_turns:]
+        session.turn_count = turn_count
+        session.updated_at = turn.timestamp
+        session.expires_at = turn.timestamp + timedelta(hours=settings.SESSION_TTL_HOURS)
+        if turn.role == "user":
+            session.query_count += 1
+            session.last_query_at = turn.timestamp
+        await self.cache.set(session)
+
+    async def set_ephemeral_state_if_absent(self, session_id: str, key: str, value: Any) -> Any:
+        """
+        Sets an ephemeral_state key unless some request already has, and returns the value
+        that won. The cached copy is updated to match.
+        """
+        stored = await self.mongo_service.set_session_state_if_absent(session_id, key, value)
+        if stored is None:
+            stored = value # The session is gone; nothing else can be using the key.
+        if self.cache is not None:
+            session = await self.cache.get(session_id)
+            if session is not None and session.ephemeral_state.get(key) != stored:
+                session.ephemeral_state[key] = stored
+                await self.cache.set(session)
+        return stored
+
+    async def record_run_usage(self, session_id: str, app_id: str, tokens: int) -> None:
+        """Counts an agent run's tokens; with a cache, the counters are updated on the next flush."""
+        if self.cache is None:
+            await self.mongo_service.record_run_usage(session_id, app_id, tokens)
+            return
+        self._defer(session_id, total_tokens=tokens)
+        self._defer_rollup(app_id, datetime.utcnow(), tokens=tokens)
 
     async def get_conversation_history(self, session_id: str, window_size: int) -> List[ConversationTurn]:
         """Gets the last N turns of a conversation for the context window."""
         logger.debug(f"Getting conversation history for session: {session_id}, window: {window_size}")
-        session = await self.get_session(session_id)
-        if not session:
+        if self.cache is not None and window_size <= self.cached_turns:
+            session = await self.get_session(session_id, window_size)
+            return session.conversation if session is not None else []
+        # Only the last N turns are read from MongoDB; older turns are never transferred or parsed.
+        history = await self.mongo_service.get_conversation_window(session_id, window_size)
+        if history is None:
+            logger.warning(f"Session not found: {session_id}")
             return []
-        
-        # Return the last N turns from the conversation array
-        return session.conversation[-window_size:]
+        return history
+
+    def _defer(self, session_id: str, expires_at: Optional[datetime] = None, total_tokens: int = 0) -> None:
+        pending = self._pending.setdefault(session_id, {"expires_at": None, "total_tokens": 0})
+        if expires_at is not None and (pending["expires_at"] is None or expires_at > pending["expires_at"]):
+            pending["expires_at"] = expires_at
+        pending["total_tokens"] += total_tokens
+
+    def _defer_rollup(self, app_id: str, at: datetime, **increments: int) -> None:
+        counters = self._pending_rollups.setdefault((app_id, rollup_hour(at)), {})
+        for name, amount in increments.items():
+            counters[name] = counters.get(name, 0) + amount
+
+    async def flush(self) -> None:
+        """Writes all pending TTL bumps, token counts and rollup counters. On failure they are kept for the next flush."""
+        await self._flush_rollups()
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        try:
+            await self.mongo_service.flush_session_updates(pending)
+        except Exception as e:
+            logger.error(f"Failed to flush {len(pending)} deferred session update(s): {e}")
+            for session_id, update in pending.items():
+                self._defer(session_id, update["expires_at"], update["total_tokens"])
+            return
+        SESSION_HEADER_UPDATES.inc(sum(1 for u in pending.values() if u["expires_at"] is not None), kind="ttl_written")
+
+    async def _flush_rollups(self) -> None:
+        if not self._pending_rollups:
+            return
+        pending, self._pending_rollups = self._pending_rollups, {}
+        try:
+            await self.mongo_service.bump_rollups(pending)
+        except Exception as e:
+            logger.error(f"Failed to flush {len(pending)} deferred rollup update(s): {e}")
+            for (app_id, hour), counters in pending.items():
+                self._defer_rollup(app_id, hour, **counters)
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval_seconds)
+            await self.flush()
+
+    async def start(self) -> None:
+        """Starts the deferred-update flusher. Safe to call more than once."""
+        if self.cache is not None and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self) -> None:
+        """Stops the flusher and writes whatever is still pending."""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
 
-# Singleton instance
-session_manager = SessionManager()
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.cache is not None,
+            "backend": type(self.cache).__name__ if self.cache is not None else None,
+            **(self.cache.stats() if self.cache is not None else {}),
+            "cached_turns": self.cached_turns,
+            "pending_session_updates": len(self._pending),
+            "pending_rollup_updates": len(self._pending_rollups),
+        }
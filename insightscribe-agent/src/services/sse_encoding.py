@@ -0,0 +1,27 @@
+import json
+from typing import Any, Dict
+
+try:
+    import orjson
+except ImportError: # Optional: the stdlib encoder produces the same frames, more slowly
+    orjson = None
+
+# Matches EventSourceResponse's default line separator.
+SSE_SEP = b"\r\n"
+
+HEARTBEAT_FRAME = b": heartbeat" + SSE_SEP + SSE_SEP
+
+
+def _dumps(event: Dict[str, Any]) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(event, default=str)
+    return json.dumps(event, separators=(",", ":"), ensure_ascii=False, default=str).encode("utf-8")
+
+
+def encode_event(event: Dict[str, Any]) -> bytes:
+    """
+    Encodes an agent event as a complete SSE frame carrying its JSON as data.
+    Compact JSON has no raw line breaks, so the frame is a single data line and the
+    bytes can go to EventSourceResponse as-is, skipping ServerSentEvent's line splitting.
+    """
+    return b"data: " + _dumps(event) + SSE_SEP + SSE_SEP
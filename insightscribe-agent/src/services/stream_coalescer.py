@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+
+from pydantic import BaseModel
+
+from ..config import settings
+from ..models.db_models import AppRepo
+
+logger = logging.getLogger(__name__)
+
+# Yielded by coalesce_events when the source has been quiet for heartbeat_seconds.
+# The transport turns it into an SSE comment so proxies keep the connection open.
+HEARTBEAT = {"event": "heartbeat"}
+
+_END = object()
+
+
+class StreamFlushPolicy(BaseModel):
+    """
+    When buffered message_chunk text is flushed as one SSE frame. Whichever
+    limit is reached first triggers the flush. Configurable per AppRepo under
+    config["streaming"]; unset keys fall back to Settings.
+    """
+    max_bytes: int = settings.STREAM_FLUSH_MAX_BYTES
+    max_chunks: int = settings.STREAM_FLUSH_MAX_CHUNKS
+    max_delay_ms: float = settings.STREAM_FLUSH_MAX_DELAY_MS
+    heartbeat_seconds: Optional[float] = settings.STREAM_HEARTBEAT_SECONDS # None disables heartbeats
+
+    @classmethod
+    def for_app(cls, app_config: AppRepo) -> "StreamFlushPolicy":
+        return cls(**app_config.config.get("streaming", {}))
+
+
+async def coalesce_events(source: AsyncIterator[Dict[str, Any]], policy: StreamFlushPolicy) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Merges consecutive message_chunk events from an orchestrator stream into larger
+    frames. The first chunk is always sent immediately so time-to-first-byte is
+    unchanged; every other event flushes pending text first, so ordering is kept.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=256)
+
+    async def pump():
+        try:
+            async for event in source:
+                await queue.put(event)
+            await queue.put(_END)
+        except asyncio.CancelledError:
+            # The consumer went away. If the source was parked at a yield rather than
+            # awaiting, close it now so its cleanup runs instead of waiting for GC.
+            await source.aclose()
+            raise
+        except Exception as e:
+            await queue.put(e)
+
+    pump_task = asyncio.create_task(pump())
+    buffer: list = []
+    buffer_bytes = 0
+    flush_deadline = 0.0
+    first_chunk_sent = False
+    chunks_in = frames_out = 0
+    max_delay = policy.max_delay_ms / 1000
+
+    def take_buffer() -> Dict[str, Any]:
+        nonlocal buffer, buffer_bytes
+        frame = {"event": "message_chunk", "data": "".join(buffer)}
+        buffer = []
+        buffer_bytes = 0
+        return frame
+
+    try:
+        while True:
+            if buffer:
+                timeout = max(flush_deadline - time.monotonic(), 0)
+            else:
+                timeout = policy.heartbeat_seconds
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                if buffer:
+                    frames_out += 1
+                    yield take_buffer()
+                else:
+                    yield HEARTBEAT
+                continue
+
+            if item is _END:
+                break
+            if isinstance(item, Exception):
+                raise item
+
+            if item.get("event") == "message_chunk":
+                chunks_in += 1
+                if not first_chunk_sent:
+                    first_chunk_sent = True
+                    frames_out += 1
+                    yield item
+                    continue
+                if not buffer:
+                    flush_deadline = time.monotonic() + max_delay
+                buffer.append(item["data"])
+                buffer_bytes += len(item["data"].encode("utf-8"))
+                if buffer_bytes >= policy.max_bytes or len(buffer) >= policy.max_chunks:
+                    frames_out += 1
+                    yield take_buffer()
+                continue
+
+            if buffer:
+                frames_out += 1
+                yield take_buffer()
+            yield item
+
+        if buffer:
+            frames_out += 1
+            yield take_buffer()
+        logger.debug(f"Coalesced {chunks_in} message chunks into {frames_out} frames.")
+    finally:
+        pump_task.cancel()
+        try:
+            await pump_task
+        except asyncio.CancelledError:
+            pass
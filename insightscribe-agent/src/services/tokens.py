@@ -0,0 +1,40 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for English text (~4 characters per token), used where no tokenizer output is available."""
+    if not text:
+        return 0
+    return max(1, (len(text) + 3) // 4)
+
+
+class Tokenizer:
+    """
+    Counts and truncates text by tokens. With a tiktoken encoding name (tiktoken is optional)
+    counts are exact; otherwise they fall back to estimate_tokens.
+    """
+
+    def __init__(self, encoding: str = ""):
+        self.encoding = None
+        if encoding:
+            try:
+                import tiktoken
+                self.encoding = tiktoken.get_encoding(encoding)
+            except Exception as e:
+                logger.warning(f"Tokenizer '{encoding}' unavailable, estimating token counts instead: {e}")
+
+    def count(self, text: str) -> int:
+        if self.encoding is None:
+            return estimate_tokens(text)
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text: str, max_tokens: int, marker: str = " …") -> str:
+        """Returns text cut to at most max_tokens tokens, marker included."""
+        if self.count(text) <= max_tokens:
+            return text
+        keep = max(0, max_tokens - self.count(marker))
+        if self.encoding is None:
+            return text[:keep * 4].rstrip() + marker
+        return self.encoding.decode(self.encoding.encode(text, disallowed_special=())[:keep]).rstrip() + marker
@@ -0,0 +1,132 @@
+import asyncio
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from ..tools.base import BaseTool
+from .metrics import AGENT_CANCELLED_WORK, TOOL_CALL_SECONDS
+from .tool_loader import ToolLoader
+from .tool_result_cache import ToolResultCache
+
+logger = logging.getLogger(__name__)
+
+
+class ToolExecutor:
+    """
+    Runs synchronous tool calls concurrently on a bounded thread pool.
+
+    Instances come from the ToolLoader registry. Each tool class gets a process-wide concurrency cap (BaseTool.max_concurrency,
+    defaulting to TOOL_MAX_CONCURRENCY) shared by all runs, so a burst of chats
+    cannot flood the BI backend. A slot is held until the worker thread actually
+    finishes, even when the caller has already timed out or been cancelled, because
+    a running thread cannot be interrupted; the same holds for leased pooled instances.
+    Tools that declare cache_ttl_seconds are served through result_cache when one is set.
+    """
+
+    def __init__(self, tool_loader: ToolLoader, max_workers: int, default_timeout_seconds: float, default_max_concurrency: int,
+                 result_cache: Optional[ToolResultCache] = None):
+        self.tool_loader = tool_loader
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool")
+        self._default_timeout_seconds = default_timeout_seconds
+        self._default_max_concurrency = default_max_concurrency
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.result_cache = result_cache
+
+    def _semaphore_for(self, tool_name: str, tool_cls: type[BaseTool]) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(tool_name)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(tool_cls.max_concurrency or self._default_max_concurrency)
+            self._semaphores[tool_name] = semaphore
+        return semaphore
+
+    async def _execute(self, tool_name: str, tool_cls: type[BaseTool], params: Dict[str, Any]) -> Any:
+        semaphore = self._semaphore_for(tool_name, tool_cls)
+        await semaphore.acquire()
+        loop = asyncio.get_running_loop()
+        try:
+            tool = await self.tool_loader.acquire(tool_name)
+        except BaseException:
+            semaphore.release()
+            raise
+        try:
+            future = self._pool.submit(tool.execute, **params)
+        except BaseException:
+            self.tool_loader.release(tool_name, tool)
+            semaphore.release()
+            raise
+
+        def release_on_loop():
+            self.tool_loader.release(tool_name, tool)
+            semaphore.release()
+
+        def release(_):
+            try:
+                loop.call_soon_threadsafe(release_on_loop)
+            except RuntimeError: # Event loop already closed during shutdown
+                pass
+
+        future.add_done_callback(release)
+        return await asyncio.wrap_future(future)
+
+    async def execute(self, tool_name: str, tool_cls: type[BaseTool], params: Dict[str, Any]) -> Any:
+        """Executes one tool call, raising asyncio.TimeoutError if it exceeds the tool's timeout."""
+        timeout = tool_cls.timeout_seconds or self._default_timeout_seconds
+        return await asyncio.wait_for(self._execute(tool_name, tool_cls, params), timeout)
+
+    async def run_tool_calls(self, allowed_tools: List[str], tool_calls: List[Dict[str, Any]], app_id: str) -> List[Dict[str, Any]]:
+        """
+        Dispatches all tool calls of one run concurrently and returns one outcome per
+        call, in call order. Outcomes carry the output to submit back to the run plus
+        status, timing and whether the result came from cache.
+        """
+        return list(await asyncio.gather(*(self._run_tool_call(allowed_tools, tool_call, app_id) for tool_call in tool_calls)))
+
+    async def _run_tool_call(self, allowed_tools: List[str], tool_call: Dict[str, Any], app_id: str) -> Dict[str, Any]:
+        tool_name = tool_call["function"]["name"]
+        outcome = {"tool_call_id": tool_call["id"], "tool_name": tool_name, "params": {}, "status": "ok", "cached": False, "duration_ms": 0.0}
+        # The name comes from the model; only registered tools get their own metric series.
+        metric_tool = "unknown"
+        start = time.perf_counter()
+        try:
+            tool_cls = self.tool_loader.get_tool_class(tool_name)
+            if tool_cls is not None:
+                metric_tool = tool_name
+            outcome["params"] = json.loads(tool_call["function"]["arguments"])
+            if tool_name not in allowed_tools or tool_cls is None:
+                logger.warning(f"Tool '{tool_name}' not found in allowed tools.")
+                outcome["status"] = "not_found"
+                outcome["output"] = f"Error: Tool '{tool_name}' not found."
+                return outcome
+            if tool_cls.cache_ttl_seconds and self.result_cache is not None:
+                result, outcome["cached"] = await self.result_cache.get_or_execute(
+                    tool_name, outcome["params"], app_id, tool_cls.cache_ttl_seconds,
+                    lambda: self.execute(tool_name, tool_cls, outcome["params"])
+                )
+            else:
+                result = await self.execute(tool_name, tool_cls, outcome["params"])
+            outcome["output"] = json.dumps(result) # Assuming result is dict/json serializable
+            logger.info(f"Tool '{tool_name}' executed successfully with result: {result}")
+        except asyncio.CancelledError:
+            # The run was abandoned (client disconnected); calls still queued for the pool never start.
+            outcome["status"] = "cancelled"
+            AGENT_CANCELLED_WORK.inc(kind="tool_call")
+            raise
+        except asyncio.TimeoutError:
+            outcome["status"] = "timeout"
+            outcome["output"] = f"Error: Tool '{tool_name}' timed out."
+            logger.error(f"Tool '{tool_name}' timed out.")
+        except Exception as e:
+            outcome["status"] = "error"
+            outcome["output"] = f"Error: {str(e)}"
+            logger.error(f"Error executing tool '{tool_name}': {e}", exc_info=True)
+        finally:
+            elapsed = time.perf_counter() - start
+            outcome["duration_ms"] = round(elapsed * 1000, 2)
+            TOOL_CALL_SECONDS.observe(elapsed, tool=metric_tool, status=outcome["status"], cached=str(outcome["cached"]).lower())
+        return outcome
+
+    def shutdown(self):
+        """Stops accepting work and drops queued calls; running calls finish in the background."""
+        self._pool.shutdown(wait=False, cancel_futures=True)
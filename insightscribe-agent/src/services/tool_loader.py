@@ -1,53 +1,252 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
+import asyncio
 import importlib
+import json
 import os
 import inspect
 import logging
+import tempfile
+import time
 
-from ..tools.base import BaseTool
+from ..config import settings
+from ..tools.base import BaseTool, LIFECYCLE_SINGLETON, LIFECYCLE_POOLED
 
 logger = logging.getLogger(__name__)
 
+class ToolPool:
+    """Bounded pool of instances of a stateful tool. Instances are created on demand up to `size`."""
+
+    def __init__(self, tool_cls: type[BaseTool], size: int):
+        self.tool_cls = tool_cls
+        self.size = size
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._created = 0
+        self._closed = False
+        self.acquisitions = 0
+        self.waits = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+
+    async def acquire(self) -> BaseTool:
+        self.acquisitions += 1
+        if not self._idle.empty():
+            return self._idle.get_nowait()
+        if self._created < self.size:
+            # Reserve the slot before awaiting so concurrent callers cannot overshoot the size.
+            self._created += 1
+            try:
+                return await _create_instance(self.tool_cls)
+            except BaseException:
+                self._created -= 1
+                raise
+        start = time.perf_counter()
+        instance = await self._idle.get()
+        wait_ms = (time.perf_counter() - start) * 1000
+        self.waits += 1
+        self.total_wait_ms += wait_ms
+        self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+        return instance
+
+    def release(self, instance: BaseTool) -> None:
+        if self._closed:
+            self._created -= 1
+            _shutdown_instance(instance)
+            return
+        self._idle.put_nowait(instance)
+
+    async def close(self) -> None:
+        self._closed = True
+        while not self._idle.empty():
+            self._created -= 1
+            await asyncio.to_thread(_shutdown_instance, self._idle.get_nowait())
+
+    def stats(self) -> Dict[str, Any]:
+        idle = self._idle.qsize()
+        return {
+            "lifecycle": LIFECYCLE_POOLED,
+            "size": self.size,
+            "created": self._created,
+            "idle": idle,
+            "in_use": self._created - idle,
+            "acquisitions": self.acquisitions,
+            "waits": self.waits,
+            "avg_wait_ms": round(self.total_wait_ms / self.waits, 2) if self.waits else 0.0,
+            "max_wait_ms": round(self.max_wait_ms, 2),
+        }
+
+
+async def _create_instance(tool_cls: type[BaseTool]) -> BaseTool:
+    # Constructors and startup hooks may open connections, so keep them off the event loop.
+    def build():
+        instance = tool_cls()
+        instance.startup()
+        return instance
+    return await asyncio.to_thread(build)
+
+
+def _shutdown_instance(instance: BaseTool) -> None:
+    try:
+        instance.shutdown()
+    except Exception as e:
+        logger.error(f"Error shutting down tool {type(instance).__name__}: {e}")
+
+
+_TOOLS_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), "..", "tools"))
+
+
 class ToolLoader:
-    """Dynamically loads tools based on configuration."""
+    """
+    Discovers tools and manages their instances for the life of the process.
+    Tools declaring the singleton lifecycle share one instance across all requests;
+    pooled tools are leased from a bounded pool for the duration of a single call.
+
+    Discovery imports every module in src/tools once and records which module defines
+    each tool in a manifest keyed by the modules' sizes and mtimes. While the manifest
+    matches, discovery only reads it, and a tool's module is imported on first use.
+    """
 
-    def __init__(self):
-        self.available_tools: Dict[str, type[BaseTool]] = self._discover_tools()
+    def __init__(self, manifest_path: Optional[str] = None):
+        self.manifest_path = manifest_path or os.path.join(tempfile.gettempdir(), "insightscribe_tool_manifest.json")
+        self.available_tools: Dict[str, type[BaseTool]] = {} # Imported tool classes
+        self._tool_modules: Optional[Dict[str, str]] = None # Tool name -> module, once discovered
+        self.manifest_hit: Optional[bool] = None
+        self._singletons: Dict[str, BaseTool] = {}
+        self._pools: Dict[str, ToolPool] = {}
+        self._singleton_lock = asyncio.Lock()
 
-    def _discover_tools(self) -> Dict[str, type[BaseTool]]:
+    def discover(self) -> Dict[str, str]:
+        """Returns tool name -> defining module, from the manifest when it is still valid."""
+        if self._tool_modules is None:
+            fingerprint = self._fingerprint()
+            tool_modules = self._read_manifest(fingerprint)
+            self.manifest_hit = tool_modules is not None
+            if tool_modules is None:
+                tool_modules = self._scan()
+                self._write_manifest(fingerprint, tool_modules)
+            self._tool_modules = tool_modules
+        return self._tool_modules
+
+    @staticmethod
+    def _fingerprint() -> Dict[str, List[int]]:
+        fingerprint = {}
+        for filename in sorted(os.listdir(_TOOLS_DIR)):
+            if filename.endswith(".py") and not filename.startswith("__"):
+                stat = os.stat(os.path.join(_TOOLS_DIR, filename))
+                fingerprint[filename] = [stat.st_size, stat.st_mtime_ns]
+        return fingerprint
+
+    def _read_manifest(self, fingerprint: Dict[str, List[int]]) -> Optional[Dict[str, str]]:
+        try:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest.get("fingerprint") != fingerprint:
+            logger.info("Tool manifest is stale; rescanning src/tools.")
+            return None
+        return manifest["tools"]
+
+    def _write_manifest(self, fingerprint: Dict[str, List[int]], tool_modules: Dict[str, str]) -> None:
+        try:
+            with open(self.manifest_path, "w", encoding="utf-8") as f:
+                json.dump({"fingerprint": fingerprint, "tools": tool_modules}, f)
+        except OSError as e:
+            logger.warning(f"Could not write tool manifest to {self.manifest_path}: {e}")
+
+    def _scan(self) -> Dict[str, str]:
         """
         Discovers all classes inheriting from BaseTool in the tools directory.
         """
-        tools_dir = os.path.join(os.path.dirname(__file__), "..", "tools")
         discovered = {}
-        for filename in os.listdir(tools_dir):
+        for filename in os.listdir(_TOOLS_DIR):
             if filename.endswith(".py") and not filename.startswith("__"):
                 module_name = f"src.tools.{filename[:-3]}"
                 try:
                     module = importlib.import_module(module_name)
                     for name, obj in inspect.getmembers(module):
                         if inspect.isclass(obj) and issubclass(obj, BaseTool) and obj is not BaseTool:
-                            discovered[name] = obj
+                            discovered[name] = module_name
+                            self.available_tools[name] = obj
                             logger.info(f"Discovered tool: {name} from {module_name}")
                 except Exception as e:
                     logger.error(f"Error loading tools from {module_name}: {e}")
         return discovered
 
-    def load_tools(self, allowed_tool_names: List[str]) -> Dict[str, BaseTool]:
+    def get_tool_class(self, tool_name: str) -> Optional[type[BaseTool]]:
+        tool_cls = self.available_tools.get(tool_name)
+        if tool_cls is not None:
+            return tool_cls
+        module_name = self.discover().get(tool_name)
+        if module_name is None:
+            return None
+        try:
+            tool_cls = getattr(importlib.import_module(module_name), tool_name)
+        except Exception as e:
+            logger.error(f"Error loading tool {tool_name} from {module_name}: {e}")
+            return None
+        self.available_tools[tool_name] = tool_cls
+        return tool_cls
+
+    async def startup(self) -> None:
+        """Creates singleton tools and their pools up front so the first chat does not pay for it."""
+        for tool_name in self.discover():
+            tool_cls = self.get_tool_class(tool_name)
+            if tool_cls is None:
+                continue
+            try:
+                if tool_cls.lifecycle == LIFECYCLE_SINGLETON:
+                    await self._get_singleton(tool_name)
+                else:
+                    self._get_pool(tool_name)
+            except Exception as e:
+                logger.error(f"Error starting tool {tool_name}: {e}")
+        logger.info(f"Tool registry started: {len(self._singletons)} singleton(s), {len(self._pools)} pool(s).")
+
+    async def shutdown(self) -> None:
+        """Runs every created instance's shutdown hook. Leased pooled instances shut down on release."""
+        for instance in self._singletons.values():
+            await asyncio.to_thread(_shutdown_instance, instance)
+        self._singletons.clear()
+        # Closed pools stay registered so instances still leased out are shut down when released.
+        for pool in self._pools.values():
+            await pool.close()
+
+    async def _get_singleton(self, tool_name: str) -> BaseTool:
+        instance = self._singletons.get(tool_name)
+        if instance is None:
+            async with self._singleton_lock:
+                instance = self._singletons.get(tool_name)
+                if instance is None:
+                    instance = await _create_instance(self.get_tool_class(tool_name))
+                    self._singletons[tool_name] = instance
+                    logger.info(f"Loaded singleton tool: {tool_name}")
+        return instance
+
+    def _get_pool(self, tool_name: str) -> ToolPool:
+        pool = self._pools.get(tool_name)
+        if pool is None:
+            tool_cls = self.get_tool_class(tool_name)
+            pool = ToolPool(tool_cls, tool_cls.pool_size or settings.TOOL_POOL_SIZE)
+            self._pools[tool_name] = pool
+        return pool
+
+    async def acquire(self, tool_name: str) -> BaseTool:
         """
-        Instantiates and returns tools specified in allowed_tool_names.
+        Returns an instance for one call. Every acquire must be paired with release(),
+        which returns pooled instances to their pool and is a no-op for singletons.
         """
-        loaded_tools = {}
-        for tool_name in allowed_tool_names:
-            if tool_name in self.available_tools:
-                try:
-                    loaded_tools[tool_name] = self.available_tools[tool_name]()
-                    logger.info(f"Loaded tool: {tool_name}")
-                except Exception as e:
-                    logger.error(f"Error instantiating tool {tool_name}: {e}")
-            else:
-                logger.warning(f"Requested tool '{tool_name}' not found in available tools.")
-        return loaded_tools
+        if self.get_tool_class(tool_name).lifecycle == LIFECYCLE_SINGLETON:
+            return await self._get_singleton(tool_name)
+        return await self._get_pool(tool_name).acquire()
+
+    def release(self, tool_name: str, instance: BaseTool) -> None:
+        pool = self._pools.get(tool_name)
+        if pool is not None:
+            pool.release(instance)
+        elif instance not in self._singletons.values():
+            _shutdown_instance(instance)
 
-# Singleton instance
-tool_loader = ToolLoader()
+    def stats(self) -> Dict[str, Any]:
+        stats = {name: {"lifecycle": LIFECYCLE_SINGLETON, "instances": 1} for name in self._singletons}
+        stats.update({name: pool.stats() for name, pool in self._pools.items()})
+        return stats
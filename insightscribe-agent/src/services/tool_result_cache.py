@@ -0,0 +1,121 @@
+import hashlib
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from bson.errors import InvalidDocument
+from pymongo.errors import PyMongoError
+
+from .cache import LRUTTLCache, SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Driver failures, plus results BSON cannot encode (sets, numpy scalars, ints over 64 bits, ...)
+_SHARED_TIER_ERRORS = (PyMongoError, InvalidDocument, TypeError, OverflowError)
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def tool_cache_key(tool_name: str, params: Dict[str, Any], app_id: str) -> str:
+    """Stable key for a tool call: argument order and surrounding whitespace do not matter."""
+    canonical = json.dumps(_normalize(params), sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(f"{app_id}\x1f{tool_name}\x1f{canonical}".encode("utf-8")).hexdigest()
+
+
+class ToolResultCache:
+    """
+    Two-tier cache for results of tools that declare cache_ttl_seconds.
+
+    The first tier is an in-process LRU. The optional second tier is a MongoDB
+    collection (TTL-indexed on expires_at) shared by all workers; a hit there
+    is copied into the local tier for the rest of its lifetime. Identical calls
+    in flight at the same time share one execution. Failures of the shared tier
+    are logged and treated as misses so caching never breaks a tool call.
+    """
+
+    def __init__(self, max_size: int, collection=None):
+        self._local = LRUTTLCache(max_size=max_size, ttl_seconds=0)
+        self._collection = collection
+        self._single_flight = SingleFlight()
+        self.shared_hits = 0
+        self.shared_errors = 0
+
+    async def get_or_execute(
+        self,
+        tool_name: str,
+        params: Dict[str, Any],
+        app_id: str,
+        ttl_seconds: float,
+        execute: Callable[[], Awaitable[Any]],
+    ) -> Tuple[Any, bool]:
+        """Returns (result, served_from_cache). Exceptions from execute are not cached."""
+        key = tool_cache_key(tool_name, params, app_id)
+        entry = self._local.get(key)
+        if entry is None:
+            entry = await self._get_shared(key)
+        if entry is not None:
+            return entry["result"], True
+
+        async def load():
+            result = await execute()
+            await self._set(key, result, ttl_seconds, tool_name, app_id)
+            return result
+
+        return await self._single_flight.do(key, load), False
+
+    async def _get_shared(self, key: str) -> Optional[Dict[str, Any]]:
+        if self._collection is None:
+            return None
+        now = datetime.utcnow()
+        try:
+            doc = await self._collection.find_one({"_id": key, "expires_at": {"$gt": now}}, {"result": 1, "expires_at": 1})
+        except _SHARED_TIER_ERRORS as e:
+            self.shared_errors += 1
+            logger.warning(f"Shared tool cache read failed: {e}")
+            return None
+        if doc is None:
+            return None
+        self.shared_hits += 1
+        entry = {"result": doc["result"]}
+        self._local.set(key, entry, ttl_seconds=(doc["expires_at"] - now).total_seconds())
+        return entry
+
+    async def _set(self, key: str, result: Any, ttl_seconds: float, tool_name: str, app_id: str) -> None:
+        self._local.set(key, {"result": result}, ttl_seconds=ttl_seconds)
+        if self._collection is None:
+            return
+        try:
+            await self._collection.update_one(
+                {"_id": key},
+                {"$set": {
+                    "result": result,
+                    "tool_name": tool_name,
+                    "app_id": app_id,
+                    "expires_at": datetime.utcnow() + timedelta(seconds=ttl_seconds)
+                }},
+                upsert=True
+            )
+        except _SHARED_TIER_ERRORS as e:
+            # The result is still cached locally and returned to the caller.
+            self.shared_errors += 1
+            logger.warning(f"Shared tool cache write failed for {tool_name}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        local = self._local.stats()
+        local.pop("ttl_seconds")
+        return {
+            **local,
+            "shared_tier": self._collection is not None,
+            "shared_hits": self.shared_hits,
+            "shared_errors": self.shared_errors,
+            "coalesced_calls": self._single_flight.coalesced,
+        }
@@ -1,6 +1,30 @@
 from abc import ABC, abstractmethod
+from typing import Optional
+
+# Values for BaseTool.lifecycle
+LIFECYCLE_SINGLETON = "singleton" # One shared instance per process; execute() must be thread-safe
+LIFECYCLE_POOLED = "pooled" # Instances are leased to one call at a time from a bounded pool
 
 class BaseTool(ABC):
+    lifecycle: str = LIFECYCLE_POOLED
+    # Max instances for pooled tools; None uses TOOL_POOL_SIZE
+    pool_size: Optional[int] = None
+    # Per-call timeout in seconds; None uses TOOL_CALL_TIMEOUT_SECONDS
+    timeout_seconds: Optional[float] = None
+    # Max calls of this tool running at once across the process; None uses TOOL_MAX_CONCURRENCY
+    max_concurrency: Optional[int] = None
+    # Opt-in result caching: results are reused for this many seconds for identical
+    # arguments within the same app_id. None disables caching for the tool.
+    cache_ttl_seconds: Optional[float] = None
+
+    def startup(self):
+        """Called once after construction, e.g. to open HTTP clients or fetch auth tokens."""
+        pass
+
+    def shutdown(self):
+        """Called once when the instance is discarded, e.g. to close connections."""
+        pass
+
     @abstractmethod
     def execute(self, *args, **kwargs):
         pass
@@ -1,6 +1,9 @@
-from src.tools.base import BaseTool
+from src.tools.base import BaseTool, LIFECYCLE_SINGLETON
 
 class GetCubeMetadataTool(BaseTool):
+    lifecycle = LIFECYCLE_SINGLETON
+    cache_ttl_seconds = 3600 # Cube definitions change rarely
+
     def execute(self, cube_name: str):
         # In a real implementation, this would connect to a BI backend
         # and retrieve metadata for the specified cube.
@@ -8,6 +11,9 @@ class GetCubeMetadataTool(BaseTool):
         return {"dimensions": ["Time", "Geography"], "measures": ["Sales", "Cost"]}
 
 class ExecuteBIQueryTool(BaseTool):
+    lifecycle = LIFECYCLE_SINGLETON
+    cache_ttl_seconds = 300
+
     def execute(self, query: str):
         # In a real implementation, this would execute the query against
         # the BI backend.
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Lets `pytest` run from anywhere; the code imports itself as the `src` package.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
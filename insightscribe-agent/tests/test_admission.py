@@ -0,0 +1,185 @@
+import asyncio
+
+import pytest
+
+from src.models.db_models import AppRepo
+from src.services.admission import AdmissionController, AdmissionRejected
+
+
+def app_config(**admission) -> AppRepo:
+    limits = {"user_requests_per_minute": 0, "app_requests_per_second": 0, "max_streams_per_user": 0,
+              "max_streams_per_app": 0, "max_queue_wait_seconds": 1}
+    limits.update(admission)
+    return AppRepo(app_id="app", name="n", description="d", assistant_id="asst", config={"admission": limits})
+
+
+def controller(max_streams: int = 0, queue_size: int = 10) -> AdmissionController:
+    return AdmissionController(max_streams=max_streams, queue_size=queue_size, ttfc_slo_seconds=0,
+                               shed_factor=0.8, retry_after_seconds=2)
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_admits_until_cap_then_queues_in_arrival_order():
+    async def scenario():
+        admission = controller(max_streams=1)
+        config = app_config()
+        first = await admission.acquire("u1", config)
+        order = []
+
+        async def request(user_id):
+            ticket = await admission.acquire(user_id, config)
+            order.append(user_id)
+            return ticket
+
+        waiting = [asyncio.create_task(request(f"u{i}")) for i in range(2, 5)]
+        await settle()
+        assert admission.stats()["waiting"] == 3
+        first.release()
+        for task in waiting:
+            (await task).release()
+        return order, admission.stats()
+
+    order, stats = asyncio.run(scenario())
+    assert order == ["u2", "u3", "u4"]
+    assert stats["active_streams"] == 0 and stats["waiting"] == 0
+
+
+def test_new_request_does_not_take_a_slot_from_older_waiters():
+    async def scenario():
+        admission = controller(max_streams=1)
+        config = app_config()
+        first = await admission.acquire("u1", config)
+        older = asyncio.create_task(admission.acquire("u2", config))
+        await settle()
+        first.release() # Wakes u2; a request arriving before u2 runs must queue behind it
+        newer = asyncio.create_task(admission.acquire("u3", config))
+        await settle()
+        assert older.done() and not newer.done()
+        (await older).release()
+        (await newer).release()
+
+    asyncio.run(scenario())
+
+
+def test_each_cap_keeps_its_own_line():
+    async def scenario():
+        # u1 may have one stream; the worker two.
+        admission = controller(max_streams=2)
+        config = app_config(max_streams_per_user=1)
+        u1 = await admission.acquire("u1", config)
+        other = await admission.acquire("u2", config)
+        # Both wait for u1's slot; the worker slot u1 frees is taken by a u3 request queued on the worker cap.
+        second_u1 = asyncio.create_task(admission.acquire("u1", config))
+        await settle()
+        u3 = asyncio.create_task(admission.acquire("u3", config))
+        await settle()
+        u1.release()
+        await settle()
+        # u3 arrived after second_u1 but waits on a different cap, so it starts once second_u1 has.
+        assert second_u1.done()
+        assert not u3.done()
+        other.release()
+        (await u3).release()
+        (await second_u1).release()
+        return admission.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["active_streams"] == 0 and stats["waiting"] == 0
+
+
+def test_waiters_on_different_user_caps_are_each_woken():
+    async def scenario():
+        admission = controller(max_streams=2)
+        config = app_config(max_streams_per_app=0, max_streams_per_user=1, max_queue_wait_seconds=0.5)
+        held_u1 = await admission.acquire("u1", config)
+        held_u2 = await admission.acquire("u2", config)
+        # u1 and u2 each queue for their own user cap.
+        next_u1 = asyncio.create_task(admission.acquire("u1", config))
+        next_u2 = asyncio.create_task(admission.acquire("u2", config))
+        await settle()
+        # Freeing u1's slot frees a worker slot too: next_u1 gets it.
+        held_u1.release()
+        ticket_u1 = await next_u1
+        # u2's slot frees, and so does a worker slot: next_u2 must not miss its wake-up.
+        held_u2.release()
+        ticket_u2 = await asyncio.wait_for(next_u2, 0.2)
+        ticket_u1.release()
+        ticket_u2.release()
+
+    asyncio.run(scenario())
+
+
+def test_queue_wait_times_out_with_429_for_a_tenant_cap_and_503_for_the_worker():
+    async def scenario():
+        admission = controller(max_streams=1)
+        held = await admission.acquire("u1", app_config(max_queue_wait_seconds=0.05))
+        with pytest.raises(AdmissionRejected) as worker_full:
+            await admission.acquire("u2", app_config(max_queue_wait_seconds=0.05))
+        held.release()
+
+        admission = controller()
+        config = app_config(max_streams_per_user=1, max_queue_wait_seconds=0.05)
+        held = await admission.acquire("u1", config)
+        with pytest.raises(AdmissionRejected) as user_full:
+            await admission.acquire("u1", config)
+        held.release()
+        return worker_full.value, user_full.value
+
+    worker_full, user_full = asyncio.run(scenario())
+    assert (worker_full.status_code, worker_full.reason) == (503, "worker_streams")
+    assert (user_full.status_code, user_full.reason) == (429, "user_streams")
+
+
+def test_cancelled_waiter_passes_its_wake_up_on():
+    async def scenario():
+        admission = controller(max_streams=1)
+        config = app_config()
+        held = await admission.acquire("u1", config)
+        first = asyncio.create_task(admission.acquire("u2", config))
+        second = asyncio.create_task(admission.acquire("u3", config))
+        await settle()
+        held.release()
+        first.cancel() # Woken, but the client left before it ran
+        # On Python 3.11 wait_for may still hand the woken request its slot; either way nothing is lost.
+        outcome = (await asyncio.gather(first, return_exceptions=True))[0]
+        if not isinstance(outcome, BaseException):
+            outcome.release()
+        ticket = await asyncio.wait_for(second, 0.2)
+        ticket.release()
+        return admission.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["active_streams"] == 0 and stats["waiting"] == 0
+
+
+def test_rate_limited_request_is_rejected_without_drawing_a_slot():
+    async def scenario():
+        admission = controller()
+        config = app_config(user_requests_per_minute=60, user_burst=1)
+        (await admission.acquire("u1", config)).release()
+        with pytest.raises(AdmissionRejected) as limited:
+            await admission.acquire("u1", config)
+        return limited.value, admission.stats()
+
+    limited, stats = asyncio.run(scenario())
+    assert (limited.status_code, limited.reason) == (429, "user_rate_limited")
+    assert stats["active_streams"] == 0
+
+
+def test_tokens_are_not_drawn_when_the_queue_rejects():
+    async def scenario():
+        admission = controller(max_streams=1, queue_size=0)
+        config = app_config(user_requests_per_minute=60, user_burst=1)
+        held = await admission.acquire("u1", config)
+        with pytest.raises(AdmissionRejected) as full:
+            await admission.acquire("u2", config)
+        held.release()
+        # u2's token is still there.
+        (await admission.acquire("u2", config)).release()
+        return full.value
+
+    assert asyncio.run(scenario()).reason == "queue_full"
@@ -0,0 +1,151 @@
+import asyncio
+import json
+
+from src.services.ltm_writer import (
+    OVERFLOW_DROP_OLDEST, OVERFLOW_SPILL, LTMWriter, LTMWriteRequest
+)
+
+
+class FakeStore:
+    """Stands in for MongoService.add_ltm_entries: entries are keyed by _id and duplicates are skipped."""
+
+    def __init__(self, hang_after_insert: bool = False, hang_before_insert: bool = False, fail: bool = False):
+        self.entries = {}
+        self.calls = 0
+        self.hang_after_insert = hang_after_insert
+        self.hang_before_insert = hang_before_insert
+        self.fail = fail
+        self.release = asyncio.Event()
+
+    async def add_ltm_entries(self, entries):
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError("insert failed")
+        if self.hang_before_insert:
+            await self.release.wait()
+        for entry in entries:
+            self.entries.setdefault(str(entry.id), entry)
+        if self.hang_after_insert:
+            await self.release.wait()
+
+
+def request(n: int) -> LTMWriteRequest:
+    return LTMWriteRequest(user_id="u", app_id="app", session_id=f"s{n}", message=f"m{n}", response_text="r")
+
+
+def writer(store, spill_path=None, **options) -> LTMWriter:
+    settings = {"max_queue_size": 10, "batch_size": 10, "flush_interval_seconds": 0.01, "workers": 1,
+                "overflow_policy": OVERFLOW_SPILL if spill_path else OVERFLOW_DROP_OLDEST,
+                "spill_path": spill_path, "drain_timeout_seconds": 0.05}
+    settings.update(options)
+    return LTMWriter(store, **settings)
+
+
+def spilled_ids(path) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line)["entry_id"] for line in f if line.strip()]
+
+
+def test_batches_are_written_with_the_request_entry_ids():
+    async def scenario():
+        store = FakeStore()
+        ltm = writer(store, batch_size=2)
+        await ltm.start()
+        requests = [request(i) for i in range(5)]
+        for r in requests:
+            assert ltm.submit(r)
+        await ltm.stop()
+        return store, requests, ltm.stats()
+
+    store, requests, stats = asyncio.run(scenario())
+    assert set(store.entries) == {r.entry_id for r in requests}
+    assert store.entries[requests[0].entry_id].content["text"].startswith("User asked 'm0'")
+    assert stats["written"] == 5 and stats["batches"] >= 3
+
+
+def test_drop_oldest_evicts_the_oldest_queued_request():
+    async def scenario():
+        store = FakeStore(hang_before_insert=True)
+        ltm = writer(store, max_queue_size=2, batch_size=1)
+        await ltm.start()
+        requests = [request(i) for i in range(4)]
+        ltm.submit(requests[0])
+        await asyncio.sleep(0.02) # The worker takes it and blocks in the store
+        for r in requests[1:]:
+            assert ltm.submit(r)
+        store.release.set()
+        await ltm.stop()
+        return store, requests, ltm.stats()
+
+    store, requests, stats = asyncio.run(scenario())
+    assert set(store.entries) == {requests[0].entry_id, requests[2].entry_id, requests[3].entry_id}
+    assert stats["dropped"] == 1
+
+
+def test_stop_spills_what_did_not_drain_and_start_replays_it_once(tmp_path):
+    spill_path = str(tmp_path / "ltm.jsonl")
+
+    async def first_run():
+        # The insert reaches the store but never returns, like a write cut off by shutdown.
+        store = FakeStore(hang_after_insert=True)
+        ltm = writer(store, spill_path, batch_size=1)
+        await ltm.start()
+        requests = [request(i) for i in range(3)]
+        for r in requests:
+            ltm.submit(r)
+        await asyncio.sleep(0.02)
+        await ltm.stop()
+        return store, requests
+
+    async def second_run(store):
+        store.hang_after_insert = False
+        ltm = writer(store, spill_path, batch_size=1)
+        await ltm.start()
+        await asyncio.sleep(0.05)
+        await ltm.stop()
+        return ltm.stats()
+
+    store, requests = asyncio.run(first_run())
+    assert sorted(spilled_ids(spill_path)) == sorted(r.entry_id for r in requests)
+    assert len(store.entries) == 1 # The batch cut off mid-insert is spilled as well
+
+    stats = asyncio.run(second_run(store))
+    assert not (tmp_path / "ltm.jsonl").exists()
+    assert set(store.entries) == {r.entry_id for r in requests}
+    assert stats["queued"] == 3 and stats["spilled"] == 0
+
+
+def test_stop_during_replay_spills_every_request_again(tmp_path):
+    spill_path = str(tmp_path / "ltm.jsonl")
+    requests = [request(i) for i in range(5)]
+    with open(spill_path, "w", encoding="utf-8") as f:
+        for r in requests:
+            f.write(r.json() + "\n")
+
+    async def scenario():
+        # One request is held by the blocked worker, one fills the queue, the rest wait in the replay.
+        store = FakeStore(hang_before_insert=True)
+        ltm = writer(store, spill_path, max_queue_size=1, batch_size=1)
+        await ltm.start()
+        await asyncio.sleep(0.02)
+        await ltm.stop()
+        return store
+
+    store = asyncio.run(scenario())
+    assert store.entries == {}
+    assert sorted(spilled_ids(spill_path)) == sorted(r.entry_id for r in requests)
+
+
+def test_failed_batches_are_spilled_or_counted(tmp_path):
+    spill_path = str(tmp_path / "ltm.jsonl")
+
+    async def scenario(path):
+        ltm = writer(FakeStore(fail=True), path)
+        await ltm.start()
+        ltm.submit(request(1))
+        await ltm.stop()
+        return ltm.stats()
+
+    assert asyncio.run(scenario(spill_path))["spilled"] == 1
+    assert len(spilled_ids(spill_path)) == 1
+    assert asyncio.run(scenario(None))["failed"] == 1
@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+from src.services.stream_coalescer import HEARTBEAT, StreamFlushPolicy, coalesce_events
+
+
+def chunk(text: str) -> dict:
+    return {"event": "message_chunk", "data": text}
+
+
+async def events(*items, delays=None):
+    for i, item in enumerate(items):
+        if delays and delays.get(i):
+            await asyncio.sleep(delays[i])
+        yield item
+
+
+def collect(source, **policy) -> list:
+    async def scenario():
+        return [event async for event in coalesce_events(source, StreamFlushPolicy(**policy))]
+    return asyncio.run(scenario())
+
+
+def test_first_chunk_is_sent_alone_and_other_events_flush_pending_text():
+    out = collect(
+        events(chunk("a"), chunk("b"), chunk("c"), {"event": "status", "data": "x"}, chunk("d"), {"event": "done"}),
+        max_bytes=1000, max_chunks=100, max_delay_ms=1000, heartbeat_seconds=None,
+    )
+    assert out == [chunk("a"), chunk("bc"), {"event": "status", "data": "x"}, chunk("d"), {"event": "done"}]
+
+
+def test_frames_are_cut_at_max_chunks_and_max_bytes():
+    out = collect(events(*(chunk(c) for c in "abcde")), max_bytes=1000, max_chunks=2, max_delay_ms=1000, heartbeat_seconds=None)
+    assert out == [chunk("a"), chunk("bc"), chunk("de")]
+    out = collect(events(chunk("a"), chunk("bb"), chunk("cc"), chunk("d")), max_bytes=3, max_chunks=100,
+                  max_delay_ms=1000, heartbeat_seconds=None)
+    assert out == [chunk("a"), chunk("bbcc"), chunk("d")]
+
+
+def test_pending_text_is_flushed_after_max_delay():
+    out = collect(events(chunk("a"), chunk("b"), chunk("c"), delays={2: 0.2}),
+                  max_bytes=1000, max_chunks=100, max_delay_ms=20, heartbeat_seconds=None)
+    assert out == [chunk("a"), chunk("b"), chunk("c")]
+
+
+def test_quiet_source_gets_heartbeats():
+    out = collect(events({"event": "status", "data": "x"}, {"event": "done"}, delays={1: 0.1}),
+                  max_bytes=1000, max_chunks=100, max_delay_ms=20, heartbeat_seconds=0.02)
+    assert out[0] == {"event": "status", "data": "x"} and out[-1] == {"event": "done"}
+    assert HEARTBEAT in out[1:-1]
+
+
+def test_source_errors_are_raised_to_the_consumer():
+    async def failing():
+        yield chunk("a")
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError, match="boom"):
+        collect(failing(), heartbeat_seconds=None)
+
+
+def test_closing_the_stream_closes_the_source():
+    closed = []
+
+    async def source():
+        try:
+            yield chunk("a")
+            await asyncio.sleep(10)
+            yield chunk("never")
+        finally:
+            closed.append(True)
+
+    async def scenario():
+        stream = coalesce_events(source(), StreamFlushPolicy(heartbeat_seconds=None))
+        first = await stream.__anext__()
+        await stream.aclose()
+        return first
+
+    assert asyncio.run(scenario()) == chunk("a")
+    assert closed == [True]
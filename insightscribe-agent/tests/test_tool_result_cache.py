@@ -0,0 +1,64 @@
+import asyncio
+
+from bson import encode
+from pymongo.errors import PyMongoError
+
+from src.services.tool_result_cache import ToolResultCache, tool_cache_key
+
+
+class FakeCollection:
+    """Encodes writes with BSON, as the driver does, so unencodable results fail the same way."""
+
+    def __init__(self, fail_reads: bool = False):
+        self.docs = {}
+        self.fail_reads = fail_reads
+
+    async def find_one(self, query, projection=None):
+        if self.fail_reads:
+            raise PyMongoError("not reachable")
+        return None
+
+    async def update_one(self, query, update, upsert=False):
+        encode(update["$set"])
+        self.docs[query["_id"]] = update["$set"]
+
+
+def test_key_ignores_argument_order_and_whitespace():
+    assert tool_cache_key("T", {"a": " x ", "b": [1, " y"]}, "app") == tool_cache_key("T", {"b": [1, "y"], "a": "x"}, "app")
+    assert tool_cache_key("T", {"a": 1}, "app") != tool_cache_key("T", {"a": 1}, "other")
+
+
+def test_results_bson_cannot_encode_are_still_returned_and_cached_locally():
+    async def scenario():
+        cache = ToolResultCache(max_size=10, collection=FakeCollection())
+        calls = []
+
+        async def execute(result):
+            calls.append(result)
+            return result
+
+        results = []
+        for result in ({1, 2}, 2 ** 70):
+            first = await cache.get_or_execute("T", {"r": str(result)}, "app", 60, lambda: execute(result))
+            again = await cache.get_or_execute("T", {"r": str(result)}, "app", 60, lambda: execute(result))
+            results.append((first, again))
+        return results, calls, cache.stats()
+
+    results, calls, stats = asyncio.run(scenario())
+    assert results == [(({1, 2}, False), ({1, 2}, True)), ((2 ** 70, False), (2 ** 70, True))]
+    assert len(calls) == 2
+    assert stats["shared_errors"] == 2
+
+
+def test_shared_tier_read_failures_are_misses():
+    async def scenario():
+        cache = ToolResultCache(max_size=10, collection=FakeCollection(fail_reads=True))
+
+        async def execute():
+            return {"rows": 1}
+
+        return await cache.get_or_execute("T", {}, "app", 60, execute), cache.stats()
+
+    (result, cached), stats = asyncio.run(scenario())
+    assert result == {"rows": 1} and not cached
+    assert stats["shared_errors"] == 1